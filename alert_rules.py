@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+User-defined alert rules, evaluated incrementally right after each insert
+
+A rule watches one category table and fires for a symbol when the newly
+inserted row matches its conditions and, optionally, the symbol appeared in
+the category on at least `min_occurrences` of the last `window_days` trading
+dates. Occurrences come from a rolling per-symbol bitmask kept in the
+database (bit i = present i trading dates ago), so evaluating a rule never
+rescans history: each insert shifts and sets the bits of the new rows only.
+
+Examples:
+    python alert_rules.py add "Hot mover" --category top_gainers --occurrences 3 --window 5 \\
+        --where "turnover > 10000000"
+    python alert_rules.py add "Watchlist drop" --category top_losers --where "change_percent < -5" \\
+        --symbols NABIL,NICA
+    python alert_rules.py list
+    python alert_rules.py disable 2
+    python alert_rules.py rebuild
+"""
+
+import argparse
+import json
+import logging
+import operator
+import re
+import numpy as np
+import pandas as pd
+from database import NepseDatabase, get_database
+from events import RowsCommitted, BatchCommitted
+from logging_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+RULE_CATEGORIES = NepseDatabase.SYMBOL_TABLES
+
+# Trading dates remembered per symbol (keeps the mask inside SQLite's signed 64-bit INTEGER)
+WINDOW_BITS = 62
+_WINDOW_MASK = np.uint64((1 << WINDOW_BITS) - 1)
+
+OPERATORS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+
+_CONDITION_RE = re.compile(r'^\s*([A-Za-z_]\w*)\s*(>=|<=|==|!=|>|<)\s*(-?[\d.]+(?:e\d+)?)\s*$', re.IGNORECASE)
+
+
+def parse_conditions(text):
+    """
+    Parse "turnover > 1e7 and change_percent < -5" into (column, op, value) triples.
+
+    Raises:
+        ValueError: If a condition can't be parsed
+    """
+    if not text or not text.strip():
+        return []
+
+    conditions = []
+    for part in re.split(r'\s+and\s+|;', text, flags=re.IGNORECASE):
+        match = _CONDITION_RE.match(part)
+        if not match:
+            raise ValueError(f"Can't parse condition: {part.strip()!r} (expected e.g. 'turnover > 1000000')")
+        column, op, value = match.groups()
+        conditions.append((column.lower(), op, float(value)))
+    return conditions
+
+
+def popcount(values):
+    """Number of set bits in each element of a uint64 array"""
+    v = values.astype(np.uint64)
+    v = v - ((v >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    v = (v & np.uint64(0x3333333333333333)) + ((v >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    v = (v + (v >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return ((v * np.uint64(0x0101010101010101)) >> np.uint64(56)).astype(np.int64)
+
+
+def _shift(bits, shift):
+    """Age bitmasks by `shift` trading dates, dropping bits past the window"""
+    shift = np.asarray(shift, dtype=np.int64)
+    shifted = (bits << np.minimum(shift, WINDOW_BITS).astype(np.uint64)) & _WINDOW_MASK
+    return np.where(shift >= WINDOW_BITS, np.uint64(0), shifted)
+
+
+class AlertRule:
+    """One stored rule, compiled for vectorized evaluation"""
+
+    def __init__(self, rule_id, name, category, conditions=None, min_occurrences=None,
+                 window_days=None, symbols=None):
+        self.id = rule_id
+        self.name = name
+        self.category = category
+        self.conditions_text = conditions or ''
+        self.conditions = parse_conditions(conditions)
+        self.min_occurrences = int(min_occurrences) if min_occurrences else None
+        self.window_days = min(int(window_days or min_occurrences or 0), WINDOW_BITS) or None
+        self.symbols = frozenset(s.strip().upper() for s in symbols.split(',') if s.strip()) if symbols else None
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(row['id'], row['name'], row['category'], row['conditions'],
+                   row['min_occurrences'], row['window_days'], row['symbols'])
+
+    def describe(self):
+        parts = [f"in {self.category}"]
+        if self.min_occurrences:
+            parts.append(f"{self.min_occurrences} of last {self.window_days} days")
+        if self.conditions_text:
+            parts.append(self.conditions_text)
+        if self.symbols:
+            parts.append(f"symbols {','.join(sorted(self.symbols))}")
+        return ', '.join(parts)
+
+    def evaluate(self, df, occurrences):
+        """
+        Boolean mask of the rows this rule fires on.
+
+        Args:
+            df: Newly inserted rows of the rule's category
+            occurrences: Callable(window_days) -> per-row occurrence counts
+        """
+        mask = np.ones(len(df), dtype=bool)
+
+        if self.symbols is not None:
+            mask &= df['symbol'].isin(self.symbols).to_numpy()
+
+        for column, op, value in self.conditions:
+            if column not in df.columns:
+                logger.warning(f"Rule #{self.id} ({self.name}): no column '{column}' in {self.category}")
+                return np.zeros(len(df), dtype=bool)
+            values = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=float)
+            mask &= OPERATORS[op](values, value)
+
+        if self.min_occurrences:
+            mask &= occurrences(self.window_days) >= self.min_occurrences
+
+        return mask
+
+
+class RuleEngine:
+    """Maintains the rolling presence state and evaluates rules on each insert"""
+
+    def __init__(self, db=None):
+        self.db = db or get_database()
+
+    def _update_presence(self, category, symbols, date):
+        """
+        Record that `symbols` appeared in `category` on `date`.
+
+        Returns:
+            uint64 array of presence bitmasks aligned to `symbols` (bit 0 =
+            `date`), or None if `date` is older than the latest stored date
+        """
+        seq, last_date, state = self.db.get_presence_state(category, symbols)
+
+        if seq is None or date < last_date:
+            # No state yet, or an older date was inserted (backfill): rebuild
+            # once from history, which already contains the new rows
+            self.rebuild(category)
+            if seq is not None:
+                return None
+            seq, last_date, state = self.db.get_presence_state(category, symbols)
+            return np.array([state.get(s, (0, seq))[0] for s in symbols], dtype=np.uint64)
+
+        if date > last_date:
+            seq += 1
+
+        old_bits = np.array([state.get(s, (0, seq))[0] for s in symbols], dtype=np.uint64)
+        old_seq = np.array([state.get(s, (0, seq))[1] for s in symbols], dtype=np.int64)
+        bits = _shift(old_bits, seq - old_seq) | np.uint64(1)
+
+        self.db.save_presence_state(category, seq, max(date, last_date),
+                                    zip(symbols, bits.tolist(), [seq] * len(symbols)))
+        return bits
+
+    def rebuild(self, category):
+        """Recompute a category's presence state from its stored history"""
+        history, total_dates = self.db.get_presence_history(category, WINDOW_BITS)
+        if history.empty:
+            return
+
+        dates = np.sort(history['date'].unique())
+        age = len(dates) - 1 - np.searchsorted(dates, history['date'].to_numpy())
+        history = history.assign(bit=np.left_shift(np.uint64(1), age.astype(np.uint64)))
+        masks = history.groupby('symbol')['bit'].agg(lambda b: np.bitwise_or.reduce(b.to_numpy()))
+
+        self.db.save_presence_state(category, total_dates, dates[-1],
+                                    zip(masks.index, masks.tolist(), [total_dates] * len(masks)),
+                                    replace=True)
+        logger.info(f"Rebuilt presence state for {category}: {len(masks)} symbols over {len(dates)} dates")
+
+    def evaluate(self, category, df, date):
+        """
+        Update rolling state for newly inserted rows and evaluate the
+        category's rules against them.
+
+        Returns:
+            DataFrame of new (not previously recorded) firings
+        """
+        if category not in RULE_CATEGORIES or df is None or df.empty:
+            return pd.DataFrame()
+
+        df = df.drop_duplicates('symbol').reset_index(drop=True)
+        symbols = df['symbol'].tolist()
+        bits = self._update_presence(category, symbols, date)
+        if bits is None:
+            logger.info(f"Skipping alert rules for {category}: {date} is not the latest date")
+            return pd.DataFrame()
+
+        rules = [AlertRule.from_row(row) for row in self.db.get_alert_rules(category)]
+        if not rules:
+            return pd.DataFrame()
+
+        counts = {}
+
+        def occurrences(window_days):
+            if window_days not in counts:
+                counts[window_days] = popcount(bits & np.uint64((1 << window_days) - 1))
+            return counts[window_days]
+
+        firings = []
+        frames = []
+        for rule in rules:
+            try:
+                mask = rule.evaluate(df, occurrences)
+            except Exception as e:
+                logger.error(f"Rule #{rule.id} ({rule.name}) failed: {str(e)}")
+                continue
+            if not mask.any():
+                continue
+
+            hits = df[mask].copy()
+            hits.insert(0, 'rule', rule.name)
+            hits.insert(1, 'rule_id', rule.id)
+            hits['category'] = category
+            if rule.min_occurrences:
+                hits['hits'] = [f"{c}/{rule.window_days}" for c in occurrences(rule.window_days)[mask]]
+            else:
+                hits['hits'] = ''
+            frames.append(hits)
+            firings.extend(
+                (rule.id, row['symbol'], date, json.dumps(row, default=str))
+                for row in hits.drop(columns=['rule', 'rule_id']).to_dict('records')
+            )
+
+        if not firings:
+            return pd.DataFrame()
+
+        new_keys = {(rule_id, symbol) for rule_id, symbol, _, _ in self.db.record_alert_firings(firings)}
+        result = pd.concat(frames, ignore_index=True)
+        result = result[[(r, s) in new_keys for r, s in zip(result['rule_id'], result['symbol'])]]
+        if not result.empty:
+            logger.info(f"{len(result)} rule firing(s) in {category} for {date}")
+        return result
+
+    def subscribe(self, bus, on_fired=None):
+        """
+        Evaluate rules on every commit to a rule category, on a worker thread.
+
+        Args:
+            bus: EventBus (db.events)
+            on_fired: Called with the DataFrame of new firings at the end of
+                      each batch in which any rule fired
+        """
+        fired_in_batch = []
+
+        def handle(event):
+            if isinstance(event, RowsCommitted):
+                fired = self.evaluate(event.table, event.rows, event.date)
+                if not fired.empty:
+                    fired_in_batch.append(fired)
+            elif fired_in_batch:
+                firings = pd.concat(fired_in_batch, ignore_index=True)
+                fired_in_batch.clear()
+                if on_fired is not None:
+                    on_fired(firings)
+
+        bus.subscribe(handle, events=(RowsCommitted, BatchCommitted), tables=RULE_CATEGORIES,
+                      background=True, name='alert-rules')
+
+    def evaluate_all(self, results, date):
+        """
+        Evaluate rules for every category of a scrape.
+
+        Args:
+            results: {category: DataFrame} of rows inserted for `date`
+
+        Returns:
+            DataFrame of new firings across categories
+        """
+        frames = []
+        for category, df in results.items():
+            try:
+                fired = self.evaluate(category, df, date)
+            except Exception as e:
+                logger.error(f"Error evaluating alert rules for {category}: {str(e)}", exc_info=True)
+                continue
+            if not fired.empty:
+                frames.append(fired)
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def main():
+    setup_logging(fmt='%(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    add = commands.add_parser('add', help='Add a rule')
+    add.add_argument('name')
+    add.add_argument('--category', required=True, choices=RULE_CATEGORIES)
+    add.add_argument('--where', help='Conditions on the new row, e.g. "turnover > 1e7 and change_percent < -5"')
+    add.add_argument('--occurrences', type=int, help='Minimum appearances in the category...')
+    add.add_argument('--window', type=int, help=f'...within this many trading dates (max {WINDOW_BITS})')
+    add.add_argument('--symbols', help='Comma-separated symbols (default: all)')
+
+    disable = commands.add_parser('disable', help='Disable a rule')
+    disable.add_argument('rule_id', type=int)
+    enable = commands.add_parser('enable', help='Re-enable a rule')
+    enable.add_argument('rule_id', type=int)
+
+    commands.add_parser('list', help='List active rules')
+    commands.add_parser('rebuild', help='Recompute rolling state from stored history')
+    args = parser.parse_args()
+
+    db = get_database()
+    engine = RuleEngine(db)
+
+    if args.command == 'add':
+        try:
+            parse_conditions(args.where)
+        except ValueError as e:
+            parser.error(str(e))
+        if args.window and not args.occurrences:
+            parser.error('--window needs --occurrences')
+        if args.occurrences and args.occurrences > min(args.window or args.occurrences, WINDOW_BITS):
+            parser.error(f'--occurrences must be at most --window (and {WINDOW_BITS})')
+        if not args.where and not args.occurrences:
+            parser.error('give --where, --occurrences, or both')
+
+        symbols = ','.join(s.strip().upper() for s in args.symbols.split(',') if s.strip()) if args.symbols else None
+        db.add_alert_rule(args.name, args.category, args.where, args.occurrences,
+                          args.window or args.occurrences, symbols)
+
+    elif args.command in ('disable', 'enable'):
+        if not db.set_alert_rule_active(args.rule_id, args.command == 'enable'):
+            parser.error(f"no rule #{args.rule_id}")
+        logger.info(f"Rule #{args.rule_id} {args.command}d")
+
+    elif args.command == 'rebuild':
+        for category in RULE_CATEGORIES:
+            engine.rebuild(category)
+
+    else:
+        for row in db.get_alert_rules():
+            rule = AlertRule.from_row(row)
+            print(f"#{rule.id:<4} {rule.name:<30} {rule.describe()}")
+
+
+if __name__ == "__main__":
+    main()
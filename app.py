@@ -10,20 +10,14 @@ import logging
 from datetime import datetime
 import threading
 from config import Config
-from database import NepseDatabase
-from scheduler import NepseScheduler
+from database import get_database
+from scheduler import NepseScheduler, acquire_scheduler_lock
 from dashboard import app
+from metrics import reset_metrics_dir
+from logging_setup import setup_logging
 
 # Setup logging
-os.makedirs('logs', exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/app.log'),
-        logging.StreamHandler()
-    ]
-)
+setup_logging('logs/app.log')
 logger = logging.getLogger(__name__)
 
 
@@ -39,8 +33,8 @@ def initialize_app():
 
     # Initialize database
     logger.info("Initializing database...")
-    db = NepseDatabase()
-    logger.info("Database initialized successfully")
+    db = get_database()
+    logger.info(f"Database initialized successfully (schema version {db.schema_version})")
 
     # Check if .env file exists
     if not os.path.exists('.env'):
@@ -55,6 +49,11 @@ def initialize_app():
 
 def run_scheduler():
     """Run the scheduler in a separate thread"""
+    lock = acquire_scheduler_lock()
+    if lock is None:
+        logger.warning("Another scheduler instance holds the lock, not starting a second one")
+        return
+
     scheduler = NepseScheduler()
     scheduler.start()
 
@@ -72,6 +71,9 @@ def main():
     """Main application entry point"""
     initialize_app()
 
+    # Metric files are per process; drop those of processes no longer running
+    reset_metrics_dir()
+
     # Start scheduler in background thread
     scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
     scheduler_thread.start()
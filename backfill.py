@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Missed-day catch-up
+
+If the scheduler isn't running at scrape time the day simply has no data.
+On startup (and from the command line) this finds trading days in the last
+BACKFILL_LOOKBACK_DAYS with neither stored rows nor a 'skipped' (market
+closed) scrape log entry, and recovers them from whatever source has them:
+
+    archive  raw pages kept by earlier scrapes (ARCHIVE_PAGES=true) or saved
+             by hand, as ARCHIVE_DIR/<date>/<category>.html
+    import   CSV exports (export_data.py format) dropped into IMPORT_DIR,
+             named after their table, e.g. top_gainers_2024.csv
+    live     the live site, which still shows the latest session until the
+             next one opens; only used for that one day
+
+Days are loaded by a bounded pool of workers and written by the calling
+thread, one transaction per category and one event batch per day (see
+events.py). Each recovered day is recorded in scraper_log with status
+'backfilled'.
+
+Examples:
+    python backfill.py                 # recover missed days of the last 30 days
+    python backfill.py --days 90 --dry-run
+    python backfill.py --sources archive,import --workers 8
+"""
+
+import argparse
+import glob
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, timedelta
+import pandas as pd
+from config import Config
+from database import NepseDatabase, get_database
+from scraper import NepseScraper, CATEGORIES
+from scrape_pipeline import archive_path, validate
+from events import attach_default_subscribers
+from logging_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# "As of : 2024-01-15" on the live pages, when present
+_AS_OF = re.compile(r'As\s+of\s*:?\s*(\d{4}-\d{2}-\d{2})', re.IGNORECASE)
+
+
+def latest_session(calendar, now=None):
+    """The trading day the live site currently shows (today once scrape time has passed)"""
+    now = now or datetime.now()
+    day = now.date()
+    if (now.hour, now.minute) < (Config.SCRAPE_HOUR, Config.SCRAPE_MINUTE) or not calendar.is_trading_day(day):
+        day = calendar.previous_trading_day(day)
+    return day.strftime('%Y-%m-%d')
+
+
+def find_missing_days(db, lookback_days=None, now=None):
+    """
+    Trading days (see trading_calendar.py) with no stored data and no
+    'skipped' log entry, from the later of the lookback start and the first
+    stored day up to the latest session.
+
+    Returns:
+        Sorted list of YYYY-MM-DD strings
+    """
+    now = now or datetime.now()
+    lookback_days = Config.BACKFILL_LOOKBACK_DAYS if lookback_days is None else lookback_days
+    start = (now - timedelta(days=lookback_days)).strftime('%Y-%m-%d')
+
+    covered = db.get_covered_dates()
+    if not covered:
+        # Nothing stored yet: there is no gap, just a first scrape to come
+        return []
+    start = max(start, covered[0])
+    covered = set(covered)
+
+    trading_days = db.calendar.trading_days(start, latest_session(db.calendar, now))
+    return [date for date in trading_days if date not in covered]
+
+
+class ArchiveSource:
+    """Raw pages archived by the scrape pipeline (or saved by hand)"""
+
+    name = 'archive'
+
+    def __init__(self, root=None):
+        self.root = root or Config.ARCHIVE_DIR
+        self.scraper = NepseScraper()
+
+    def load(self, date):
+        results = {}
+        for category in CATEGORIES:
+            path = archive_path(date, category, self.root)
+            if not os.path.exists(path):
+                continue
+            with open(path, encoding='utf-8') as f:
+                df = self.scraper.parse_category(category, f.read())
+            if df is not None and not df.empty:
+                results[category] = df
+        return results
+
+
+class ImportSource:
+    """CSV exports of the category tables; each file is read once, on first use"""
+
+    name = 'import'
+
+    def __init__(self, root=None):
+        self.root = root or Config.IMPORT_DIR
+        self._by_date = None
+        self._lock = threading.Lock()
+
+    def _index(self):
+        by_date = {}
+        for category in CATEGORIES:
+            date_column = NepseDatabase.date_column(category)
+            for path in sorted(glob.glob(os.path.join(self.root, f"{category}*.csv"))):
+                try:
+                    df = pd.read_csv(path)
+                except Exception as e:
+                    logger.warning(f"Skipping import file {path}: {str(e)}")
+                    continue
+                if date_column not in df.columns:
+                    logger.warning(f"Skipping import file {path}: no {date_column} column")
+                    continue
+                df = df.drop(columns=[col for col in ('id', 'created_at') if col in df.columns])
+                for date, rows in df.groupby(df[date_column].astype(str).str[:10]):
+                    frames = by_date.setdefault(date, {})
+                    frames[category] = pd.concat([frames[category], rows]) if category in frames else rows
+                logger.info(f"Indexed import file {path} ({len(df)} rows)")
+        return by_date
+
+    def load(self, date):
+        with self._lock:
+            if self._by_date is None:
+                self._by_date = self._index() if os.path.isdir(self.root) else {}
+        return {category: df.reset_index(drop=True) for category, df in self._by_date.get(date, {}).items()}
+
+
+class LiveSource:
+    """The live site, for the latest session only"""
+
+    name = 'live'
+
+    def __init__(self, db, now=None):
+        self.db = db
+        self.session = latest_session(db.calendar, now)
+
+    def load(self, date):
+        if date != self.session:
+            return {}
+
+        results = {}
+        with NepseScraper() as scraper:
+            for category, html_content in scraper.iter_pages():
+                if not html_content:
+                    continue
+                as_of = _AS_OF.search(html_content)
+                if as_of and as_of.group(1) != date:
+                    logger.warning(f"Live {category} page is for {as_of.group(1)}, not {date}")
+                    continue
+                df = scraper.parse_category(category, html_content)
+                if df is not None and not df.empty:
+                    results[category] = df
+
+        # Pages unchanged since the last stored day mean there was no session
+        if results and self.db.check_all_tables_for_market_closure(results, date):
+            logger.info(f"Live pages match the last stored day, {date} was not a trading day")
+            self.db.log_scrape('skipped', [], 0, 'Market closed - data unchanged (backfill)', scrape_date=date)
+            return {}
+        return results
+
+
+SOURCES = {
+    'archive': lambda db: ArchiveSource(),
+    'import': lambda db: ImportSource(),
+    'live': lambda db: LiveSource(db),
+}
+
+
+def _load_day(sources, date):
+    """Take each category from the first source that has it"""
+    results, used = {}, []
+    for source in sources:
+        missing = [category for category in CATEGORIES if category not in results]
+        if not missing:
+            break
+        try:
+            found = {category: df for category, df in source.load(date).items() if category in missing}
+        except Exception as e:
+            logger.error(f"Error loading {date} from {source.name}: {str(e)}")
+            continue
+        if found:
+            results.update(found)
+            used.append(source.name)
+    return results, used
+
+
+def backfill(db=None, days=None, sources=None, workers=None, dry_run=False):
+    """
+    Recover missed trading days.
+
+    Args:
+        db: NepseDatabase
+        days: Explicit days to recover (default: find_missing_days())
+        sources: Source names in order of preference (default: all of SOURCES)
+        workers: Days loaded in parallel (Config.BACKFILL_WORKERS)
+        dry_run: Only report the missing days
+
+    Returns:
+        (dict of recovered day -> records written, list of days still missing)
+    """
+    db = db or get_database()
+    days = find_missing_days(db) if days is None else sorted(days)
+    if not days:
+        logger.info("No missed trading days")
+        return {}, []
+
+    logger.info(f"{len(days)} missed trading day(s): {', '.join(days)}")
+    if dry_run:
+        return {}, days
+
+    loaders = [SOURCES[name](db) for name in (sources or SOURCES)]
+    workers = max(1, workers or Config.BACKFILL_WORKERS)
+    recovered, unrecovered = {}, []
+
+    # Keep at most `workers` days in flight so loaded frames don't pile up
+    # while the single writer (this thread) catches up
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='backfill') as pool:
+        pending = {}
+        remaining = list(days)
+        while remaining or pending:
+            while remaining and len(pending) < workers:
+                date = remaining.pop(0)
+                pending[pool.submit(_load_day, loaders, date)] = date
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                date = pending.pop(future)
+                results, used = future.result()
+                if not results:
+                    unrecovered.append(date)
+                    continue
+
+                records, categories = 0, []
+                with db.events.batch(date):
+                    for category, df in results.items():
+                        try:
+                            df = validate(category, df, db.get_column_types(category))
+                            records += db.upsert_data(category, df, date)
+                            categories.append(category)
+                        except Exception as e:
+                            logger.error(f"Error storing {category} for {date}: {str(e)}")
+
+                if categories:
+                    db.log_scrape('backfilled', categories, records, f"source: {', '.join(used)}",
+                                  scrape_date=date)
+                    recovered[date] = records
+                    logger.info(f"Recovered {date} from {', '.join(used)}: {records} records")
+                else:
+                    unrecovered.append(date)
+
+    if recovered:
+        # Presence windows only move forward, so subscribers skip older days;
+        # recompute them with the new days once they are done
+        from alert_rules import RuleEngine, RULE_CATEGORIES
+        db.events.drain()
+        engine = RuleEngine(db)
+        for category in RULE_CATEGORIES:
+            engine.rebuild(category)
+
+    if unrecovered:
+        logger.warning(f"No source had data for: {', '.join(sorted(unrecovered))}")
+    logger.info(f"Backfill finished: {len(recovered)} day(s) recovered, "
+                f"{sum(recovered.values())} records")
+    return recovered, sorted(unrecovered)
+
+
+def main():
+    setup_logging(fmt='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=int, default=Config.BACKFILL_LOOKBACK_DAYS,
+                        help='How many days to look back for gaps')
+    parser.add_argument('--date', action='append', help='Recover this day (YYYY-MM-DD); repeatable')
+    parser.add_argument('--sources', help=f"Comma-separated sources in order of preference "
+                                          f"(default: {','.join(SOURCES)})")
+    parser.add_argument('--workers', type=int, default=Config.BACKFILL_WORKERS)
+    parser.add_argument('--dry-run', action='store_true', help='Only list the missing days')
+    args = parser.parse_args()
+
+    sources = [name.strip() for name in args.sources.split(',')] if args.sources else None
+    unknown = set(sources or []) - set(SOURCES)
+    if unknown:
+        parser.error(f"unknown sources: {', '.join(sorted(unknown))}")
+
+    db = get_database()
+    attach_default_subscribers(db)
+    days = args.date or find_missing_days(db, args.days)
+    recovered, unrecovered = backfill(db, days, sources, args.workers, args.dry_run)
+
+    for date in (unrecovered if args.dry_run else sorted(recovered)):
+        print(date if args.dry_run else f"{date}  {recovered[date]} records")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the alert emails.
+
+Render mode (default) renders the hot-stocks alert (HTML + plain text) for
+synthetic alert lists of increasing size and reports the time per email and
+per row, next to the old iterrows/f-string renderer as a baseline. Per-row
+cost should stay flat as the list grows.
+
+Pipeline mode (--pipeline) drives EmailAlerts end to end against a local
+SMTP stand-in (local_smtp.py) and a throwaway database seeded with synthetic
+data: the daily summary, hot stocks alert, IPO alert and the scheduler's
+weekly job. For each it reports the time to build the emails (analysis
+query, render, queue), messages and bytes per message received by the
+server, and the time to deliver them.
+
+Usage:
+    python bench_email.py                        # 10 .. 10,000 rows
+    python bench_email.py --sizes 100 100000 --runs 3
+    python bench_email.py --pipeline --sizes 10 1000 --subscribers 50
+    python bench_email.py --pipeline --latency-ms 20
+    python bench_email.py --json results.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from email_templates import render_email, render_html_table, render_text_table, paragraph, HOT_STOCK_COLUMNS
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+
+
+def make_alert_rows(n, seed=0):
+    """Synthetic repeat-analysis rows shaped like get_repeat_analysis() output"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'symbol': [f"SYM{i:05d}" for i in range(n)],
+        'occurrences': rng.integers(3, 8, n),
+        'avg_change': rng.uniform(0, 10, n),
+        'max_change': rng.uniform(5, 10, n),
+        'last_seen': ['2024-01-15'] * n,
+    })
+
+
+def render_templates(df):
+    """Current renderer: compiled templates, column-array tables, both parts"""
+    return render_email(
+        "🔥 Hot Stocks Alert - Repeated Gainers (7 days)",
+        'hot',
+        [
+            paragraph("These stocks have appeared in top gainers <strong>3+ times</strong> in the last 7 days:",
+                      "These stocks have appeared in top gainers 3+ times in the last 7 days:"),
+            (render_html_table(df, HOT_STOCK_COLUMNS, row_class='highlight'),
+             render_text_table(df, HOT_STOCK_COLUMNS)),
+        ]
+    )
+
+
+def render_iterrows(df):
+    """Previous renderer: f-string concatenation inside df.iterrows(), HTML only"""
+    html = "<html><head><style>body { font-family: Arial, sans-serif; }</style></head><body><table>"
+    for _, row in df.iterrows():
+        html += f"""
+            <tr class="highlight">
+                <td><strong>{row['symbol']}</strong></td>
+                <td>{row['occurrences']}</td>
+                <td>{row['avg_change']:.2f}%</td>
+                <td>{row['max_change']:.2f}%</td>
+                <td>{row['last_seen']}</td>
+            </tr>
+        """
+    html += "</table></body></html>"
+    return html
+
+
+def time_render(render, df, runs):
+    """Median wall time in ms of `runs` renders"""
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        render(df)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def make_movers(n, sign, rng):
+    """Synthetic top gainers (sign=1) or top losers (sign=-1) for one day"""
+    return pd.DataFrame({
+        'symbol': [f"SYM{i:05d}" for i in range(n)],
+        'ltp': rng.uniform(100, 2000, n).round(1),
+        'change_percent': (sign * rng.uniform(0.5, 10, n)).round(2),
+        'qty': rng.integers(100, 100000, n),
+        'turnover': rng.uniform(1e5, 1e8, n).round(0),
+    })
+
+
+def make_ipos(n):
+    """Synthetic IPO listings"""
+    return pd.DataFrame({
+        'company_name': [f"Company {i} Limited" for i in range(n)],
+        'scrip': [f"IPO{i:05d}" for i in range(n)],
+        'opening_date': '2024-01-10',
+        'closing_date': '2024-01-14',
+        'price_per_share': 100.0,
+        'status': 'Open',
+    })
+
+
+def seed_database(db, rows, subscribers):
+    """
+    Fill a fresh database so every alert has about `rows` rows to report.
+
+    Returns:
+        Scrape results for today, as passed to send_daily_summary()
+    """
+    rng = np.random.default_rng(0)
+    results = {}
+    # Three appearances in the last week make every symbol a hot/danger stock
+    for offset in range(3):
+        date = (datetime.now() - timedelta(days=offset)).strftime('%Y-%m-%d')
+        results = {'top_gainers': make_movers(rows, 1, rng), 'top_losers': make_movers(rows, -1, rng),
+                   'ipo_info': make_ipos(rows)}
+        db.insert_data('top_gainers', results['top_gainers'], date)
+        db.insert_data('top_losers', results['top_losers'], date)
+    db.insert_data('ipo_info', results['ipo_info'], datetime.now().strftime('%Y-%m-%d'))
+
+    for i in range(subscribers):
+        db.add_subscriber(f"subscriber{i}@localhost")
+    return results
+
+
+PIPELINE_SCENARIOS = {
+    'daily_summary': lambda alerts, scheduler, results: alerts.send_daily_summary(results),
+    'hot_stocks': lambda alerts, scheduler, results: alerts.send_hot_stocks_alert(),
+    'ipo': lambda alerts, scheduler, results: alerts.send_ipo_alert(),
+    'weekly_job': lambda alerts, scheduler, results: scheduler.weekly_analysis_job(),
+}
+
+
+def run_pipeline(sizes, subscribers, latency):
+    """Drive each alert through EmailAlerts and the outbox into a local SMTP server"""
+    # scheduler.py logs to logs/scheduler.log relative to the working directory
+    os.makedirs('logs', exist_ok=True)
+    from database import NepseDatabase
+    from email_alerts import EmailAlerts
+    from local_smtp import LocalSMTPServer
+    from scheduler import NepseScheduler
+    logging.getLogger().setLevel(logging.WARNING)
+
+    report = []
+    print(f"{'scenario':<14} {'rows':>7} {'msgs':>5} {'build ms':>9} {'send ms':>9} "
+          f"{'bytes/msg':>11} {'conns':>5}")
+
+    with LocalSMTPServer(latency=latency) as server, tempfile.TemporaryDirectory() as workdir:
+        for n in sizes:
+            for name, scenario in PIPELINE_SCENARIOS.items():
+                # A fresh database per run so outbox deduplication never skips a message
+                db = NepseDatabase(os.path.join(workdir, f"{name}_{n}.db"))
+                results = seed_database(db, n, subscribers)
+                alerts = EmailAlerts(db=db, smtp_host=server.host, smtp_port=server.port,
+                                     use_ssl=False, starttls=False,
+                                     email_from='bench@localhost', email_password='bench')
+                scheduler = NepseScheduler(db=db, email_alerts=alerts)
+                server.reset()
+
+                started = time.perf_counter()
+                scenario(alerts, scheduler, results)
+                build_ms = (time.perf_counter() - started) * 1000
+
+                started = time.perf_counter()
+                alerts.outbox.deliver_pending()
+                send_ms = (time.perf_counter() - started) * 1000
+
+                messages = len(server.messages)
+                entry = {
+                    'scenario': name,
+                    'rows': n,
+                    'messages': messages,
+                    'build_ms': build_ms,
+                    'send_ms': send_ms,
+                    'bytes_per_message': server.bytes_received / messages if messages else 0,
+                    'connections': server.connections,
+                }
+                report.append(entry)
+                print(f"{name:<14} {n:>7} {messages:>5} {build_ms:>9.1f} {send_ms:>9.1f} "
+                      f"{entry['bytes_per_message']:>11,.0f} {server.connections:>5}")
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='Alert list sizes (rows)')
+    parser.add_argument('--runs', type=int, default=5, help='Renders per size')
+    parser.add_argument('--no-baseline', action='store_true', help='Skip the iterrows baseline')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='Benchmark the full send pipeline against a local SMTP stand-in')
+    parser.add_argument('--subscribers', type=int, default=1, help='Pipeline: number of subscribers')
+    parser.add_argument('--latency-ms', type=float, default=0, help='Pipeline: SMTP server delay per message')
+    parser.add_argument('--json', dest='json_path', help='Also write results to this JSON file')
+    args = parser.parse_args()
+
+    if args.pipeline:
+        report = run_pipeline(args.sizes, args.subscribers, args.latency_ms / 1000)
+        if args.json_path:
+            with open(args.json_path, 'w') as f:
+                json.dump(report, f, indent=2)
+            print(f"\nResults written to {args.json_path}")
+        return
+
+    report = []
+    print(f"{'rows':>8}  {'template ms':>12}  {'us/row':>8}  {'bytes':>10}  {'iterrows ms':>12}  {'us/row':>8}")
+    for n in args.sizes:
+        df = make_alert_rows(n)
+        html, text = render_templates(df)
+
+        entry = {
+            'rows': n,
+            'template_ms': time_render(render_templates, df, args.runs),
+            'bytes': len(html.encode('utf-8')) + len(text.encode('utf-8')),
+        }
+        if not args.no_baseline:
+            entry['iterrows_ms'] = time_render(render_iterrows, df, args.runs)
+        report.append(entry)
+
+        line = (f"{n:>8}  {entry['template_ms']:>12.2f}  {entry['template_ms'] * 1000 / n:>8.2f}"
+                f"  {entry['bytes']:>10,}")
+        if 'iterrows_ms' in entry:
+            line += f"  {entry['iterrows_ms']:>12.2f}  {entry['iterrows_ms'] * 1000 / n:>8.2f}"
+        print(line)
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark and import-time profile for the entry points.
+
+Each measurement runs in a fresh interpreter with `python -X importtime`
+against a throwaway database, so results are comparable between runs.
+
+Usage:
+    python bench_startup.py                    # default modules, 5 runs each
+    python bench_startup.py --runs 10 --top 20
+    python bench_startup.py --json results.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+DEFAULT_MODULES = ['app', 'run_scraper', 'dashboard', 'scheduler', 'email_alerts']
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_importtime(stderr):
+    """
+    Parse `-X importtime` output.
+
+    Returns:
+        List of (module, self_us, cumulative_us, depth) tuples
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3:
+            continue
+        self_us, cumulative_us, name = parts
+        depth = (len(name) - len(name.lstrip(' '))) // 2
+        entries.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return entries
+
+
+def measure(module, workdir):
+    """Import `module` in a fresh interpreter and return its import-time entries"""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = REPO_DIR + os.pathsep + env.get('PYTHONPATH', '')
+    env['DATABASE_PATH'] = os.path.join(workdir, 'data', 'bench.db')
+    env['CACHE_DIR'] = os.path.join(workdir, 'data', 'cache')
+    os.makedirs(os.path.join(workdir, 'logs'), exist_ok=True)
+
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=workdir, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES)
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters per module')
+    parser.add_argument('--top', type=int, default=15, help='Slowest imports to list per module')
+    parser.add_argument('--json', dest='json_path', help='Also write results to this JSON file')
+    args = parser.parse_args()
+
+    report = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for module in args.modules:
+            # First import warms the database file and bytecode caches
+            measure(module, workdir)
+
+            totals = []
+            last = []
+            for _ in range(args.runs):
+                last = measure(module, workdir)
+                total = next(cum for name, _, cum, depth in last if name == module and depth == 0)
+                totals.append(total)
+
+            slowest = sorted(last, key=lambda e: e[1], reverse=True)[:args.top]
+            report[module] = {
+                'median_ms': statistics.median(totals) / 1000,
+                'min_ms': min(totals) / 1000,
+                'max_ms': max(totals) / 1000,
+                'slowest_self_ms': [(name, self_us / 1000) for name, self_us, _, _ in slowest],
+            }
+
+    for module, stats in report.items():
+        print(f"\n{module}: median {stats['median_ms']:.1f} ms "
+              f"(min {stats['min_ms']:.1f}, max {stats['max_ms']:.1f}, {args.runs} runs)")
+        for name, ms in stats['slowest_self_ms']:
+            print(f"    {ms:8.1f} ms  {name}")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Disk-backed query cache shared by every dashboard worker process
+"""
+
+import functools
+import os
+import logging
+import diskcache
+from config import Config
+from metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+_cache = None
+_MISSING = object()
+
+
+def get_cache():
+    """Return the process-wide handle to the shared query cache"""
+    global _cache
+    if _cache is None:
+        # diskcache is safe to open from several processes on the same
+        # directory, so every WSGI worker sees the same entries
+        _cache = diskcache.Cache(os.path.join(Config.CACHE_DIR, 'queries'))
+    return _cache
+
+
+def cached(expire=None, version=None):
+    """
+    Memoize a function's result in the shared query cache.
+
+    The key is the function's qualified name plus its arguments, so the
+    arguments must be hashable and picklable.
+
+    Args:
+        expire: Seconds before an entry expires (defaults to Config.QUERY_CACHE_TTL)
+        version: Optional callable whose return value is added to the key,
+                 e.g. the data generation, so new data invalidates old entries
+    """
+    def decorator(func):
+        prefix = f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (prefix, version() if version else None, args, tuple(sorted(kwargs.items())))
+            cache = get_cache()
+
+            value = cache.get(key, default=_MISSING)
+            if value is not _MISSING:
+                CACHE_REQUESTS.labels(function=func.__name__, result='hit').inc()
+                return value
+
+            CACHE_REQUESTS.labels(function=func.__name__, result='miss').inc()
+            value = func(*args, **kwargs)
+            cache.set(key, value, expire=expire or Config.QUERY_CACHE_TTL)
+            return value
+
+        return wrapper
+
+    return decorator
+
+
+def clear_cache():
+    """Drop every cached query result"""
+    get_cache().clear()
+    logger.info("Query cache cleared")
@@ -9,6 +9,18 @@ class Config:
     EMAIL_PASSWORD = os.getenv('EMAIL_PASSWORD', '')
     EMAIL_TO = os.getenv('EMAIL_TO', 'codewithnitesh01@gmail.com')
 
+    # SMTP server (Gmail over SSL by default)
+    SMTP_HOST = os.getenv('SMTP_HOST', 'smtp.gmail.com')
+    SMTP_PORT = int(os.getenv('SMTP_PORT', 465))
+    SMTP_USE_SSL = os.getenv('SMTP_USE_SSL', 'True').lower() == 'true'
+    SMTP_STARTTLS = os.getenv('SMTP_STARTTLS', 'False').lower() == 'true'
+
+    # Email outbox delivery: retries back off exponentially from the base delay
+    OUTBOX_POLL_SECONDS = int(os.getenv('OUTBOX_POLL_SECONDS', 30))
+    EMAIL_RETRY_HORIZON_HOURS = int(os.getenv('EMAIL_RETRY_HORIZON_HOURS', 24))
+    EMAIL_RETRY_BASE_SECONDS = int(os.getenv('EMAIL_RETRY_BASE_SECONDS', 60))
+    EMAIL_RETRY_MAX_SECONDS = int(os.getenv('EMAIL_RETRY_MAX_SECONDS', 6 * 3600))
+
     # ShareSansar URLs (using ShareSansar instead of NepseStock)
     PAGES = {
         "Gainers": "https://www.sharesansar.com/top-gainers",
@@ -34,16 +46,83 @@ class Config:
     DASHBOARD_PORT = int(os.getenv('DASHBOARD_PORT', 8050))
     DEBUG_MODE = os.getenv('DEBUG_MODE', 'True').lower() == 'true'
 
+    # Background callbacks (heavy queries run outside the request thread)
+    CACHE_DIR = os.getenv('CACHE_DIR', 'data/cache')
+
+    # How often open dashboards poll for a newly completed scrape (seconds)
+    REFRESH_POLL_SECONDS = int(os.getenv('REFRESH_POLL_SECONDS', 30))
+
+    # Shared query cache lifetime (seconds)
+    QUERY_CACHE_TTL = int(os.getenv('QUERY_CACHE_TTL', 300))
+
+    # Production serving (serve.py); WEB_WORKERS=0 means 2 x CPU cores + 1
+    WEB_WORKERS = int(os.getenv('WEB_WORKERS', 0))
+    WEB_THREADS = int(os.getenv('WEB_THREADS', 4))
+    SCHEDULER_LOCK_FILE = os.getenv('SCHEDULER_LOCK_FILE', 'data/scheduler.lock')
+
+    # Rows fetched from the cursor per chunk when exporting data
+    EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 5000))
+
+    # Maximum points per chart trace sent to the browser
+    CHART_POINT_BUDGET = int(os.getenv('CHART_POINT_BUDGET', 400))
+
     # Dashboard password protection
     DASHBOARD_USERNAME = os.getenv('DASHBOARD_USERNAME', 'NitYes')
     DASHBOARD_PASSWORD = os.getenv('DASHBOARD_PASSWORD', 'hackmeifucan@0101')
 
+    # Logging (logging_setup.py): level, 'text' or 'json' lines, rotation at
+    # LOG_MAX_BYTES keeping LOG_BACKUP_COUNT files, and at most
+    # LOG_RATE_LIMIT INFO/DEBUG records per call site per minute (0 = no limit)
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+    LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024))
+    LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
+    LOG_RATE_LIMIT = int(os.getenv('LOG_RATE_LIMIT', 60))
+
+    # Per-process Prometheus metric files, aggregated by /metrics
+    METRICS_DIR = os.getenv('METRICS_DIR', 'data/metrics')
+
     # Database
     DATABASE_PATH = os.getenv('DATABASE_PATH', 'data/nepse_data.db')
 
+    # Nightly database maintenance (maintenance.py): retention cleanup,
+    # vacuum, ANALYZE, integrity check, WAL checkpoint and size stats
+    MAINTENANCE_HOUR = int(os.getenv('MAINTENANCE_HOUR', 2))
+    MAINTENANCE_MINUTE = int(os.getenv('MAINTENANCE_MINUTE', 30))
+
     # Market closure detection
     MARKET_CLOSURE_CHECK_ROWS = 50  # Compare last 50 rows to detect market closure
 
+    # 'thread' runs scheduled jobs on a thread pool; 'asyncio' runs them as
+    # coroutines on one event loop, with independent steps concurrent and a
+    # deadline per job
+    SCHEDULER_MODE = os.getenv('SCHEDULER_MODE', 'thread').lower()
+    JOB_DEADLINE_SECONDS = int(os.getenv('JOB_DEADLINE_SECONDS', 1800))
+
+    # Scheduled scrapes (and the startup catch-up) run in a worker process,
+    # killed after SCRAPE_TIMEOUT seconds or above SCRAPE_MEMORY_LIMIT_MB of
+    # resident memory including the browser (0 = no limit)
+    SCRAPE_IN_SUBPROCESS = os.getenv('SCRAPE_IN_SUBPROCESS', 'True').lower() == 'true'
+    SCRAPE_TIMEOUT = int(os.getenv('SCRAPE_TIMEOUT', 900))
+    SCRAPE_MEMORY_LIMIT_MB = int(os.getenv('SCRAPE_MEMORY_LIMIT_MB', 2048))
+
+    # Pages fetched ahead of parsing/storing in the scrape pipeline (backpressure)
+    SCRAPE_QUEUE_SIZE = int(os.getenv('SCRAPE_QUEUE_SIZE', 2))
+
+    # Missed-day catch-up (backfill.py): days looked back on startup, parallel
+    # loaders, raw pages kept by each scrape, and exported CSVs to import from
+    BACKFILL_LOOKBACK_DAYS = int(os.getenv('BACKFILL_LOOKBACK_DAYS', 30))
+    BACKFILL_WORKERS = int(os.getenv('BACKFILL_WORKERS', 4))
+    ARCHIVE_PAGES = os.getenv('ARCHIVE_PAGES', 'False').lower() == 'true'
+    ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', 'data/archive')
+    IMPORT_DIR = os.getenv('IMPORT_DIR', 'data/import')
+
+    # Trading calendar (trading_calendar.py): weekly off days and a holiday
+    # file with one YYYY-MM-DD date per line; closures the scraper detects
+    # are learned automatically
+    MARKET_OFF_DAYS = os.getenv('MARKET_OFF_DAYS', 'sat')
+    HOLIDAYS_FILE = os.getenv('HOLIDAYS_FILE', 'data/holidays.txt')
+
     # Market holiday check (can be expanded)
     MARKET_HOLIDAYS = [
         # Add known market holidays in YYYY-MM-DD format
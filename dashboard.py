@@ -1,30 +1,114 @@
 import dash
-from dash import dcc, html, Input, Output, State, dash_table
+from dash import dcc, html, Input, Output, State, dash_table, DiskcacheManager, ctx
+from dash.dash_table.Format import Format, Group, Scheme, Symbol
+from dash.exceptions import PreventUpdate
+import flask
 import dash_bootstrap_components as dbc
+import diskcache
 import dash_auth
-import plotly.graph_objs as go
-import plotly.express as px
+import re
+import numpy as np
 from datetime import datetime, timedelta
 import pandas as pd
-from database import NepseDatabase
+from database import get_database
 from config import Config
+from downsample import downsample_series
+from cache import cached
+from export import export_blueprint
+from metrics import timed_callback, render as render_metrics
 import logging
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Initialize database
-db = NepseDatabase()
+db = get_database()
+
+# Heavy callbacks run in background processes managed through a disk cache,
+# so long queries never hold a Flask request thread
+background_callback_manager = DiskcacheManager(diskcache.Cache(Config.CACHE_DIR))
+
+def current_generation():
+    return db.get_data_generation()[0]
+
+
+# Query results shared across worker processes through the disk cache;
+# keyed on the data generation so a finished scrape invalidates them
+@cached(version=current_generation)
+def load_data(table_name, days=None):
+    return db.get_data(table_name, days=days)
+
+
+@cached(version=current_generation)
+def load_repeat_analysis(table_name, days=30, min_occurrences=2):
+    return db.get_repeat_analysis(table_name, days=days, min_occurrences=min_occurrences)
+
+
+@cached(version=current_generation)
+def load_broker_rankings(days=None, limit=20):
+    return db.get_broker_rankings(days=days, limit=limit)
+
+
+@cached(version=current_generation)
+def load_membership_matrix(table_name, days=30):
+    """
+    Pivot a category window into a symbol x date matrix of change %.
+
+    Returns:
+        Dict with 'symbols' and 'dates' arrays and a 'change' float matrix
+        (NaN where the symbol was not in the list that day), rows sorted by
+        number of appearances
+    """
+    df = db.get_membership(table_name, days=days)
+
+    symbol_codes, symbols = pd.factorize(df['symbol'])
+    date_codes, dates = pd.factorize(df['date'], sort=True)
+
+    change = np.full((len(symbols), len(dates)), np.nan)
+    change[symbol_codes, date_codes] = df['change_percent'].to_numpy(dtype=float)
+
+    # A symbol may be listed with an unknown change %; still count it as present
+    present = np.zeros(change.shape, dtype=bool)
+    present[symbol_codes, date_codes] = True
+
+    counts = present.sum(axis=1)
+    order = np.lexsort((np.asarray(symbols), -counts))
+
+    return {
+        'symbols': np.asarray(symbols)[order],
+        'dates': np.asarray(dates),
+        'change': change[order],
+        'present': present[order],
+        'counts': counts[order],
+    }
+
 
 # Create Dash app
 app = dash.Dash(
     __name__,
     external_stylesheets=[dbc.themes.BOOTSTRAP],
-    suppress_callback_exceptions=True
+    suppress_callback_exceptions=True,
+    background_callback_manager=background_callback_manager
 )
 
 app.title = "NEPSE Investment Dashboard"
 
+# Bulk export routes; registered before auth so they are password protected too
+app.server.register_blueprint(export_blueprint)
+
+
+@app.server.route('/api/generation')
+def data_generation():
+    """Cheap change feed polled by the browser to detect new scrapes"""
+    generation, updated_at = db.get_data_generation()
+    return flask.jsonify(generation=generation, updated_at=updated_at)
+
+
+@app.server.route('/metrics')
+def prometheus_metrics():
+    """Prometheus scrape endpoint (same login as the dashboard)"""
+    body, content_type = render_metrics()
+    return flask.Response(body, content_type=content_type)
+
 # Add password protection
 VALID_USERNAME_PASSWORD_PAIRS = {
     Config.DASHBOARD_USERNAME: Config.DASHBOARD_PASSWORD
@@ -46,47 +130,132 @@ COLORS = {
     'info': '#16a085'
 }
 
-# Layout
-app.layout = dbc.Container([
-    # Header
-    dbc.Row([
-        dbc.Col([
-            html.H1("📊 NEPSE Investment Dashboard", className="text-center mb-4 mt-4"),
-            html.P(
-                "Real-time analysis of Nepal Stock Exchange data for smarter investment decisions",
-                className="text-center text-muted mb-4"
-            )
-        ])
-    ]),
-
-    # Navigation Tabs
-    dbc.Tabs([
-        dbc.Tab(label="📈 Overview", tab_id="overview"),
-        dbc.Tab(label="🔄 Repeat Analysis", tab_id="repeat"),
-        dbc.Tab(label="🏢 Broker Intelligence", tab_id="brokers"),
-        dbc.Tab(label="🔍 Stock Lookup", tab_id="lookup"),
-        dbc.Tab(label="🎯 IPO Tracker", tab_id="ipo"),
-        dbc.Tab(label="📊 Signals & Alerts", tab_id="signals"),
-    ], id="tabs", active_tab="overview", className="mb-4"),
-
-    # Tab Content
-    html.Div(id="tab-content"),
-
-    # Footer
-    html.Hr(),
-    html.P(
-        f"Last updated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} | Data retention: {Config.DATA_RETENTION_DAYS} days",
-        className="text-center text-muted small"
-    )
-], fluid=True, style={'backgroundColor': COLORS['background']})
+def footer_text(updated_at):
+    return f"Last updated: {updated_at or 'never'} | Data retention: {Config.DATA_RETENTION_DAYS} days"
+
+
+# Number formats applied by DataTable in the browser, so columns are sent as
+# plain numbers (smaller payloads, correct numeric sorting)
+PERCENT_FORMAT = Format(precision=2, scheme=Scheme.fixed, nully='N/A').symbol(Symbol.yes).symbol_suffix('%')
+AMOUNT_FORMAT = Format(precision=0, scheme=Scheme.fixed, group=Group.yes, nully='N/A')
+
+COLUMN_FORMATS = {
+    'change_percent': PERCENT_FORMAT,
+    'avg_change': PERCENT_FORMAT,
+    'max_change': PERCENT_FORMAT,
+    'min_change': PERCENT_FORMAT,
+    'turnover': AMOUNT_FORMAT,
+    'qty': AMOUNT_FORMAT,
+    'buy_amount': AMOUNT_FORMAT,
+    'sell_amount': AMOUNT_FORMAT,
+    'total_amount': AMOUNT_FORMAT,
+    'net_amount': AMOUNT_FORMAT,
+    'market_share': PERCENT_FORMAT,
+}
+
+
+def table_column(col, name=None):
+    """DataTable column spec, numeric with a display format where one is defined"""
+    spec = {"name": name or col.replace('_', ' ').title(), "id": col}
+    if col in COLUMN_FORMATS:
+        spec.update(type='numeric', format=COLUMN_FORMATS[col])
+    return spec
+
+
+# Layout (a function, so every page load starts from the current generation)
+def serve_layout():
+    generation, updated_at = db.get_data_generation()
+
+    return dbc.Container([
+        # Data generation seen by this page, refreshed by polling /api/generation
+        dcc.Store(id='data-generation', data={'generation': generation, 'updated_at': updated_at}),
+        dcc.Interval(id='generation-poll', interval=Config.REFRESH_POLL_SECONDS * 1000),
+
+        # Header
+        dbc.Row([
+            dbc.Col([
+                html.H1("📊 NEPSE Investment Dashboard", className="text-center mb-4 mt-4"),
+                html.P(
+                    "Real-time analysis of Nepal Stock Exchange data for smarter investment decisions",
+                    className="text-center text-muted mb-4"
+                )
+            ])
+        ]),
+
+        # Navigation Tabs
+        dbc.Tabs([
+            dbc.Tab(label="📈 Overview", tab_id="overview"),
+            dbc.Tab(label="🔄 Repeat Analysis", tab_id="repeat"),
+            dbc.Tab(label="🏢 Broker Intelligence", tab_id="brokers"),
+            dbc.Tab(label="🔍 Stock Lookup", tab_id="lookup"),
+            dbc.Tab(label="🎯 IPO Tracker", tab_id="ipo"),
+            dbc.Tab(label="📊 Signals & Alerts", tab_id="signals"),
+        ], id="tabs", active_tab="overview", className="mb-4"),
+
+        # Tab Content
+        html.Div(id="tab-content"),
+
+        # Footer
+        html.Hr(),
+        html.P(
+            footer_text(updated_at),
+            id='last-updated',
+            className="text-center text-muted small"
+        )
+    ], fluid=True, style={'backgroundColor': COLORS['background']})
+
+
+app.layout = serve_layout
+
+
+# Poll the change feed in the browser; only a new generation updates the store,
+# which in turn re-runs the callbacks that show stored data
+app.clientside_callback(
+    """
+    async function(n_intervals, current) {
+        const response = await fetch('/api/generation', {credentials: 'same-origin', cache: 'no-store'});
+        if (!response.ok) {
+            return window.dash_clientside.no_update;
+        }
+        const latest = await response.json();
+        if (current && current.generation === latest.generation) {
+            return window.dash_clientside.no_update;
+        }
+        return latest;
+    }
+    """,
+    Output('data-generation', 'data'),
+    Input('generation-poll', 'n_intervals'),
+    State('data-generation', 'data'),
+    prevent_initial_call=True
+)
+
+app.clientside_callback(
+    f"""
+    function(generation) {{
+        const updated = (generation && generation.updated_at) || 'never';
+        return 'Last updated: ' + updated + ' | Data retention: {Config.DATA_RETENTION_DAYS} days';
+    }}
+    """,
+    Output('last-updated', 'children'),
+    Input('data-generation', 'data'),
+    prevent_initial_call=True
+)
 
 
 # Callback for tab content
 @app.callback(
     Output("tab-content", "children"),
-    Input("tabs", "active_tab")
+    [Input("tabs", "active_tab"),
+     Input('data-generation', 'data')]
 )
-def render_tab_content(active_tab):
+@timed_callback
+def render_tab_content(active_tab, generation):
+    # On new data, only tabs that render stored data directly are rebuilt;
+    # the other tabs keep their filters and refresh through their own callbacks
+    if ctx.triggered_id == 'data-generation' and active_tab not in ("overview", "ipo"):
+        raise PreventUpdate
+
     if active_tab == "overview":
         return create_overview_tab()
     elif active_tab == "repeat":
@@ -106,10 +275,10 @@ def create_overview_tab():
     today = datetime.now().strftime('%Y-%m-%d')
 
     # Get today's data
-    gainers = db.get_data('top_gainers', days=1)
-    losers = db.get_data('top_losers', days=1)
-    traded = db.get_data('top_traded', days=1)
-    turnovers = db.get_data('top_turnovers', days=1)
+    gainers = load_data('top_gainers', days=1)
+    losers = load_data('top_losers', days=1)
+    traded = load_data('top_traded', days=1)
+    turnovers = load_data('top_turnovers', days=1)
 
     return dbc.Container([
         # Summary Cards
@@ -226,11 +395,11 @@ def create_repeat_analysis_tab():
                 dcc.Dropdown(
                     id='repeat-days',
                     options=[
-                        {'label': 'Last 7 days', 'value': 7},
-                        {'label': 'Last 14 days', 'value': 14},
-                        {'label': 'Last 30 days', 'value': 30},
-                        {'label': 'Last 60 days', 'value': 60},
-                        {'label': 'Last 90 days', 'value': 90},
+                        {'label': 'Last 7 trading days', 'value': 7},
+                        {'label': 'Last 14 trading days', 'value': 14},
+                        {'label': 'Last 30 trading days', 'value': 30},
+                        {'label': 'Last 60 trading days', 'value': 60},
+                        {'label': 'Last 90 trading days', 'value': 90},
                     ],
                     value=30,
                     clearable=False
@@ -261,13 +430,26 @@ def create_repeat_analysis_tab():
             ])
         ], className="mb-4"),
 
+        # Heatmap of symbol x trading day membership
+        dbc.Row([
+            dbc.Col([
+                dbc.Card([
+                    dbc.CardHeader(html.H5("🗓️ Membership Heatmap")),
+                    dbc.CardBody([
+                        dcc.Graph(id='repeat-heatmap', config={'displaylogo': False})
+                    ])
+                ])
+            ])
+        ], className="mb-4"),
+
         # Drill-down section
         dbc.Row([
             dbc.Col([
                 dbc.Card([
                     dbc.CardHeader(html.H5("📅 Date-wise Drill-down")),
                     dbc.CardBody([
-                        html.P("Click on a stock in the table above to see date-wise details", className="text-muted"),
+                        html.P("Click on a stock in the table above or a cell in the heatmap to see date-wise details",
+                               className="text-muted"),
                         html.Div(id='drilldown-content')
                     ])
                 ])
@@ -278,8 +460,6 @@ def create_repeat_analysis_tab():
 
 def create_broker_tab():
     """Broker Intelligence tab"""
-    brokers = db.get_data('top_brokers', days=30)
-
     return dbc.Container([
         dbc.Row([
             dbc.Col([
@@ -298,6 +478,7 @@ def create_broker_tab():
                         {'label': 'Last 30 days', 'value': 30},
                         {'label': 'Last 60 days', 'value': 60},
                         {'label': 'Last 90 days', 'value': 90},
+                        {'label': 'All available data', 'value': Config.DATA_RETENTION_DAYS},
                     ],
                     value=30,
                     clearable=False
@@ -310,6 +491,8 @@ def create_broker_tab():
                 dbc.Card([
                     dbc.CardHeader(html.H5("🏆 Top Brokers by Total Amount")),
                     dbc.CardBody([
+                        html.P("Loading broker data...", id='broker-loading',
+                               className="text-muted", style={'display': 'none'}),
                         html.Div(id='broker-results')
                     ])
                 ])
@@ -359,9 +542,20 @@ def create_lookup_tab():
         dbc.Row([
             dbc.Col([
                 dbc.Button("Search", id='lookup-button', color="primary", className="mb-4")
-            ])
+            ], width="auto"),
+            dbc.Col([
+                html.Progress(id='lookup-progress', value='0', max='5',
+                              style={'visibility': 'hidden', 'width': '100%', 'marginTop': '10px'})
+            ]),
         ]),
 
+        dbc.Row([
+            dbc.Col([
+                dcc.Graph(id='lookup-chart', style={'display': 'none'},
+                          config={'displaylogo': False})
+            ])
+        ], className="mb-4"),
+
         dbc.Row([
             dbc.Col([
                 html.Div(id='lookup-results')
@@ -372,7 +566,7 @@ def create_lookup_tab():
 
 def create_ipo_tab():
     """IPO Tracker tab"""
-    ipo_data = db.get_data('ipo_info', days=60)
+    ipo_data = load_data('ipo_info', days=60)
 
     return dbc.Container([
         dbc.Row([
@@ -468,20 +662,13 @@ def create_data_table(df, table_type):
     if not available_columns:
         return html.P("No data available", className="text-muted")
 
-    df_display = df[available_columns].head(10).copy()
-
-    # Format numbers
-    if 'change_percent' in df_display.columns:
-        df_display['change_percent'] = df_display['change_percent'].apply(lambda x: f"{x:.2f}%" if pd.notna(x) else "N/A")
-    if 'turnover' in df_display.columns:
-        df_display['turnover'] = df_display['turnover'].apply(lambda x: f"{x:,.0f}" if pd.notna(x) else "N/A")
-    if 'qty' in df_display.columns:
-        df_display['qty'] = df_display['qty'].apply(lambda x: f"{x:,}" if pd.notna(x) else "N/A")
+    df_display = df[available_columns].head(10)
 
     return dash_table.DataTable(
         data=df_display.to_dict('records'),
-        columns=[{"name": column_names[i] if i < len(column_names) else col, "id": col}
+        columns=[table_column(col, column_names[i] if i < len(column_names) else col)
                  for i, col in enumerate(available_columns)],
+        sort_action='native',
         style_cell={'textAlign': 'left', 'padding': '10px'},
         style_header={'backgroundColor': COLORS['primary'], 'color': 'white', 'fontWeight': 'bold'},
         style_data_conditional=[
@@ -526,27 +713,24 @@ def create_ipo_table(df):
     Output('repeat-results', 'children'),
     [Input('repeat-category', 'value'),
      Input('repeat-days', 'value'),
-     Input('repeat-min-occur', 'value')]
+     Input('repeat-min-occur', 'value'),
+     Input('data-generation', 'data')]
 )
-def update_repeat_analysis(category, days, min_occur):
-    df = db.get_repeat_analysis(category, days=days, min_occurrences=min_occur)
+@timed_callback
+def update_repeat_analysis(category, days, min_occur, generation):
+    df = load_repeat_analysis(category, days=days, min_occurrences=min_occur)
 
     if df.empty:
         return html.P(f"No stocks found with {min_occur}+ occurrences in the last {days} days", className="text-muted")
 
-    # Create interactive table
-    df_display = df.copy()
-    if 'avg_change' in df_display.columns:
-        df_display['avg_change'] = df_display['avg_change'].apply(lambda x: f"{x:.2f}%")
-    if 'max_change' in df_display.columns:
-        df_display['max_change'] = df_display['max_change'].apply(lambda x: f"{x:.2f}%")
-    if 'min_change' in df_display.columns:
-        df_display['min_change'] = df_display['min_change'].apply(lambda x: f"{x:.2f}%")
+    # Create interactive table (the raw GROUP_CONCAT dates are not displayed, so not sent)
+    df_display = df.drop(columns=['dates'], errors='ignore')
 
     return dash_table.DataTable(
         id='repeat-table',
         data=df_display.to_dict('records'),
-        columns=[{"name": col.replace('_', ' ').title(), "id": col} for col in df_display.columns if col != 'dates'],
+        columns=[table_column(col) for col in df_display.columns],
+        sort_action='native',
         style_cell={'textAlign': 'left', 'padding': '10px'},
         style_header={'backgroundColor': COLORS['primary'], 'color': 'white', 'fontWeight': 'bold'},
         style_data_conditional=[
@@ -566,41 +750,162 @@ def update_repeat_analysis(category, days, min_occur):
     )
 
 
-# Callback for Broker Analysis
+# Heatmap rows are capped so the chart stays readable
+HEATMAP_MAX_SYMBOLS = 50
+
+
 @app.callback(
-    Output('broker-results', 'children'),
-    Input('broker-days', 'value')
+    Output('repeat-heatmap', 'figure'),
+    [Input('repeat-category', 'value'),
+     Input('repeat-days', 'value'),
+     Input('repeat-min-occur', 'value'),
+     Input('data-generation', 'data')]
 )
-def update_broker_analysis(days):
-    df = db.get_data('top_brokers', days=days)
+@timed_callback
+def update_repeat_heatmap(category, days, min_occur, generation):
+    import plotly.graph_objs as go
+
+    matrix = load_membership_matrix(category, days=days)
+    keep = matrix['counts'] >= min_occur
+    symbols = matrix['symbols'][keep][:HEATMAP_MAX_SYMBOLS]
+    change = matrix['change'][keep][:HEATMAP_MAX_SYMBOLS]
+
+    fig = go.Figure()
+    if len(symbols):
+        fig.add_trace(go.Heatmap(
+            z=change,
+            x=matrix['dates'],
+            y=symbols,
+            colorscale='RdYlGn',
+            zmid=0,
+            hoverongaps=False,
+            colorbar={'title': 'Change %'},
+            hovertemplate='%{y} on %{x}: %{z:.2f}%<extra></extra>'
+        ))
+
+    fig.update_layout(
+        height=max(300, 22 * len(symbols) + 120),
+        margin={'l': 80, 'r': 20, 't': 30, 'b': 40},
+        yaxis={'autorange': 'reversed', 'type': 'category'},
+        xaxis={'type': 'category'},
+        annotations=[] if len(symbols) else [{
+            'text': f"No stocks with {min_occur}+ occurrences in the last {days} days",
+            'showarrow': False, 'xref': 'paper', 'yref': 'paper', 'x': 0.5, 'y': 0.5
+        }]
+    )
+    return fig
 
-    if df.empty:
-        return html.P("No broker data available", className="text-muted")
 
-    # Aggregate by broker
-    broker_summary = df.groupby('broker_no').agg({
-        'broker_name': 'first',
-        'buy_amount': 'sum',
-        'sell_amount': 'sum',
-        'total_amount': 'sum'
-    }).reset_index()
+def create_drilldown(matrix, symbol, clicked_date=None):
+    """Date-wise details for one symbol (and one day) from the cached matrix"""
+    matches = np.flatnonzero(matrix['symbols'] == symbol)
+    if not len(matches):
+        return html.P(f"No data for {symbol} in this window", className="text-muted")
+
+    row = matches[0]
+    present = matrix['present'][row]
+    symbol_days = pd.DataFrame({
+        'date': matrix['dates'][present],
+        'change_percent': matrix['change'][row][present],
+    }).sort_values('date', ascending=False)
+
+    output = [
+        html.H6(f"{symbol}: listed on {int(present.sum())} of {len(matrix['dates'])} trading days"),
+        dash_table.DataTable(
+            data=symbol_days.to_dict('records'),
+            columns=[table_column("date"), table_column("change_percent", "Change %")],
+            sort_action='native',
+            style_cell={'textAlign': 'left', 'padding': '8px'},
+            style_header={'backgroundColor': COLORS['primary'], 'color': 'white', 'fontWeight': 'bold'},
+            style_data_conditional=[
+                {'if': {'filter_query': f'{{date}} = "{clicked_date}"'}, 'backgroundColor': '#ffffcc'}
+            ] if clicked_date else [],
+            page_size=10
+        )
+    ]
+
+    if clicked_date is not None:
+        col = np.flatnonzero(matrix['dates'] == clicked_date)
+        if len(col):
+            on_day = matrix['present'][:, col[0]]
+            others = [s for s in matrix['symbols'][on_day] if s != symbol]
+            output.append(html.P(
+                f"Also listed on {clicked_date}: {', '.join(others) if others else 'none'}",
+                className="text-muted mt-3"
+            ))
+
+    return output
+
+
+# Heatmap clicks and table selections both read the cached matrix, so the
+# drill-down needs no further query
+@app.callback(
+    Output('drilldown-content', 'children'),
+    Input('repeat-heatmap', 'clickData'),
+    [State('repeat-category', 'value'),
+     State('repeat-days', 'value')],
+    prevent_initial_call=True
+)
+@timed_callback
+def drilldown_from_heatmap(click_data, category, days):
+    if not click_data or not click_data.get('points'):
+        raise PreventUpdate
+
+    point = click_data['points'][0]
+    matrix = load_membership_matrix(category, days=days)
+    return create_drilldown(matrix, point['y'], clicked_date=point['x'])
 
-    broker_summary = broker_summary.sort_values('total_amount', ascending=False).head(20)
 
-    # Format numbers
-    broker_summary['buy_amount'] = broker_summary['buy_amount'].apply(lambda x: f"{x:,.0f}")
-    broker_summary['sell_amount'] = broker_summary['sell_amount'].apply(lambda x: f"{x:,.0f}")
-    broker_summary['total_amount'] = broker_summary['total_amount'].apply(lambda x: f"{x:,.0f}")
+@app.callback(
+    Output('drilldown-content', 'children', allow_duplicate=True),
+    Input('repeat-table', 'selected_rows'),
+    [State('repeat-table', 'data'),
+     State('repeat-category', 'value'),
+     State('repeat-days', 'value')],
+    prevent_initial_call=True
+)
+@timed_callback
+def drilldown_from_table(selected_rows, rows, category, days):
+    if not selected_rows or not rows:
+        raise PreventUpdate
+
+    matrix = load_membership_matrix(category, days=days)
+    return create_drilldown(matrix, rows[selected_rows[0]]['symbol'])
+
+
+# Callback for Broker Analysis
+# Runs in the background; a new period selection cancels the job in flight
+@app.callback(
+    Output('broker-results', 'children'),
+    [Input('broker-days', 'value'),
+     Input('data-generation', 'data')],
+    background=True,
+    running=[
+        (Output('broker-loading', 'style'), {'display': 'block'}, {'display': 'none'}),
+    ]
+)
+@timed_callback
+def update_broker_analysis(days, generation):
+    # Aggregated and ranked in the database; only the top 20 rows come back
+    broker_summary = load_broker_rankings(days=days, limit=20)
+
+    if broker_summary.empty:
+        return html.P("No broker data available", className="text-muted")
 
     return dash_table.DataTable(
         data=broker_summary.to_dict('records'),
         columns=[
-            {"name": "Broker No", "id": "broker_no"},
-            {"name": "Broker Name", "id": "broker_name"},
-            {"name": "Buy Amount", "id": "buy_amount"},
-            {"name": "Sell Amount", "id": "sell_amount"},
-            {"name": "Total Amount", "id": "total_amount"},
+            table_column("rank", "#"),
+            table_column("broker_no", "Broker No"),
+            table_column("broker_name", "Broker Name"),
+            table_column("buy_amount", "Buy Amount"),
+            table_column("sell_amount", "Sell Amount"),
+            table_column("net_amount", "Net (Buy - Sell)"),
+            table_column("total_amount", "Total Amount"),
+            table_column("market_share", "Share %"),
+            table_column("days_active", "Days"),
         ],
+        sort_action='native',
         style_cell={'textAlign': 'left', 'padding': '10px'},
         style_header={'backgroundColor': COLORS['info'], 'color': 'white', 'fontWeight': 'bold'},
         style_data_conditional=[
@@ -614,13 +919,25 @@ def update_broker_analysis(days):
 
 
 # Callback for Stock Lookup
+# Runs in the background with per-table progress; editing the symbol or
+# period while a search is running cancels it
 @app.callback(
     Output('lookup-results', 'children'),
     [Input('lookup-button', 'n_clicks')],
     [State('stock-symbol', 'value'),
-     State('lookup-days', 'value')]
+     State('lookup-days', 'value')],
+    background=True,
+    running=[
+        (Output('lookup-button', 'disabled'), True, False),
+        (Output('lookup-progress', 'style'),
+         {'visibility': 'visible', 'width': '100%', 'marginTop': '10px'},
+         {'visibility': 'hidden', 'width': '100%', 'marginTop': '10px'}),
+    ],
+    progress=[Output('lookup-progress', 'value'), Output('lookup-progress', 'max')],
+    cancel=[Input('stock-symbol', 'value'), Input('lookup-days', 'value')]
 )
-def stock_lookup(n_clicks, symbol, days):
+@timed_callback
+def stock_lookup(set_progress, n_clicks, symbol, days):
     if not n_clicks or not symbol:
         return html.P("Enter a stock symbol and click Search", className="text-muted")
 
@@ -630,12 +947,14 @@ def stock_lookup(n_clicks, symbol, days):
     tables = ['top_gainers', 'top_losers', 'top_traded', 'top_turnovers', 'top_transactions']
     results = []
 
-    for table in tables:
-        df = db.get_data(table, days=days)
+    for i, table in enumerate(tables):
+        set_progress((str(i), str(len(tables))))
+        df = load_data(table, days=days)
         if not df.empty and 'symbol' in df.columns:
             stock_data = df[df['symbol'] == symbol]
             if not stock_data.empty:
                 results.append((table.replace('_', ' ').title(), stock_data))
+    set_progress((str(len(tables)), str(len(tables))))
 
     if not results:
         return dbc.Alert(f"No data found for symbol: {symbol}", color="warning")
@@ -659,48 +978,147 @@ def stock_lookup(n_clicks, symbol, days):
     return output
 
 
+# Callback for Stock Lookup price chart
+# Downsampled to Config.CHART_POINT_BUDGET points per trace; zooming re-fetches
+# just the visible range so detail increases as the window narrows
+@app.callback(
+    [Output('lookup-chart', 'figure'),
+     Output('lookup-chart', 'style')],
+    [Input('lookup-button', 'n_clicks'),
+     Input('lookup-chart', 'relayoutData')],
+    [State('stock-symbol', 'value'),
+     State('lookup-days', 'value')],
+    prevent_initial_call=True
+)
+@timed_callback
+def update_price_chart(n_clicks, relayout_data, symbol, days):
+    if not n_clicks or not symbol:
+        return {}, {'display': 'none'}
+
+    symbol = symbol.upper().strip()
+    x_range = None
+
+    if ctx.triggered_id == 'lookup-chart':
+        x_range = _zoom_range(relayout_data)
+        if x_range is None and not (relayout_data or {}).get('xaxis.autorange'):
+            raise PreventUpdate
+
+    if x_range:
+        history = db.get_symbol_history(symbol, start_date=x_range[0][:10], end_date=x_range[1][:10])
+    else:
+        history = db.get_symbol_history(symbol, days=days)
+
+    if history.empty:
+        return {}, {'display': 'none'}
+
+    return create_price_chart(history, symbol, x_range), {'display': 'block'}
+
+
+def _zoom_range(relayout_data):
+    """Extract the zoomed x-axis range from Plotly relayoutData, if any"""
+    if not relayout_data:
+        return None
+
+    for key, value in relayout_data.items():
+        if re.fullmatch(r'xaxis\d*\.range', key) and len(value) == 2:
+            return value[0], value[1]
+        if re.fullmatch(r'xaxis\d*\.range\[0\]', key):
+            end_key = key.replace('[0]', '[1]')
+            if end_key in relayout_data:
+                return value, relayout_data[end_key]
+
+    return None
+
+
+def create_price_chart(history, symbol, x_range=None):
+    """Create the LTP / turnover / change % chart for a symbol"""
+    # Plotly's figure classes are only needed once a chart is drawn
+    import plotly.graph_objs as go
+    from plotly.subplots import make_subplots
+
+    budget = Config.CHART_POINT_BUDGET
+
+    fig = make_subplots(
+        rows=3, cols=1, shared_xaxes=True, vertical_spacing=0.04,
+        row_heights=[0.5, 0.25, 0.25],
+        subplot_titles=("LTP", "Turnover", "Change %")
+    )
+
+    dates, ltp = downsample_series(history['date'], history['ltp'], budget)
+    fig.add_trace(go.Scatter(x=dates, y=ltp, mode='lines', name='LTP',
+                             line={'color': COLORS['primary']}), row=1, col=1)
+
+    dates, turnover = downsample_series(history['date'], history['turnover'], budget, method='minmax')
+    fig.add_trace(go.Bar(x=dates, y=turnover, name='Turnover',
+                         marker_color=COLORS['warning']), row=2, col=1)
+
+    dates, change = downsample_series(history['date'], history['change_percent'], budget)
+    fig.add_trace(go.Bar(x=dates, y=change, name='Change %',
+                         marker_color=[COLORS['success'] if c >= 0 else COLORS['danger'] for c in change]),
+                  row=3, col=1)
+
+    fig.update_layout(
+        title=f"{symbol} price history ({len(history)} trading days)",
+        height=650,
+        showlegend=False,
+        margin={'l': 40, 'r': 20, 't': 60, 'b': 30},
+        # Keep the user's zoom across re-fetches of the same symbol
+        uirevision=symbol
+    )
+    if x_range:
+        fig.update_xaxes(range=list(x_range))
+
+    return fig
+
+
 # Callbacks for Signals tab
 @app.callback(
     Output('hot-stocks-signal', 'children'),
-    Input('tabs', 'active_tab')
+    [Input('tabs', 'active_tab'),
+     Input('data-generation', 'data')]
 )
-def update_hot_stocks(active_tab):
+@timed_callback
+def update_hot_stocks(active_tab, generation):
     if active_tab != 'signals':
         return ""
 
-    df = db.get_repeat_analysis('top_gainers', days=7, min_occurrences=3)
+    df = load_repeat_analysis('top_gainers', days=7, min_occurrences=3)
 
     if df.empty:
-        return html.P("No hot stocks detected in the last 7 days", className="text-muted")
+        return html.P("No hot stocks detected in the last 7 trading days", className="text-muted")
 
     return create_signal_table(df, 'success')
 
 
 @app.callback(
     Output('danger-stocks-signal', 'children'),
-    Input('tabs', 'active_tab')
+    [Input('tabs', 'active_tab'),
+     Input('data-generation', 'data')]
 )
-def update_danger_stocks(active_tab):
+@timed_callback
+def update_danger_stocks(active_tab, generation):
     if active_tab != 'signals':
         return ""
 
-    df = db.get_repeat_analysis('top_losers', days=7, min_occurrences=3)
+    df = load_repeat_analysis('top_losers', days=7, min_occurrences=3)
 
     if df.empty:
-        return html.P("No danger stocks detected in the last 7 days", className="text-muted")
+        return html.P("No danger stocks detected in the last 7 trading days", className="text-muted")
 
     return create_signal_table(df, 'danger')
 
 
 @app.callback(
     Output('active-stocks-signal', 'children'),
-    Input('tabs', 'active_tab')
+    [Input('tabs', 'active_tab'),
+     Input('data-generation', 'data')]
 )
-def update_active_stocks(active_tab):
+@timed_callback
+def update_active_stocks(active_tab, generation):
     if active_tab != 'signals':
         return ""
 
-    df = db.get_repeat_analysis('top_traded', days=7, min_occurrences=3)
+    df = load_repeat_analysis('top_traded', days=7, min_occurrences=3)
 
     if df.empty:
         return html.P("No highly active stocks detected", className="text-muted")
@@ -710,17 +1128,14 @@ def update_active_stocks(active_tab):
 
 def create_signal_table(df, color):
     """Create signal table with color coding"""
-    df_display = df.copy()
-
-    if 'avg_change' in df_display.columns:
-        df_display['avg_change'] = df_display['avg_change'].apply(lambda x: f"{x:.2f}%")
+    df_display = df.drop(columns=['dates'], errors='ignore').head(10)
 
     color_map = {'success': '#27ae60', 'danger': '#e74c3c', 'info': '#16a085'}
 
     return dash_table.DataTable(
-        data=df_display.head(10).to_dict('records'),
-        columns=[{"name": col.replace('_', ' ').title(), "id": col}
-                 for col in df_display.columns if col != 'dates'],
+        data=df_display.to_dict('records'),
+        columns=[table_column(col) for col in df_display.columns],
+        sort_action='native',
         style_cell={'textAlign': 'left', 'padding': '10px'},
         style_header={'backgroundColor': color_map.get(color, COLORS['primary']),
                      'color': 'white', 'fontWeight': 'bold'},
@@ -2,167 +2,81 @@ import sqlite3
 import pandas as pd
 from datetime import datetime, timedelta
 from config import Config
+from metrics import timed_methods, ROWS_WRITTEN
+from trading_calendar import TradingCalendar
+from events import EventBus, RowsCommitted
+from schema import migrate
 import os
 import logging
+import threading
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class NepseDatabase:
-    def __init__(self):
-        self.db_path = Config.DATABASE_PATH
-        self._ensure_db_directory()
-        self._init_database()
+# Shared instances handed out by get_database(), one per database file
+_instances = {}
+_instances_lock = threading.Lock()
 
-    def _ensure_db_directory(self):
-        """Create data directory if it doesn't exist"""
-        db_dir = os.path.dirname(self.db_path)
-        if db_dir and not os.path.exists(db_dir):
-            os.makedirs(db_dir)
-            logger.info(f"Created database directory: {db_dir}")
 
-    def _init_database(self):
-        """Initialize database with required tables"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+def get_database(db_path=None):
+    """
+    The process-wide NepseDatabase for a database file (default:
+    Config.DATABASE_PATH), created and migrated on first use.
 
-        # Top Gainers table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS top_gainers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                date DATE NOT NULL,
-                symbol TEXT NOT NULL,
-                ltp REAL,
-                change_percent REAL,
-                high REAL,
-                low REAL,
-                open REAL,
-                qty INTEGER,
-                turnover REAL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(date, symbol)
-            )
-        ''')
+    Subsystems in one process (dashboard, scheduler, email alerts) should use
+    this rather than NepseDatabase() so they share its event bus, trading
+    calendar and cached column types.
+    """
+    path = os.path.abspath(db_path or Config.DATABASE_PATH)
+    with _instances_lock:
+        db = _instances.get(path)
+        if db is None:
+            db = _instances[path] = NepseDatabase(db_path)
+    return db
 
-        # Top Losers table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS top_losers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                date DATE NOT NULL,
-                symbol TEXT NOT NULL,
-                ltp REAL,
-                change_percent REAL,
-                high REAL,
-                low REAL,
-                open REAL,
-                qty INTEGER,
-                turnover REAL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(date, symbol)
-            )
-        ''')
 
-        # Top Traded table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS top_traded (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                date DATE NOT NULL,
-                symbol TEXT NOT NULL,
-                qty INTEGER,
-                ltp REAL,
-                change_percent REAL,
-                turnover REAL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(date, symbol)
-            )
-        ''')
+@timed_methods
+class NepseDatabase:
+    # Category tables keyed by (date, symbol)
+    SYMBOL_TABLES = ['top_gainers', 'top_losers', 'top_traded', 'top_turnovers', 'top_transactions']
 
-        # Top Turnovers table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS top_turnovers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                date DATE NOT NULL,
-                symbol TEXT NOT NULL,
-                turnover REAL,
-                ltp REAL,
-                change_percent REAL,
-                qty INTEGER,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(date, symbol)
-            )
-        ''')
+    # Natural key of each category table (its UNIQUE constraint)
+    UNIQUE_KEYS = dict(
+        {table: ('date', 'symbol') for table in SYMBOL_TABLES},
+        top_brokers=('date', 'broker_no'),
+        ipo_info=('date_scraped', 'company_name', 'opening_date'),
+    )
 
-        # Top Transactions table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS top_transactions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                date DATE NOT NULL,
-                symbol TEXT NOT NULL,
-                transactions INTEGER,
-                ltp REAL,
-                change_percent REAL,
-                qty INTEGER,
-                turnover REAL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(date, symbol)
-            )
-        ''')
+    def __init__(self, db_path=None):
+        self.db_path = db_path or Config.DATABASE_PATH
+        self._ensure_db_directory()
 
-        # Top Brokers table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS top_brokers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                date DATE NOT NULL,
-                broker_no TEXT NOT NULL,
-                broker_name TEXT,
-                buy_contracts INTEGER,
-                buy_amount REAL,
-                sell_contracts INTEGER,
-                sell_amount REAL,
-                total_amount REAL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(date, broker_no)
-            )
-        ''')
+        # Applies pending migrations; a single query when the schema is current
+        self.schema_version = migrate(self.db_path)
 
-        # IPO Information table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS ipo_info (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                date_scraped DATE NOT NULL,
-                company_name TEXT NOT NULL,
-                scrip TEXT,
-                opening_date DATE,
-                closing_date DATE,
-                issue_manager TEXT,
-                shares_offered INTEGER,
-                price_per_share REAL,
-                min_units INTEGER,
-                max_units INTEGER,
-                status TEXT,
-                remarks TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(date_scraped, company_name, opening_date)
-            )
-        ''')
+        self._calendar = None
+        self._column_types = {}
 
-        # Scraper log table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS scraper_log (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                scrape_date DATE NOT NULL,
-                scrape_time TIME NOT NULL,
-                status TEXT NOT NULL,
-                categories_scraped TEXT,
-                records_added INTEGER,
-                error_message TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+        # Post-commit hooks: RowsCommitted after every insert/upsert (see events.py)
+        self.events = EventBus()
 
-        conn.commit()
-        conn.close()
-        logger.info("Database initialized successfully")
+    @property
+    def calendar(self):
+        """Trading calendar that learns closures from this database"""
+        if self._calendar is None:
+            self._calendar = TradingCalendar(self)
+        return self._calendar
+
+    def _ensure_db_directory(self):
+        """Create data directory if it doesn't exist"""
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+            logger.info(f"Created database directory: {db_dir}")
+
+    @staticmethod
+    def date_column(table_name):
+        """Name of a table's scrape date column (ipo_info uses date_scraped)"""
+        return 'date_scraped' if table_name == 'ipo_info' else 'date'
 
     def insert_data(self, table_name, df, date):
         """Insert data into specified table"""
@@ -171,7 +85,7 @@ class NepseDatabase:
             return 0
 
         conn = sqlite3.connect(self.db_path)
-        df['date'] = date
+        df[self.date_column(table_name)] = date
 
         try:
             # Insert or replace to handle duplicates
@@ -179,6 +93,8 @@ class NepseDatabase:
             rows_added = len(df)
             logger.info(f"Inserted {rows_added} rows into {table_name}")
             conn.commit()
+            ROWS_WRITTEN.labels(table=table_name).inc(rows_added)
+            self.events.emit(RowsCommitted(table_name, date, df))
             return rows_added
         except sqlite3.IntegrityError:
             # Handle duplicates by updating
@@ -187,25 +103,187 @@ class NepseDatabase:
         finally:
             conn.close()
 
+    def upsert_data(self, table_name, df, date):
+        """
+        Insert rows into a category table, updating rows already stored for
+        the same key (e.g. when a scrape is re-run on the same day).
+
+        Columns the table doesn't have are ignored.
+
+        Returns:
+            Number of rows written
+        """
+        if df is None or df.empty:
+            logger.warning(f"No data to upsert for {table_name}")
+            return 0
+
+        date_column = self.date_column(table_name)
+        df = df.assign(**{date_column: date})
+
+        table_columns = self.get_column_types(table_name)
+        columns = [col for col in df.columns if col in table_columns and col not in ('id', 'created_at')]
+        key = self.UNIQUE_KEYS[table_name]
+        updates = ', '.join(f"{col} = excluded.{col}" for col in columns if col not in key)
+
+        query = f'''
+            INSERT INTO {table_name} ({', '.join(columns)})
+            VALUES ({', '.join('?' * len(columns))})
+            ON CONFLICT({', '.join(key)}) DO {f'UPDATE SET {updates}' if updates else 'NOTHING'}
+        '''
+
+        # Plain Python values (None for NaN) for the sqlite3 driver
+        values = df[columns].astype(object)
+        values = values.where(values.notna(), None)
+
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.executemany(query, values.itertuples(index=False, name=None))
+            conn.commit()
+        finally:
+            conn.close()
+
+        ROWS_WRITTEN.labels(table=table_name).inc(len(df))
+        logger.info(f"Upserted {len(df)} rows into {table_name}")
+        self.events.emit(RowsCommitted(table_name, date, df))
+        return len(df)
+
     def get_data(self, table_name, days=None):
         """Retrieve data from specified table"""
         conn = sqlite3.connect(self.db_path)
+        date_column = self.date_column(table_name)
 
         if days:
             cutoff_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
-            query = f"SELECT * FROM {table_name} WHERE date >= ? ORDER BY date DESC"
+            query = f"SELECT * FROM {table_name} WHERE {date_column} >= ? ORDER BY {date_column} DESC"
             df = pd.read_sql_query(query, conn, params=(cutoff_date,))
         else:
-            query = f"SELECT * FROM {table_name} ORDER BY date DESC"
+            query = f"SELECT * FROM {table_name} ORDER BY {date_column} DESC"
             df = pd.read_sql_query(query, conn)
 
         conn.close()
         return df
 
+    def get_symbol_history(self, symbol, days=None, start_date=None, end_date=None):
+        """
+        Get the daily LTP, turnover and change % of a symbol across all
+        category tables, one row per date.
+
+        Args:
+            symbol: Stock symbol
+            days: Only include the last N days (ignored if start_date is given)
+            start_date: Optional inclusive lower bound (YYYY-MM-DD)
+            end_date: Optional inclusive upper bound (YYYY-MM-DD)
+
+        Returns:
+            DataFrame with columns date, ltp, change_percent, turnover
+        """
+        if start_date is None and days:
+            start_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+
+        query, params = self._symbol_history_query(symbol, start_date, end_date)
+
+        conn = sqlite3.connect(self.db_path)
+        df = pd.read_sql_query(query, conn, params=params)
+        conn.close()
+        return df
+
+    def _symbol_history_query(self, symbol, start_date=None, end_date=None):
+        """Build the per-date symbol history query across all category tables"""
+        conditions = ['symbol = ?']
+        params = [symbol]
+        if start_date:
+            conditions.append('date >= ?')
+            params.append(start_date)
+        if end_date:
+            conditions.append('date <= ?')
+            params.append(end_date)
+        where = ' AND '.join(conditions)
+
+        union = ' UNION ALL '.join(
+            f"SELECT date, ltp, change_percent, turnover FROM {table} WHERE {where}"
+            for table in self.SYMBOL_TABLES
+        )
+        query = f'''
+            SELECT date,
+                   MAX(ltp) as ltp,
+                   MAX(change_percent) as change_percent,
+                   MAX(turnover) as turnover
+            FROM ({union})
+            GROUP BY date
+            ORDER BY date
+        '''
+        return query, params * len(self.SYMBOL_TABLES)
+
+    def iter_query(self, query, params=(), chunk_size=5000):
+        """
+        Run a query and yield its rows in chunks straight from the cursor,
+        so arbitrarily large results are never held in memory at once.
+
+        Yields:
+            (columns, rows) tuples where rows is a list of at most chunk_size
+            tuples; an empty result yields (columns, []) once, so writers can
+            still emit a header or schema
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.execute(query, params)
+            columns = [description[0] for description in cursor.description]
+            rows = cursor.fetchmany(chunk_size)
+            while True:
+                yield columns, rows
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+        finally:
+            conn.close()
+
+    def iter_table(self, table_name, start_date=None, end_date=None, symbol=None, chunk_size=5000):
+        """
+        Stream rows of a category table for an optional date range / symbol.
+
+        Yields:
+            (columns, rows) chunks, see iter_query
+        """
+        date_column = self.date_column(table_name)
+        conditions = []
+        params = []
+        if start_date:
+            conditions.append(f'{date_column} >= ?')
+            params.append(start_date)
+        if end_date:
+            conditions.append(f'{date_column} <= ?')
+            params.append(end_date)
+        if symbol and table_name in self.SYMBOL_TABLES:
+            conditions.append('symbol = ?')
+            params.append(symbol)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        query = f"SELECT * FROM {table_name} {where} ORDER BY {date_column}, id"
+        return self.iter_query(query, params, chunk_size)
+
+    def iter_symbol_history(self, symbol, start_date=None, end_date=None, chunk_size=5000):
+        """Stream the per-date history of a symbol (see get_symbol_history)"""
+        query, params = self._symbol_history_query(symbol, start_date, end_date)
+        return self.iter_query(query, params, chunk_size)
+
+    def get_column_types(self, table_name):
+        """Return {column: declared SQLite type} for a table"""
+        # The schema only changes through migrations, which run before any
+        # instance exists, so each table is looked up once
+        column_types = self._column_types.get(table_name)
+        if column_types is None:
+            conn = sqlite3.connect(self.db_path)
+            rows = conn.execute(f"PRAGMA table_info({table_name})").fetchall()
+            conn.close()
+            column_types = {row[1]: row[2].upper() for row in rows}
+            if column_types:
+                self._column_types[table_name] = column_types
+        return dict(column_types)
+
     def get_repeat_analysis(self, table_name, days=30, min_occurrences=2):
-        """Get stocks that appear multiple times in the specified table"""
+        """Get stocks that appear multiple times in the specified table over the last `days` trading days"""
         conn = sqlite3.connect(self.db_path)
-        cutoff_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+        cutoff_date = self.calendar.window_start(days)
 
         query = f'''
             SELECT
@@ -227,6 +305,83 @@ class NepseDatabase:
         conn.close()
         return df
 
+    def get_broker_rankings(self, days=None, limit=20):
+        """
+        Rank brokers by total traded amount, aggregated in SQL.
+
+        Args:
+            days: Only include the last N days (None for all stored data)
+            limit: Number of top brokers to return
+
+        Returns:
+            DataFrame with rank, broker_no, broker_name, buy/sell/total amounts,
+            net_amount (buy - sell), market_share (% of all brokers' total in
+            the window) and days_active, ordered by total_amount
+        """
+        conn = sqlite3.connect(self.db_path)
+
+        where = ''
+        params = []
+        if days:
+            cutoff_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+            where = 'WHERE date >= ?'
+            params.append(cutoff_date)
+
+        query = f'''
+            WITH totals AS (
+                SELECT
+                    broker_no,
+                    MAX(broker_name) as broker_name,
+                    SUM(buy_amount) as buy_amount,
+                    SUM(sell_amount) as sell_amount,
+                    SUM(total_amount) as total_amount,
+                    COUNT(DISTINCT date) as days_active
+                FROM top_brokers
+                {where}
+                GROUP BY broker_no
+            )
+            SELECT
+                RANK() OVER (ORDER BY total_amount DESC) as rank,
+                broker_no,
+                broker_name,
+                buy_amount,
+                sell_amount,
+                total_amount,
+                buy_amount - sell_amount as net_amount,
+                100.0 * total_amount / SUM(total_amount) OVER () as market_share,
+                days_active
+            FROM totals
+            ORDER BY total_amount DESC
+            LIMIT ?
+        '''
+        params.append(limit)
+
+        df = pd.read_sql_query(query, conn, params=params)
+        conn.close()
+        return df
+
+    def get_membership(self, table_name, days=30):
+        """
+        Get every (symbol, date, change_percent) row of a category table in
+        the last `days` trading days, the raw material for the symbol x date
+        membership matrix.
+
+        Returns:
+            DataFrame with columns symbol, date, change_percent
+        """
+        conn = sqlite3.connect(self.db_path)
+        cutoff_date = self.calendar.window_start(days)
+
+        query = f'''
+            SELECT symbol, date, change_percent
+            FROM {table_name}
+            WHERE date >= ?
+        '''
+
+        df = pd.read_sql_query(query, conn, params=(cutoff_date,))
+        conn.close()
+        return df
+
     def cleanup_old_data(self):
         """Remove data older than retention period"""
         conn = sqlite3.connect(self.db_path)
@@ -239,18 +394,153 @@ class NepseDatabase:
 
         total_deleted = 0
         for table in tables:
-            cursor.execute(f"DELETE FROM {table} WHERE date < ?", (cutoff_date,))
+            cursor.execute(f"DELETE FROM {table} WHERE {self.date_column(table)} < ?", (cutoff_date,))
             deleted = cursor.rowcount
             total_deleted += deleted
             logger.info(f"Deleted {deleted} old records from {table}")
 
+        # Maintenance history is kept for the same period
+        for table in ('maintenance_log', 'db_object_sizes'):
+            cursor.execute(f"DELETE FROM {table} WHERE created_at < ?", (cutoff_date,))
+
         conn.commit()
         conn.close()
         logger.info(f"Total {total_deleted} old records deleted")
         return total_deleted
 
-    def log_scrape(self, status, categories_scraped, records_added, error_message=None):
-        """Log scraping activity"""
+    def get_storage_info(self):
+        """
+        File-level storage figures.
+
+        Returns:
+            Dict with page_size, page_count, freelist_count, auto_vacuum
+            (0 none, 1 full, 2 incremental), file_bytes and wal_bytes
+        """
+        conn = sqlite3.connect(self.db_path)
+        info = {pragma: conn.execute(f"PRAGMA {pragma}").fetchone()[0]
+                for pragma in ('page_size', 'page_count', 'freelist_count', 'auto_vacuum')}
+        conn.close()
+
+        wal_path = f"{self.db_path}-wal"
+        info['file_bytes'] = os.path.getsize(self.db_path)
+        info['wal_bytes'] = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+        return info
+
+    def enable_incremental_vacuum(self):
+        """
+        Switch an existing database to auto_vacuum=INCREMENTAL. Needs a full
+        VACUUM (rewrites the file, holds an exclusive lock), so run it off-peak.
+        """
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        conn.execute('VACUUM')
+        conn.close()
+
+    def incremental_vacuum(self, pages=None):
+        """Return up to `pages` free pages (all by default) to the filesystem"""
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        conn.execute(f"PRAGMA incremental_vacuum({int(pages)})" if pages else 'PRAGMA incremental_vacuum')
+        conn.close()
+
+    def analyze(self):
+        """Refresh the query planner's statistics, then let SQLite apply its own optimizations"""
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        conn.execute('ANALYZE')
+        conn.execute('PRAGMA optimize')
+        conn.close()
+
+    def integrity_check(self):
+        """
+        Returns:
+            List of problems found (empty if the database is sound)
+        """
+        conn = sqlite3.connect(self.db_path)
+        rows = [row[0] for row in conn.execute('PRAGMA integrity_check').fetchall()]
+        conn.close()
+        return [] if rows == ['ok'] else rows
+
+    def checkpoint_wal(self):
+        """
+        Copy the WAL into the database and truncate it.
+
+        Returns:
+            (busy, wal frames, frames checkpointed); busy=1 means readers kept
+            the checkpoint from completing
+        """
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        result = conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+        conn.close()
+        return tuple(result)
+
+    def get_object_sizes(self):
+        """
+        Size of every table and index (from dbstat when SQLite has it) and the
+        row count of every table.
+
+        Returns:
+            DataFrame with name, type, table_name, row_count, size_bytes
+        """
+        conn = sqlite3.connect(self.db_path)
+        objects = pd.read_sql_query('''
+            SELECT name, type, tbl_name AS table_name FROM sqlite_master
+            WHERE type IN ('table', 'index') AND name NOT LIKE 'sqlite_%'
+        ''', conn)
+
+        try:
+            sizes = dict(conn.execute('SELECT name, SUM(pgsize) FROM dbstat GROUP BY name').fetchall())
+        except sqlite3.OperationalError:
+            # SQLite built without the dbstat virtual table
+            sizes = {}
+        objects['size_bytes'] = objects['name'].map(sizes).astype('Int64')
+
+        counts = {name: conn.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0]
+                  for name in objects.loc[objects['type'] == 'table', 'name']}
+        objects['row_count'] = objects['name'].map(counts).astype('Int64')
+        conn.close()
+        return objects
+
+    def log_maintenance(self, run_id, step, status, duration_ms, details=None):
+        """Record one maintenance step"""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('''
+            INSERT INTO maintenance_log (run_id, step, status, duration_ms, details)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (run_id, step, status, duration_ms, details))
+        conn.commit()
+        conn.close()
+
+    def record_object_sizes(self, run_id, sizes):
+        """Store a get_object_sizes() sample"""
+        rows = sizes[['name', 'type', 'table_name', 'row_count', 'size_bytes']].astype(object)
+        rows = rows.where(rows.notna(), None)
+
+        conn = sqlite3.connect(self.db_path)
+        conn.executemany('''
+            INSERT INTO db_object_sizes (run_id, name, type, table_name, row_count, size_bytes)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [(run_id,) + tuple(row) for row in rows.itertuples(index=False, name=None)])
+        conn.commit()
+        conn.close()
+
+    def get_maintenance_log(self, runs=5):
+        """Steps of the most recent maintenance runs"""
+        conn = sqlite3.connect(self.db_path)
+        df = pd.read_sql_query('''
+            SELECT * FROM maintenance_log
+            WHERE run_id IN (SELECT DISTINCT run_id FROM maintenance_log ORDER BY run_id DESC LIMIT ?)
+            ORDER BY id
+        ''', conn, params=(runs,))
+        conn.close()
+        return df
+
+    def log_scrape(self, status, categories_scraped, records_added, error_message=None, scrape_date=None):
+        """
+        Log scraping activity
+
+        Args:
+            scrape_date: Trading day the entry is for (default: today); backfill
+                uses it to record recovered days
+        """
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
 
@@ -259,12 +549,392 @@ class NepseDatabase:
             INSERT INTO scraper_log (scrape_date, scrape_time, status, categories_scraped,
                                      records_added, error_message)
             VALUES (?, ?, ?, ?, ?, ?)
-        ''', (now.strftime('%Y-%m-%d'), now.strftime('%H:%M:%S'), status,
+        ''', (scrape_date or now.strftime('%Y-%m-%d'), now.strftime('%H:%M:%S'), status,
               ','.join(categories_scraped), records_added, error_message))
 
         conn.commit()
         conn.close()
 
+    def get_learned_closures(self):
+        """
+        Days the scraper found the market closed (data unchanged from the
+        previous session). A day that has stored rows traded, whatever a
+        later re-run logged, so it is never a closure.
+        """
+        conn = sqlite3.connect(self.db_path)
+        stored = ' UNION '.join(f"SELECT date FROM {table}" for table in self.SYMBOL_TABLES)
+        rows = conn.execute(f'''
+            SELECT DISTINCT scrape_date FROM scraper_log
+            WHERE status = 'skipped' AND error_message LIKE 'Market closed - data unchanged%'
+              AND scrape_date NOT IN ({stored})
+        ''').fetchall()
+        conn.close()
+        return [row[0] for row in rows]
+
+    def get_covered_dates(self, start_date=None):
+        """
+        Days that need no scrape: days with stored data in any symbol table,
+        plus days the scraper logged as skipped (market closed).
+
+        Returns:
+            Sorted list of YYYY-MM-DD strings
+        """
+        conn = sqlite3.connect(self.db_path)
+        start_date = start_date or '0000-00-00'
+        queries = [f"SELECT DISTINCT date FROM {table} WHERE date >= ?" for table in self.SYMBOL_TABLES]
+        queries.append("SELECT DISTINCT scrape_date FROM scraper_log WHERE scrape_date >= ? AND status = 'skipped'")
+        rows = conn.execute(' UNION '.join(queries), (start_date,) * len(queries)).fetchall()
+        conn.close()
+        return sorted(row[0] for row in rows)
+
+    def bump_data_generation(self):
+        """
+        Increment the data generation counter after new data is committed.
+        Dashboards poll this to know when their view is stale.
+
+        Returns:
+            The new generation number
+        """
+        conn = sqlite3.connect(self.db_path)
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        conn.execute('''
+            INSERT INTO app_state (key, value, updated_at) VALUES ('data_generation', '1', ?)
+            ON CONFLICT(key) DO UPDATE SET
+                value = CAST(value AS INTEGER) + 1,
+                updated_at = excluded.updated_at
+        ''', (now,))
+        conn.commit()
+        generation = conn.execute(
+            "SELECT CAST(value AS INTEGER) FROM app_state WHERE key = 'data_generation'"
+        ).fetchone()[0]
+        conn.close()
+        logger.info(f"Data generation is now {generation}")
+        return generation
+
+    def get_data_generation(self):
+        """
+        Get the current data generation.
+
+        Returns:
+            Tuple of (generation, updated_at); (0, None) before the first scrape
+        """
+        conn = sqlite3.connect(self.db_path)
+        row = conn.execute(
+            "SELECT CAST(value AS INTEGER), updated_at FROM app_state WHERE key = 'data_generation'"
+        ).fetchone()
+        conn.close()
+        return (row[0], row[1]) if row else (0, None)
+
+    def enqueue_email(self, dedup_key, recipient, subject, html_body, text_body=None):
+        """
+        Add a rendered email to the outbox.
+
+        Returns:
+            The outbox id, or None if a message with the same dedup_key exists
+        """
+        conn = sqlite3.connect(self.db_path)
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        cursor = conn.execute('''
+            INSERT OR IGNORE INTO email_outbox
+                (dedup_key, recipient, subject, html_body, text_body, next_attempt_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (dedup_key, recipient, subject, html_body, text_body, now))
+        conn.commit()
+        outbox_id = cursor.lastrowid if cursor.rowcount else None
+        conn.close()
+        return outbox_id
+
+    def enqueue_emails(self, messages):
+        """
+        Add many rendered emails to the outbox in one transaction.
+
+        Args:
+            messages: Iterable of (dedup_key, recipient, subject, html_body, text_body)
+
+        Returns:
+            Number of messages queued (duplicates are skipped)
+        """
+        conn = sqlite3.connect(self.db_path)
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        before = conn.total_changes
+        conn.executemany('''
+            INSERT OR IGNORE INTO email_outbox
+                (dedup_key, recipient, subject, html_body, text_body, next_attempt_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (tuple(message) + (now,) for message in messages))
+        conn.commit()
+        queued = conn.total_changes - before
+        conn.close()
+        return queued
+
+    def get_due_emails(self, limit=50):
+        """
+        Get outbox messages whose next attempt is due: pending ones, and ones
+        whose sender claimed them but never finished (its claim has expired)
+        """
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        rows = conn.execute('''
+            SELECT * FROM email_outbox
+            WHERE status IN ('pending', 'sending') AND next_attempt_at <= ?
+            ORDER BY next_attempt_at, id
+            LIMIT ?
+        ''', (now, limit)).fetchall()
+        conn.close()
+        return [dict(row) for row in rows]
+
+    def claim_email(self, outbox_id, claim_seconds=600):
+        """
+        Take a due message for sending, so no other process sends it too.
+        The claim lapses after `claim_seconds` if the attempt is never recorded.
+
+        Returns:
+            True if this caller got the message
+        """
+        now = datetime.now()
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.execute('''
+            UPDATE email_outbox
+            SET status = 'sending', next_attempt_at = ?
+            WHERE id = ? AND status IN ('pending', 'sending') AND next_attempt_at <= ?
+        ''', ((now + timedelta(seconds=claim_seconds)).strftime('%Y-%m-%d %H:%M:%S'), outbox_id,
+              now.strftime('%Y-%m-%d %H:%M:%S')))
+        conn.commit()
+        claimed = cursor.rowcount == 1
+        conn.close()
+        return claimed
+
+    def record_email_attempt(self, outbox_id, attempt, sent, duration_ms,
+                             error_message=None, next_attempt_at=None):
+        """
+        Record the outcome of one delivery attempt.
+
+        A failed attempt with next_attempt_at is rescheduled; without it the
+        message is marked failed for good.
+        """
+        conn = sqlite3.connect(self.db_path)
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+        if sent:
+            conn.execute('''
+                UPDATE email_outbox
+                SET status = 'sent', attempts = ?, sent_at = ?, last_error = NULL
+                WHERE id = ?
+            ''', (attempt, now, outbox_id))
+        else:
+            conn.execute('''
+                UPDATE email_outbox
+                SET status = ?, attempts = ?, last_error = ?, next_attempt_at = COALESCE(?, next_attempt_at)
+                WHERE id = ?
+            ''', ('pending' if next_attempt_at else 'failed', attempt, error_message,
+                  next_attempt_at, outbox_id))
+
+        conn.execute('''
+            INSERT INTO email_delivery_log (outbox_id, attempt, status, error_message, duration_ms)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (outbox_id, attempt, 'sent' if sent else 'error', error_message, duration_ms))
+
+        conn.commit()
+        conn.close()
+
+    def get_outbox_status(self):
+        """Count outbox messages by status"""
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute("SELECT status, COUNT(*) FROM email_outbox GROUP BY status").fetchall()
+        conn.close()
+        return dict(rows)
+
+    def add_subscriber(self, email, name=None, watchlist=None, min_change=None, alert_types=None):
+        """
+        Add a subscriber, or update and re-activate an existing one.
+
+        Args:
+            email: Recipient address
+            name: Optional display name
+            watchlist: Comma-separated symbols (None for every symbol)
+            min_change: Minimum absolute change % for a row to be included
+            alert_types: Comma-separated alert types (None for all)
+        """
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('''
+            INSERT INTO subscribers (email, name, watchlist, min_change, alert_types, active)
+            VALUES (?, ?, ?, ?, ?, 1)
+            ON CONFLICT(email) DO UPDATE SET
+                name = excluded.name,
+                watchlist = excluded.watchlist,
+                min_change = excluded.min_change,
+                alert_types = excluded.alert_types,
+                active = 1
+        ''', (email, name, watchlist, min_change, alert_types))
+        conn.commit()
+        conn.close()
+        logger.info(f"Subscriber saved: {email}")
+
+    def deactivate_subscriber(self, email):
+        """
+        Stop sending alerts to a subscriber.
+
+        Returns:
+            True if the subscriber existed
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.execute("UPDATE subscribers SET active = 0 WHERE email = ?", (email,))
+        conn.commit()
+        conn.close()
+        return cursor.rowcount > 0
+
+    def get_subscribers(self, active_only=True):
+        """Get subscribers as a list of dicts"""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        query = "SELECT * FROM subscribers"
+        if active_only:
+            query += " WHERE active = 1"
+        rows = conn.execute(query + " ORDER BY id").fetchall()
+        conn.close()
+        return [dict(row) for row in rows]
+
+    def add_alert_rule(self, name, category, conditions=None, min_occurrences=None,
+                       window_days=None, symbols=None):
+        """
+        Store a new alert rule.
+
+        Returns:
+            The rule id
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.execute('''
+            INSERT INTO alert_rules (name, category, conditions, min_occurrences, window_days, symbols)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (name, category, conditions, min_occurrences, window_days, symbols))
+        conn.commit()
+        rule_id = cursor.lastrowid
+        conn.close()
+        logger.info(f"Alert rule #{rule_id} saved: {name}")
+        return rule_id
+
+    def set_alert_rule_active(self, rule_id, active):
+        """
+        Enable or disable an alert rule.
+
+        Returns:
+            True if the rule exists
+        """
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.execute("UPDATE alert_rules SET active = ? WHERE id = ?", (1 if active else 0, rule_id))
+        conn.commit()
+        conn.close()
+        return cursor.rowcount > 0
+
+    def get_alert_rules(self, category=None, active_only=True):
+        """Get alert rules as a list of dicts"""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        query = "SELECT * FROM alert_rules WHERE 1=1"
+        params = []
+        if category:
+            query += " AND category = ?"
+            params.append(category)
+        if active_only:
+            query += " AND active = 1"
+        rows = conn.execute(query + " ORDER BY id", params).fetchall()
+        conn.close()
+        return [dict(row) for row in rows]
+
+    def get_presence_state(self, category, symbols):
+        """
+        Get the rolling presence state of some symbols in a category.
+
+        Returns:
+            (seq, last_date, {symbol: (bits, last_seq)}); seq and last_date are
+            None if the category has no state yet
+        """
+        conn = sqlite3.connect(self.db_path)
+        row = conn.execute(
+            "SELECT seq, last_date FROM presence_dates WHERE category = ?", (category,)
+        ).fetchone()
+        seq, last_date = row if row else (None, None)
+
+        state = {}
+        symbols = list(symbols)
+        # Stay well below SQLite's bound-parameter limit
+        for i in range(0, len(symbols), 500):
+            batch = symbols[i:i + 500]
+            placeholders = ','.join('?' * len(batch))
+            rows = conn.execute(f'''
+                SELECT symbol, bits, last_seq FROM presence_state
+                WHERE category = ? AND symbol IN ({placeholders})
+            ''', [category] + batch).fetchall()
+            state.update((symbol, (bits, last_seq)) for symbol, bits, last_seq in rows)
+
+        conn.close()
+        return seq, last_date, state
+
+    def save_presence_state(self, category, seq, last_date, rows, replace=False):
+        """
+        Store presence state for a category.
+
+        Args:
+            rows: Iterable of (symbol, bits, last_seq)
+            replace: Drop the category's existing state first (used on rebuild)
+        """
+        conn = sqlite3.connect(self.db_path)
+        if replace:
+            conn.execute("DELETE FROM presence_state WHERE category = ?", (category,))
+        conn.executemany('''
+            INSERT INTO presence_state (category, symbol, bits, last_seq)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(category, symbol) DO UPDATE SET
+                bits = excluded.bits,
+                last_seq = excluded.last_seq
+        ''', ((category, symbol, int(bits), int(last_seq)) for symbol, bits, last_seq in rows))
+        conn.execute('''
+            INSERT INTO presence_dates (category, seq, last_date) VALUES (?, ?, ?)
+            ON CONFLICT(category) DO UPDATE SET seq = excluded.seq, last_date = excluded.last_date
+        ''', (category, int(seq), last_date))
+        conn.commit()
+        conn.close()
+
+    def get_presence_history(self, category, max_dates):
+        """
+        Get the distinct (symbol, date) pairs of a category's most recent dates.
+
+        Returns:
+            (DataFrame of symbol/date, total number of distinct dates)
+        """
+        conn = sqlite3.connect(self.db_path)
+        total_dates = conn.execute(f"SELECT COUNT(DISTINCT date) FROM {category}").fetchone()[0]
+        df = pd.read_sql_query(f'''
+            SELECT DISTINCT symbol, date FROM {category}
+            WHERE date IN (SELECT DISTINCT date FROM {category} ORDER BY date DESC LIMIT ?)
+        ''', conn, params=(max_dates,))
+        conn.close()
+        return df, total_dates
+
+    def record_alert_firings(self, firings):
+        """
+        Record rule hits, skipping ones already recorded.
+
+        Args:
+            firings: Iterable of (rule_id, symbol, date, details)
+
+        Returns:
+            The firings that were new
+        """
+        conn = sqlite3.connect(self.db_path)
+        new_firings = []
+        for firing in firings:
+            cursor = conn.execute('''
+                INSERT OR IGNORE INTO alert_firings (rule_id, symbol, date, details)
+                VALUES (?, ?, ?, ?)
+            ''', firing)
+            if cursor.rowcount:
+                new_firings.append(firing)
+        conn.commit()
+        conn.close()
+        return new_firings
+
     def get_scraper_logs(self, days=7):
         """Get recent scraper logs"""
         conn = sqlite3.connect(self.db_path)
@@ -280,7 +950,7 @@ class NepseDatabase:
         conn.close()
         return df
 
-    def is_market_closed_by_data_comparison(self, table_name, new_data):
+    def is_market_closed_by_data_comparison(self, table_name, new_data, date=None):
         """
         Check if market is closed by comparing new data with last stored data.
         If the last 50 rows (or all rows if less than 50) are exactly the same
@@ -289,6 +959,9 @@ class NepseDatabase:
         Args:
             table_name: Name of the table to check
             new_data: DataFrame of newly scraped data
+            date: Day the data was scraped for (default: today); it is compared
+                with the last stored day before it, so a re-run of a day that
+                is already stored isn't compared with itself
 
         Returns:
             Boolean: True if market appears closed, False otherwise
@@ -301,15 +974,16 @@ class NepseDatabase:
             # Get last stored data
             conn = sqlite3.connect(self.db_path)
 
-            # Get the most recent date's data
+            # Get the data of the most recent day before this one
             query = f'''
                 SELECT * FROM {table_name}
-                WHERE date = (SELECT MAX(date) FROM {table_name})
+                WHERE date = (SELECT MAX(date) FROM {table_name} WHERE date < ?)
                 ORDER BY symbol
                 LIMIT {Config.MARKET_CLOSURE_CHECK_ROWS}
             '''
 
-            last_data = pd.read_sql_query(query, conn)
+            date = date or datetime.now().strftime('%Y-%m-%d')
+            last_data = pd.read_sql_query(query, conn, params=(date,))
             conn.close()
 
             if last_data.empty:
@@ -331,8 +1005,14 @@ class NepseDatabase:
 
             # Take first N rows from both (N = min of both lengths or MARKET_CLOSURE_CHECK_ROWS)
             n_rows = min(len(last_data_compare), len(new_data_compare), Config.MARKET_CLOSURE_CHECK_ROWS)
-            last_data_compare = last_data_compare.head(n_rows)
-            new_data_compare = new_data_compare.head(n_rows)
+
+            # Compare only the columns the page provides (the table has extra,
+            # always-NULL ones) and ignore int/float differences from storage
+            columns = [col for col in new_data_compare.columns if col in last_data_compare.columns]
+            last_data_compare = last_data_compare[columns].head(n_rows).astype(object)
+            new_data_compare = new_data_compare[columns].head(n_rows).astype(object)
+            last_data_compare = last_data_compare.where(last_data_compare.notna(), None)
+            new_data_compare = new_data_compare.where(new_data_compare.notna(), None)
 
             # Compare dataframes
             if last_data_compare.equals(new_data_compare):
@@ -347,13 +1027,14 @@ class NepseDatabase:
             # In case of error, assume market is open to avoid missing data
             return False
 
-    def check_all_tables_for_market_closure(self, scrape_results):
+    def check_all_tables_for_market_closure(self, scrape_results, date=None):
         """
         Check all scraped data to determine if market is closed.
         If majority of tables show identical data, market is likely closed.
 
         Args:
             scrape_results: Dictionary of table_name -> DataFrame
+            date: Day the data was scraped for (default: today)
 
         Returns:
             Boolean: True if market appears closed, False if open
@@ -364,7 +1045,7 @@ class NepseDatabase:
 
             for table_name in tables_to_check:
                 if table_name in scrape_results and scrape_results[table_name] is not None:
-                    is_closed = self.is_market_closed_by_data_comparison(table_name, scrape_results[table_name])
+                    is_closed = self.is_market_closed_by_data_comparison(table_name, scrape_results[table_name], date)
                     closure_checks.append(is_closed)
 
             if not closure_checks:
@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+
+
+def lttb(x, y, threshold):
+    """
+    Downsample a series with the Largest-Triangle-Three-Buckets algorithm.
+
+    Keeps the first and last points and, for every bucket in between, the
+    point forming the largest triangle with its neighbours, so peaks and
+    troughs survive even at small point budgets.
+
+    Args:
+        x: 1-D array of numeric x values (sorted ascending)
+        y: 1-D array of y values, same length as x
+        threshold: Maximum number of points to return
+
+    Returns:
+        Array of selected indices into x/y
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+
+    # Bucket boundaries for the points between the fixed first and last
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+
+        # Average of the next bucket (or the last point for the final bucket)
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], edges[i + 2]
+        else:
+            next_start, next_end = n - 1, n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        # Triangle areas for every candidate in this bucket
+        bucket_x = x[start:end]
+        bucket_y = y[start:end]
+        areas = np.abs(
+            (x[a] - avg_x) * (bucket_y - y[a]) - (x[a] - bucket_x) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(areas))
+        indices[i + 1] = a
+
+    return indices
+
+
+def minmax_buckets(y, n_buckets):
+    """
+    Downsample by keeping the minimum and maximum of each bucket.
+
+    Cheaper than LTTB and preserves the full value envelope, which suits
+    bar-like series such as turnover.
+
+    Args:
+        y: 1-D array of values
+        n_buckets: Number of buckets (returns at most 2 * n_buckets points)
+
+    Returns:
+        Sorted array of selected indices into y
+    """
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+
+    if n_buckets <= 0 or 2 * n_buckets >= n:
+        return np.arange(n)
+
+    edges = np.linspace(0, n, n_buckets + 1).astype(np.int64)
+    selected = set()
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end <= start:
+            continue
+        bucket = y[start:end]
+        selected.add(start + int(np.argmin(bucket)))
+        selected.add(start + int(np.argmax(bucket)))
+
+    return np.array(sorted(selected), dtype=np.int64)
+
+
+def downsample_series(dates, values, budget, method='lttb'):
+    """
+    Downsample a date-indexed series to at most `budget` points.
+
+    Args:
+        dates: Sequence of dates (anything pandas can convert to datetime)
+        values: Sequence of numeric values (NaNs are dropped)
+        budget: Maximum number of points to keep
+        method: 'lttb' or 'minmax'
+
+    Returns:
+        Tuple of (dates, values) numpy arrays
+    """
+    dates = pd.to_datetime(pd.Series(dates)).to_numpy()
+    values = np.asarray(values, dtype=float)
+
+    mask = ~np.isnan(values)
+    dates, values = dates[mask], values[mask]
+
+    if len(values) <= budget:
+        return dates, values
+
+    if method == 'minmax':
+        idx = minmax_buckets(values, budget // 2)
+    else:
+        idx = lttb(dates.astype('datetime64[ns]').astype(np.int64), values, budget)
+
+    return dates[idx], values[idx]
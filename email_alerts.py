@@ -1,159 +1,181 @@
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 import logging
+import threading
 from config import Config
-from database import NepseDatabase
+from database import get_database
+from email_transport import SMTPTransport
+from email_outbox import EmailOutbox
+from subscribers import load_subscribers
+from email_templates import (
+    render_email, render_html_table, render_text_table, render_market_closure,
+    table_section, paragraph, MOVER_COLUMNS, HOT_STOCK_COLUMNS, DANGER_STOCK_COLUMNS,
+    IPO_SUMMARY_COLUMNS, IPO_ALERT_COLUMNS, RULE_FIRING_COLUMNS
+)
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class EmailAlerts:
-    def __init__(self):
-        self.email_from = Config.EMAIL_FROM
-        self.email_password = Config.EMAIL_PASSWORD
+    def __init__(self, db=None, smtp_host=None, smtp_port=None, use_ssl=None, starttls=None,
+                 email_from=None, email_password=None):
+        """
+        Every argument defaults to its Config setting; pass them to point the
+        alerts at another database or SMTP server (e.g. a local stand-in).
+        """
+        self.email_from = email_from or Config.EMAIL_FROM
+        self.email_password = email_password or Config.EMAIL_PASSWORD
         self.email_to = Config.EMAIL_TO
-        self.db = NepseDatabase()
+        self.db = db or get_database()
+        self.transport = SMTPTransport(
+            smtp_host or Config.SMTP_HOST,
+            smtp_port or Config.SMTP_PORT,
+            username=self.email_from,
+            password=self.email_password,
+            use_ssl=Config.SMTP_USE_SSL if use_ssl is None else use_ssl,
+            starttls=Config.SMTP_STARTTLS if starttls is None else starttls
+        )
+        self.outbox = EmailOutbox(self.db, self.transport, self.email_from)
+        self._batch_depth = 0
+        self._local = threading.local()
+
+    @contextmanager
+    def batch(self):
+        """
+        Hold back the outbox worker until the block exits, so every email
+        queued inside it is delivered together over one SMTP connection.
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self.outbox.notify()
+
+    @contextmanager
+    def cancellable(self, cancel):
+        """
+        Drop, rather than queue, the alerts this thread sends inside the
+        block once `cancel` (a threading.Event) is set, so work that ran past
+        its job's deadline doesn't email afterwards.
+        """
+        previous = getattr(self._local, 'cancel', None)
+        self._local.cancel = cancel
+        try:
+            yield self
+        finally:
+            self._local.cancel = previous
+
+    def _send_email(self, subject, html_body, text_body=None, recipient=None):
+        """
+        Queue an email (HTML plus optional plain-text part) in the persistent
+        outbox; the outbox worker delivers it (with retries) in the background.
+        Without a recipient it goes to Config.EMAIL_TO.
 
-    def _send_email(self, subject, html_body):
-        """Send HTML email"""
+        Returns:
+            True if the email was queued
+        """
         if not self.email_from or not self.email_password:
             logger.warning("Email credentials not configured, skipping email")
             return False
 
         try:
-            msg = MIMEMultipart('alternative')
-            msg['From'] = self.email_from
-            msg['To'] = self.email_to
-            msg['Subject'] = subject
+            outbox_id = self.outbox.enqueue(recipient or self.email_to, subject, html_body, text_body)
+        except Exception as e:
+            logger.error(f"Failed to queue email: {str(e)}")
+            return False
+
+        if self._batch_depth == 0:
+            self.outbox.notify()
+        return outbox_id is not None
+
+    def _fan_out(self, alert_type, render):
+        """
+        Queue one personalised copy of an alert per interested subscriber.
+
+        The alert data is computed once by the caller; `render` only filters
+        and renders it for a subscriber, and its result is reused for every
+        subscriber with the same watchlist and threshold.
 
-            html_part = MIMEText(html_body, 'html')
-            msg.attach(html_part)
+        Args:
+            alert_type: One of subscribers.ALERT_TYPES
+            render: Callable taking a Subscriber and returning
+                    (subject, html_body, text_body), or None to skip them
 
-            # Connect to Gmail SMTP
-            with smtplib.SMTP_SSL('smtp.gmail.com', 465) as server:
-                server.login(self.email_from, self.email_password)
-                server.send_message(msg)
+        Returns:
+            True if at least one email was queued
+        """
+        if not self.email_from or not self.email_password:
+            logger.warning("Email credentials not configured, skipping email")
+            return False
 
-            logger.info(f"Email sent successfully: {subject}")
-            return True
+        rendered = {}
+        messages = []
+        for subscriber in load_subscribers(self.db):
+            if not subscriber.wants(alert_type):
+                continue
+
+            key = subscriber.filter_key
+            if key not in rendered:
+                rendered[key] = render(subscriber)
+            if rendered[key] is not None:
+                subject, html, text = rendered[key]
+                messages.append((subscriber.email, subject, html, text))
+
+        cancel = getattr(self._local, 'cancel', None)
+        if cancel is not None and cancel.is_set():
+            logger.warning(f"{alert_type} alert cancelled, not queued")
+            return False
 
+        try:
+            queued = self.outbox.enqueue_many(messages) if messages else 0
         except Exception as e:
-            logger.error(f"Failed to send email: {str(e)}")
+            logger.error(f"Failed to queue {alert_type} alert: {str(e)}")
             return False
 
+        if queued and self._batch_depth == 0:
+            self.outbox.notify()
+
+        logger.info(f"Queued {alert_type} alert for {queued} subscriber(s) "
+                    f"({len(rendered)} distinct version(s) rendered)")
+        return queued > 0
+
     def send_daily_summary(self, scrape_results):
         """Send daily summary email after scraping"""
         today = datetime.now().strftime('%Y-%m-%d')
+        subject = f"📊 NEPSE Daily Summary - {today}"
 
-        html = f"""
-        <html>
-        <head>
-            <style>
-                body {{ font-family: Arial, sans-serif; }}
-                h2 {{ color: #2c3e50; }}
-                table {{ border-collapse: collapse; width: 100%; margin: 20px 0; }}
-                th {{ background-color: #3498db; color: white; padding: 10px; text-align: left; }}
-                td {{ border: 1px solid #ddd; padding: 8px; }}
-                tr:nth-child(even) {{ background-color: #f2f2f2; }}
-                .positive {{ color: green; font-weight: bold; }}
-                .negative {{ color: red; font-weight: bold; }}
-                .section {{ margin: 30px 0; }}
-            </style>
-        </head>
-        <body>
-            <h2>📊 NEPSE Daily Summary - {today}</h2>
-        """
+        gainers = scrape_results.get('top_gainers')
+        losers = scrape_results.get('top_losers')
+        ipo_info = scrape_results.get('ipo_info')
 
-        # Top Gainers
-        if scrape_results.get('top_gainers') is not None and not scrape_results['top_gainers'].empty:
-            df = scrape_results['top_gainers'].head(5)
-            html += """
-            <div class="section">
-                <h3>📈 Top Gainers</h3>
-                <table>
-                    <tr>
-                        <th>Symbol</th>
-                        <th>LTP</th>
-                        <th>Change %</th>
-                        <th>Turnover</th>
-                    </tr>
-            """
-            for _, row in df.iterrows():
-                change_class = 'positive' if row.get('change_percent', 0) > 0 else 'negative'
-                html += f"""
-                    <tr>
-                        <td><strong>{row.get('symbol', 'N/A')}</strong></td>
-                        <td>{row.get('ltp', 'N/A')}</td>
-                        <td class="{change_class}">{row.get('change_percent', 'N/A')}%</td>
-                        <td>{row.get('turnover', 'N/A')}</td>
-                    </tr>
-                """
-            html += "</table></div>"
-
-        # Top Losers
-        if scrape_results.get('top_losers') is not None and not scrape_results['top_losers'].empty:
-            df = scrape_results['top_losers'].head(5)
-            html += """
-            <div class="section">
-                <h3>📉 Top Losers</h3>
-                <table>
-                    <tr>
-                        <th>Symbol</th>
-                        <th>LTP</th>
-                        <th>Change %</th>
-                        <th>Turnover</th>
-                    </tr>
-            """
-            for _, row in df.iterrows():
-                change_class = 'positive' if row.get('change_percent', 0) > 0 else 'negative'
-                html += f"""
-                    <tr>
-                        <td><strong>{row.get('symbol', 'N/A')}</strong></td>
-                        <td>{row.get('ltp', 'N/A')}</td>
-                        <td class="{change_class}">{row.get('change_percent', 'N/A')}%</td>
-                        <td>{row.get('turnover', 'N/A')}</td>
-                    </tr>
-                """
-            html += "</table></div>"
-
-        # IPO Info
-        if scrape_results.get('ipo_info') is not None and not scrape_results['ipo_info'].empty:
-            df = scrape_results['ipo_info']
-            html += """
-            <div class="section">
-                <h3>🎯 IPO Information</h3>
-                <table>
-                    <tr>
-                        <th>Company</th>
-                        <th>Opening Date</th>
-                        <th>Closing Date</th>
-                        <th>Price</th>
-                        <th>Status</th>
-                    </tr>
-            """
-            for _, row in df.iterrows():
-                html += f"""
-                    <tr>
-                        <td><strong>{row.get('company_name', 'N/A')}</strong></td>
-                        <td>{row.get('opening_date', 'N/A')}</td>
-                        <td>{row.get('closing_date', 'N/A')}</td>
-                        <td>{row.get('price_per_share', 'N/A')}</td>
-                        <td>{row.get('status', 'N/A')}</td>
-                    </tr>
-                """
-            html += "</table></div>"
-
-        html += """
-            <hr>
-            <p><small>This is an automated email from NEPSE Investment Dashboard</small></p>
-        </body>
-        </html>
-        """
+        # IPO information is the same for everyone
+        ipo_part = None
+        if ipo_info is not None and not ipo_info.empty:
+            ipo_part = table_section("🎯 IPO Information", ipo_info, IPO_SUMMARY_COLUMNS)
 
-        subject = f"📊 NEPSE Daily Summary - {today}"
-        return self._send_email(subject, html)
+        def render(subscriber):
+            parts = []
+
+            # Top Gainers
+            df = subscriber.filter(gainers, 'change_percent')
+            if df is not None and not df.empty:
+                parts.append(table_section("📈 Top Gainers", df.head(5), MOVER_COLUMNS))
+
+            # Top Losers
+            df = subscriber.filter(losers, 'change_percent')
+            if df is not None and not df.empty:
+                parts.append(table_section("📉 Top Losers", df.head(5), MOVER_COLUMNS))
+
+            # IPO Info
+            if ipo_part is not None:
+                parts.append(ipo_part)
+
+            if not parts:
+                return None
+            return (subject,) + render_email(subject, 'daily', parts, kind='email')
+
+        return self._fan_out('daily', render)
 
     def send_hot_stocks_alert(self, days=7, min_occurrences=3):
         """Send alert for stocks that repeatedly appear in top gainers"""
@@ -163,53 +185,26 @@ class EmailAlerts:
             logger.info("No hot stocks to report")
             return False
 
-        html = f"""
-        <html>
-        <head>
-            <style>
-                body {{ font-family: Arial, sans-serif; }}
-                h2 {{ color: #27ae60; }}
-                table {{ border-collapse: collapse; width: 100%; margin: 20px 0; }}
-                th {{ background-color: #27ae60; color: white; padding: 10px; text-align: left; }}
-                td {{ border: 1px solid #ddd; padding: 8px; }}
-                tr:nth-child(even) {{ background-color: #f2f2f2; }}
-                .highlight {{ background-color: #ffffcc; }}
-            </style>
-        </head>
-        <body>
-            <h2>🔥 Hot Stocks Alert - Repeated Gainers ({days} days)</h2>
-            <p>These stocks have appeared in top gainers <strong>{min_occurrences}+ times</strong> in the last {days} days:</p>
-            <table>
-                <tr>
-                    <th>Symbol</th>
-                    <th>Occurrences</th>
-                    <th>Avg Change %</th>
-                    <th>Max Change %</th>
-                    <th>Last Seen</th>
-                </tr>
-        """
-
-        for _, row in repeat_gainers.iterrows():
-            html += f"""
-                <tr class="highlight">
-                    <td><strong>{row['symbol']}</strong></td>
-                    <td>{row['occurrences']}</td>
-                    <td>{row['avg_change']:.2f}%</td>
-                    <td>{row['max_change']:.2f}%</td>
-                    <td>{row['last_seen']}</td>
-                </tr>
-            """
-
-        html += """
-            </table>
-            <hr>
-            <p><small>This is an automated alert from NEPSE Investment Dashboard</small></p>
-        </body>
-        </html>
-        """
-
-        subject = f"🔥 Hot Stocks Alert - {len(repeat_gainers)} Repeated Gainers"
-        return self._send_email(subject, html)
+        def render(subscriber):
+            df = subscriber.filter(repeat_gainers, 'avg_change')
+            if df.empty:
+                return None
+
+            html, text = render_email(
+                f"🔥 Hot Stocks Alert - Repeated Gainers ({days} trading days)",
+                'hot',
+                [
+                    paragraph(f"These stocks have appeared in top gainers <strong>{min_occurrences}+ times</strong> "
+                              f"in the last {days} trading days:",
+                              f"These stocks have appeared in top gainers {min_occurrences}+ times "
+                              f"in the last {days} trading days:"),
+                    (render_html_table(df, HOT_STOCK_COLUMNS, row_class='highlight'),
+                     render_text_table(df, HOT_STOCK_COLUMNS)),
+                ]
+            )
+            return f"🔥 Hot Stocks Alert - {len(df)} Repeated Gainers", html, text
+
+        return self._fan_out('hot', render)
 
     def send_danger_stocks_alert(self, days=7, min_occurrences=3):
         """Send alert for stocks that repeatedly appear in top losers"""
@@ -219,53 +214,26 @@ class EmailAlerts:
             logger.info("No danger stocks to report")
             return False
 
-        html = f"""
-        <html>
-        <head>
-            <style>
-                body {{ font-family: Arial, sans-serif; }}
-                h2 {{ color: #e74c3c; }}
-                table {{ border-collapse: collapse; width: 100%; margin: 20px 0; }}
-                th {{ background-color: #e74c3c; color: white; padding: 10px; text-align: left; }}
-                td {{ border: 1px solid #ddd; padding: 8px; }}
-                tr:nth-child(even) {{ background-color: #f2f2f2; }}
-                .warning {{ background-color: #ffebee; }}
-            </style>
-        </head>
-        <body>
-            <h2>⚠️ Danger Stocks Alert - Repeated Losers ({days} days)</h2>
-            <p>These stocks have appeared in top losers <strong>{min_occurrences}+ times</strong> in the last {days} days:</p>
-            <table>
-                <tr>
-                    <th>Symbol</th>
-                    <th>Occurrences</th>
-                    <th>Avg Change %</th>
-                    <th>Min Change %</th>
-                    <th>Last Seen</th>
-                </tr>
-        """
-
-        for _, row in repeat_losers.iterrows():
-            html += f"""
-                <tr class="warning">
-                    <td><strong>{row['symbol']}</strong></td>
-                    <td>{row['occurrences']}</td>
-                    <td>{row['avg_change']:.2f}%</td>
-                    <td>{row['min_change']:.2f}%</td>
-                    <td>{row['last_seen']}</td>
-                </tr>
-            """
-
-        html += """
-            </table>
-            <hr>
-            <p><small>This is an automated alert from NEPSE Investment Dashboard</small></p>
-        </body>
-        </html>
-        """
-
-        subject = f"⚠️ Danger Stocks Alert - {len(repeat_losers)} Repeated Losers"
-        return self._send_email(subject, html)
+        def render(subscriber):
+            df = subscriber.filter(repeat_losers, 'avg_change')
+            if df.empty:
+                return None
+
+            html, text = render_email(
+                f"⚠️ Danger Stocks Alert - Repeated Losers ({days} trading days)",
+                'danger',
+                [
+                    paragraph(f"These stocks have appeared in top losers <strong>{min_occurrences}+ times</strong> "
+                              f"in the last {days} trading days:",
+                              f"These stocks have appeared in top losers {min_occurrences}+ times "
+                              f"in the last {days} trading days:"),
+                    (render_html_table(df, DANGER_STOCK_COLUMNS, row_class='warning'),
+                     render_text_table(df, DANGER_STOCK_COLUMNS)),
+                ]
+            )
+            return f"⚠️ Danger Stocks Alert - {len(df)} Repeated Losers", html, text
+
+        return self._fan_out('danger', render)
 
     def send_ipo_alert(self):
         """Send alert for new or upcoming IPOs"""
@@ -275,93 +243,51 @@ class EmailAlerts:
             logger.info("No IPO data to report")
             return False
 
-        html = """
-        <html>
-        <head>
-            <style>
-                body { font-family: Arial, sans-serif; }
-                h2 { color: #9b59b6; }
-                table { border-collapse: collapse; width: 100%; margin: 20px 0; }
-                th { background-color: #9b59b6; color: white; padding: 10px; text-align: left; }
-                td { border: 1px solid #ddd; padding: 8px; }
-                tr:nth-child(even) { background-color: #f2f2f2; }
-            </style>
-        </head>
-        <body>
-            <h2>🎯 IPO Alert - Current & Upcoming Issues</h2>
-            <table>
-                <tr>
-                    <th>Company</th>
-                    <th>Scrip</th>
-                    <th>Opening Date</th>
-                    <th>Closing Date</th>
-                    <th>Price</th>
-                    <th>Status</th>
-                </tr>
+        # Same content for every subscriber: render once
+        html, text = render_email(
+            "🎯 IPO Alert - Current & Upcoming Issues",
+            'ipo',
+            [(render_html_table(ipo_data, IPO_ALERT_COLUMNS), render_text_table(ipo_data, IPO_ALERT_COLUMNS))]
+        )
+        message = (f"🎯 IPO Alert - {len(ipo_data)} Current Issues", html, text)
+        return self._fan_out('ipo', lambda subscriber: message)
+
+    def send_rule_alerts(self, firings):
         """
+        Send the alert rules that fired on the latest scrape.
 
-        for _, row in ipo_data.iterrows():
-            html += f"""
-                <tr>
-                    <td><strong>{row.get('company_name', 'N/A')}</strong></td>
-                    <td>{row.get('scrip', 'N/A')}</td>
-                    <td>{row.get('opening_date', 'N/A')}</td>
-                    <td>{row.get('closing_date', 'N/A')}</td>
-                    <td>{row.get('price_per_share', 'N/A')}</td>
-                    <td>{row.get('status', 'N/A')}</td>
-                </tr>
-            """
-
-        html += """
-            </table>
-            <hr>
-            <p><small>This is an automated alert from NEPSE Investment Dashboard</small></p>
-        </body>
-        </html>
+        Args:
+            firings: DataFrame from RuleEngine.evaluate_all()
         """
+        if firings is None or firings.empty:
+            logger.info("No alert rules fired")
+            return False
+
+        def render(subscriber):
+            df = subscriber.filter(firings, 'change_percent')
+            if df.empty:
+                return None
 
-        subject = f"🎯 IPO Alert - {len(ipo_data)} Current Issues"
-        return self._send_email(subject, html)
+            title = f"🔔 Alert Rules - {df['rule'].nunique()} Rule(s) Triggered"
+            html, text = render_email(
+                title,
+                'rules',
+                [(render_html_table(df, RULE_FIRING_COLUMNS), render_text_table(df, RULE_FIRING_COLUMNS))]
+            )
+            return f"🔔 Alert Rules - {len(df)} Match(es): {', '.join(df['symbol'].unique()[:5])}", html, text
+
+        return self._fan_out('rules', render)
 
     def send_market_closure_alert(self):
         """Send alert when market is detected as closed"""
         today = datetime.now().strftime('%Y-%m-%d')
 
-        html = f"""
-        <html>
-        <head>
-            <style>
-                body {{ font-family: Arial, sans-serif; }}
-                h2 {{ color: #e74c3c; }}
-                .alert-box {{ background-color: #ffebee; border-left: 5px solid #e74c3c; padding: 20px; margin: 20px 0; }}
-            </style>
-        </head>
-        <body>
-            <h2>🔴 Market Closure Detected - {today}</h2>
-            <div class="alert-box">
-                <h3>⚠️ Alert</h3>
-                <p>The automated scraper detected that the market appears to be <strong>CLOSED</strong> today.</p>
-                <p>Scraped data is <strong>identical</strong> to the previous trading day (comparing last 50 rows).</p>
-                <p>This could indicate:</p>
-                <ul>
-                    <li>Public holiday</li>
-                    <li>Emergency market closure</li>
-                    <li>Website showing cached data</li>
-                </ul>
-                <p><strong>No new data</strong> was added to the database to avoid duplicates.</p>
-            </div>
-            <p>Date: {today}</p>
-            <p>Detection Method: Last 50 rows comparison across 4 major categories</p>
-            <hr>
-            <p><small>This is an automated alert from NEPSE Investment Dashboard</small></p>
-        </body>
-        </html>
-        """
-
-        subject = f"🔴 Market Closure Detected - {today}"
-        return self._send_email(subject, html)
+        html, text = render_market_closure(today)
+        message = (f"🔴 Market Closure Detected - {today}", html, text)
+        return self._fan_out('closure', lambda subscriber: message)
 
 if __name__ == "__main__":
     # Test email alerts
     alerts = EmailAlerts()
     alerts.send_hot_stocks_alert()
+    alerts.outbox.deliver_pending()
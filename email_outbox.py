@@ -0,0 +1,182 @@
+import hashlib
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from config import Config
+from metrics import EMAIL_SEND_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+def make_dedup_key(recipient, subject, day=None):
+    """Messages with the same recipient and subject on the same day are sent once"""
+    day = day or datetime.now().strftime('%Y-%m-%d')
+    return hashlib.sha1(f"{recipient}|{subject}|{day}".encode('utf-8')).hexdigest()
+
+
+def build_message(email_from, recipient, subject, html_body, text_body=None):
+    """Build the MIME message for an outbox row"""
+    msg = MIMEMultipart('alternative')
+    msg['From'] = email_from
+    msg['To'] = recipient
+    msg['Subject'] = subject
+
+    # Plain text first: clients show the last part they can render
+    if text_body:
+        msg.attach(MIMEText(text_body, 'plain'))
+    msg.attach(MIMEText(html_body, 'html'))
+    return msg
+
+
+class EmailOutbox:
+    """
+    SQLite-backed email outbox.
+
+    Alerts are rendered and enqueued; a background worker thread delivers
+    due messages over one SMTP connection per pass, retrying failures with
+    exponential backoff (capped at EMAIL_RETRY_MAX_SECONDS) for up to
+    EMAIL_RETRY_HORIZON_HOURS and logging every attempt. Each message is
+    claimed before it is sent, so several processes can deliver from the
+    same outbox without sending anything twice.
+    """
+
+    def __init__(self, db, transport, email_from):
+        self.db = db
+        self.transport = transport
+        self.email_from = email_from
+        self._deliver_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def enqueue(self, recipient, subject, html_body, text_body=None, dedup_key=None):
+        """
+        Queue a message for delivery.
+
+        Returns:
+            The outbox id, or None if it duplicates an already queued message
+        """
+        dedup_key = dedup_key or make_dedup_key(recipient, subject)
+        outbox_id = self.db.enqueue_email(dedup_key, recipient, subject, html_body, text_body)
+
+        if outbox_id is None:
+            logger.info(f"Email already queued, skipping duplicate: {subject}")
+        else:
+            logger.info(f"Email queued (#{outbox_id}): {subject}")
+        return outbox_id
+
+    def enqueue_many(self, messages):
+        """
+        Queue several messages in one database transaction.
+
+        Args:
+            messages: Iterable of (recipient, subject, html_body, text_body)
+
+        Returns:
+            Number of messages queued (duplicates are skipped)
+        """
+        rows = [(make_dedup_key(recipient, subject), recipient, subject, html_body, text_body)
+                for recipient, subject, html_body, text_body in messages]
+        queued = self.db.enqueue_emails(rows)
+
+        if queued < len(rows):
+            logger.info(f"Skipped {len(rows) - queued} duplicate email(s)")
+        return queued
+
+    def notify(self):
+        """Wake the worker so newly queued messages go out immediately"""
+        self._wake.set()
+
+    def _retry_delay(self, attempt):
+        delay = Config.EMAIL_RETRY_BASE_SECONDS * (2 ** (attempt - 1))
+        return min(delay, Config.EMAIL_RETRY_MAX_SECONDS)
+
+    def _expired(self, row):
+        """True once a message has been retried for EMAIL_RETRY_HORIZON_HOURS"""
+        # created_at is SQLite's CURRENT_TIMESTAMP, in UTC
+        created = datetime.strptime(row['created_at'], '%Y-%m-%d %H:%M:%S')
+        return datetime.utcnow() - created >= timedelta(hours=Config.EMAIL_RETRY_HORIZON_HOURS)
+
+    def deliver_pending(self, limit=50):
+        """
+        Deliver every due message.
+
+        Returns:
+            Number of messages sent
+        """
+        sent_count = 0
+
+        # One SMTP connection for the whole pass, however many pages it takes
+        with self._deliver_lock, self.transport.batch():
+            while True:
+                due = self.db.get_due_emails(limit)
+                if not due:
+                    break
+
+                for row in due:
+                    # Another process (e.g. run_scraper.py) may be delivering too
+                    if not self.db.claim_email(row['id']):
+                        continue
+
+                    attempt = row['attempts'] + 1
+                    msg = build_message(self.email_from, row['recipient'], row['subject'],
+                                        row['html_body'], row['text_body'])
+                    started = time.perf_counter()
+                    try:
+                        self.transport.send(msg)
+                    except Exception as e:
+                        duration_ms = (time.perf_counter() - started) * 1000
+                        EMAIL_SEND_SECONDS.labels(result='failed').observe(duration_ms / 1000)
+                        if self._expired(row):
+                            next_attempt_at = None
+                            logger.error(f"Giving up on email #{row['id']} after {attempt} attempts over "
+                                         f"{Config.EMAIL_RETRY_HORIZON_HOURS}h: {str(e)}")
+                        else:
+                            retry_at = datetime.now() + timedelta(seconds=self._retry_delay(attempt))
+                            next_attempt_at = retry_at.strftime('%Y-%m-%d %H:%M:%S')
+                            logger.warning(f"Email #{row['id']} failed (attempt {attempt}), "
+                                           f"retrying at {next_attempt_at}: {str(e)}")
+                        self.db.record_email_attempt(row['id'], attempt, False, duration_ms,
+                                                     str(e), next_attempt_at)
+                        continue
+
+                    duration_ms = (time.perf_counter() - started) * 1000
+                    EMAIL_SEND_SECONDS.labels(result='sent').observe(duration_ms / 1000)
+                    self.db.record_email_attempt(row['id'], attempt, True, duration_ms)
+                    sent_count += 1
+                    logger.info(f"Email sent successfully: {row['subject']}")
+
+                if len(due) < limit:
+                    break
+
+        return sent_count
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.deliver_pending()
+            except Exception as e:
+                logger.error(f"Error delivering outbox: {str(e)}", exc_info=True)
+            self._wake.wait(Config.OUTBOX_POLL_SECONDS)
+            self._wake.clear()
+
+    def start(self):
+        """Start the background delivery worker"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='email-outbox', daemon=True)
+        self._thread.start()
+        logger.info("Email outbox worker started")
+
+    def stop(self, timeout=10):
+        """Stop the background delivery worker"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        logger.info("Email outbox worker stopped")
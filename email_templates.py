@@ -0,0 +1,262 @@
+"""
+Email templates for the alert emails
+
+Page, section and row templates are compiled once at import time and share a
+single stylesheet. Tables are rendered from column arrays: each column is
+formatted as a whole, then the cells are stitched into rows with one
+%-format per row and a single join, so render time grows linearly with the
+number of rows. Every email has an HTML part and a plain-text part.
+"""
+
+import html
+from collections import namedtuple
+from string import Template
+import numpy as np
+
+NA = 'N/A'
+
+# key: DataFrame column, header: table heading, fmt: format for numeric values
+# (None shows the value as-is), strong: bold cell, signed: colour by sign
+Column = namedtuple('Column', 'key header fmt strong signed', defaults=(None, False, False))
+
+_STYLE = Template("""
+    body { font-family: Arial, sans-serif; }
+    h2 { color: $heading; }
+    table { border-collapse: collapse; width: 100%; margin: 20px 0; }
+    th { background-color: $accent; color: white; padding: 10px; text-align: left; }
+    td { border: 1px solid #ddd; padding: 8px; }
+    tr:nth-child(even) { background-color: #f2f2f2; }
+    .positive { color: green; font-weight: bold; }
+    .negative { color: red; font-weight: bold; }
+    .highlight { background-color: #ffffcc; }
+    .warning { background-color: #ffebee; }
+    .section { margin: 30px 0; }
+    .alert-box { background-color: #ffebee; border-left: 5px solid $accent; padding: 20px; margin: 20px 0; }
+""")
+
+# (heading colour, table accent colour) per email type
+THEMES = {
+    'daily': ('#2c3e50', '#3498db'),
+    'hot': ('#27ae60', '#27ae60'),
+    'danger': ('#e74c3c', '#e74c3c'),
+    'ipo': ('#9b59b6', '#9b59b6'),
+    'closure': ('#e74c3c', '#e74c3c'),
+    'rules': ('#e67e22', '#e67e22'),
+}
+
+STYLES = {name: _STYLE.substitute(heading=heading, accent=accent)
+          for name, (heading, accent) in THEMES.items()}
+
+_PAGE = Template("""<html>
+<head>
+<style>$style</style>
+</head>
+<body>
+<h2>$title</h2>
+$body
+<hr>
+<p><small>This is an automated $kind from NEPSE Investment Dashboard</small></p>
+</body>
+</html>
+""")
+
+_SECTION = Template('<div class="section">\n<h3>$heading</h3>\n$content\n</div>')
+
+_TEXT_FOOTER = "--\nThis is an automated {kind} from NEPSE Investment Dashboard\n"
+
+_CLOSURE_BODY = Template("""<div class="alert-box">
+<h3>⚠️ Alert</h3>
+<p>The automated scraper detected that the market appears to be <strong>CLOSED</strong> today.</p>
+<p>Scraped data is <strong>identical</strong> to the previous trading day (comparing last 50 rows).</p>
+<p>This could indicate:</p>
+<ul>
+<li>Public holiday</li>
+<li>Emergency market closure</li>
+<li>Website showing cached data</li>
+</ul>
+<p><strong>No new data</strong> was added to the database to avoid duplicates.</p>
+</div>
+<p>Date: $date</p>
+<p>Detection Method: Last 50 rows comparison across 4 major categories</p>""")
+
+_CLOSURE_TEXT = Template("""ALERT: the automated scraper detected that the market appears to be CLOSED today.
+
+Scraped data is identical to the previous trading day (comparing last 50 rows).
+This could indicate a public holiday, an emergency market closure, or the
+website showing cached data. No new data was added to the database.
+
+Date: $date
+Detection Method: Last 50 rows comparison across 4 major categories""")
+
+
+def _format_column(df, column):
+    """Format one DataFrame column as a list of strings (N/A for missing values)"""
+    if column.key not in df.columns:
+        return [NA] * len(df)
+
+    values = df[column.key].tolist()
+    if column.fmt is None:
+        return [NA if value is None or value != value else str(value) for value in values]
+
+    fmt = column.fmt
+    formatted = []
+    for value in values:
+        try:
+            formatted.append(NA if value is None or value != value else fmt.format(float(value)))
+        except (TypeError, ValueError):
+            formatted.append(str(value))
+    return formatted
+
+
+def _sign_classes(df, column):
+    """Cell class per row: positive for values above zero, negative otherwise"""
+    if column.key not in df.columns:
+        return np.full(len(df), 'negative')
+    values = df[column.key].to_numpy(dtype=float, na_value=np.nan)
+    return np.where(values > 0, 'positive', 'negative')
+
+
+def render_html_table(df, columns, row_class=None):
+    """
+    Render a DataFrame as an HTML table.
+
+    Args:
+        df: Rows to render
+        columns: List of Column specs
+        row_class: Optional CSS class applied to every row
+
+    Returns:
+        HTML string
+    """
+    header = ''.join(f'<th>{html.escape(col.header)}</th>' for col in columns)
+
+    # Build the row template once, then fill it from the column arrays
+    cell_templates = []
+    arrays = []
+    for col in columns:
+        cell = '<strong>%s</strong>' if col.strong else '%s'
+        if col.signed:
+            cell_templates.append(f'<td class="%s">{cell}</td>')
+            arrays.append(_sign_classes(df, col).tolist())
+        else:
+            cell_templates.append(f'<td>{cell}</td>')
+        arrays.append([html.escape(value, quote=False) for value in _format_column(df, col)])
+
+    tr = f'<tr class="{row_class}">' if row_class else '<tr>'
+    row_template = tr + ''.join(cell_templates) + '</tr>\n'
+    rows = ''.join([row_template % cells for cells in zip(*arrays)])
+
+    return f'<table>\n<tr>{header}</tr>\n{rows}</table>'
+
+
+def render_text_table(df, columns):
+    """Render a DataFrame as a fixed-width plain-text table"""
+    headers = []
+    arrays = []
+    for col in columns:
+        values = _format_column(df, col)
+        width = max([len(col.header)] + [len(value) for value in values])
+        headers.append(col.header.ljust(width))
+        arrays.append([value.ljust(width) for value in values])
+
+    lines = ['  '.join(headers).rstrip(), '  '.join('-' * len(h) for h in headers)]
+    lines.extend('  '.join(cells).rstrip() for cells in zip(*arrays))
+    return '\n'.join(lines)
+
+
+def table_section(heading, df, columns, row_class=None):
+    """Render a headed table as an (html, text) pair for render_email()"""
+    section_html = _SECTION.substitute(heading=heading,
+                                       content=render_html_table(df, columns, row_class))
+    section_text = f"{heading}\n\n{render_text_table(df, columns)}"
+    return section_html, section_text
+
+
+def paragraph(html_text, plain_text):
+    """A paragraph as an (html, text) pair for render_email()"""
+    return f'<p>{html_text}</p>', plain_text
+
+
+def render_email(title, theme, parts, kind='alert'):
+    """
+    Assemble a full email from (html, text) parts.
+
+    Args:
+        title: Heading shown at the top of the email
+        theme: Key into THEMES
+        parts: List of (html, text) pairs
+        kind: 'alert' or 'email', used in the footer
+
+    Returns:
+        (html_body, text_body)
+    """
+    html_body = _PAGE.substitute(
+        style=STYLES[theme],
+        title=title,
+        body='\n'.join(part_html for part_html, _ in parts),
+        kind=kind
+    )
+    text_body = '\n\n'.join([f"{title}\n{'=' * len(title)}"] + [part_text for _, part_text in parts])
+    text_body += '\n\n' + _TEXT_FOOTER.format(kind=kind)
+    return html_body, text_body
+
+
+def render_market_closure(date):
+    """Market-closure alert as (html_body, text_body)"""
+    return render_email(
+        f"🔴 Market Closure Detected - {date}",
+        'closure',
+        [(_CLOSURE_BODY.substitute(date=date), _CLOSURE_TEXT.substitute(date=date))]
+    )
+
+
+# Column layouts for each alert table
+MOVER_COLUMNS = [
+    Column('symbol', 'Symbol', strong=True),
+    Column('ltp', 'LTP'),
+    Column('change_percent', 'Change %', '{:.2f}%', signed=True),
+    Column('turnover', 'Turnover'),
+]
+
+HOT_STOCK_COLUMNS = [
+    Column('symbol', 'Symbol', strong=True),
+    Column('occurrences', 'Occurrences'),
+    Column('avg_change', 'Avg Change %', '{:.2f}%'),
+    Column('max_change', 'Max Change %', '{:.2f}%'),
+    Column('last_seen', 'Last Seen'),
+]
+
+DANGER_STOCK_COLUMNS = [
+    Column('symbol', 'Symbol', strong=True),
+    Column('occurrences', 'Occurrences'),
+    Column('avg_change', 'Avg Change %', '{:.2f}%'),
+    Column('min_change', 'Min Change %', '{:.2f}%'),
+    Column('last_seen', 'Last Seen'),
+]
+
+IPO_SUMMARY_COLUMNS = [
+    Column('company_name', 'Company', strong=True),
+    Column('opening_date', 'Opening Date'),
+    Column('closing_date', 'Closing Date'),
+    Column('price_per_share', 'Price'),
+    Column('status', 'Status'),
+]
+
+IPO_ALERT_COLUMNS = [
+    Column('company_name', 'Company', strong=True),
+    Column('scrip', 'Scrip'),
+    Column('opening_date', 'Opening Date'),
+    Column('closing_date', 'Closing Date'),
+    Column('price_per_share', 'Price'),
+    Column('status', 'Status'),
+]
+
+RULE_FIRING_COLUMNS = [
+    Column('rule', 'Rule', strong=True),
+    Column('symbol', 'Symbol', strong=True),
+    Column('category', 'Category'),
+    Column('hits', 'Days Present'),
+    Column('ltp', 'LTP'),
+    Column('change_percent', 'Change %', '{:.2f}%', signed=True),
+    Column('turnover', 'Turnover'),
+]
@@ -0,0 +1,121 @@
+import smtplib
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class SMTPTransport:
+    """
+    SMTP connection that is opened and authenticated once, then reused for
+    every message sent inside a batch. A dropped connection is re-opened and
+    the message retried; errors reported by the server are raised at once.
+    """
+
+    def __init__(self, host, port, username=None, password=None, use_ssl=True,
+                 starttls=False, timeout=30, max_retries=2):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_ssl = use_ssl
+        self.starttls = starttls
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self._server = None
+        self._batch_depth = 0
+        self.connections_opened = 0
+
+    def connect(self):
+        """Open and authenticate a connection if one isn't already open"""
+        if self._server is not None:
+            return self._server
+
+        if self.use_ssl:
+            server = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+
+        try:
+            if self.starttls and not self.use_ssl:
+                server.starttls()
+            if self.username and self.password:
+                server.login(self.username, self.password)
+        except (smtplib.SMTPException, OSError):
+            server.close()
+            raise
+
+        self._server = server
+        self.connections_opened += 1
+        logger.debug(f"Opened SMTP connection to {self.host}:{self.port}")
+        return server
+
+    def close(self):
+        """Close the connection (ignoring errors from an already-dead socket)"""
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self._server = None
+
+    @contextmanager
+    def batch(self):
+        """Keep one connection open for every send inside the block"""
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self.close()
+
+    def send(self, msg):
+        """
+        Send a message, reconnecting and retrying if the connection drops.
+
+        Raises:
+            smtplib.SMTPException or OSError once retries are exhausted
+        """
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    self.connect().send_message(msg)
+                    return
+                except (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError) as e:
+                    error = e
+                except smtplib.SMTPException:
+                    # The server answered (bad login, refused recipient, 4xx/5xx):
+                    # a new connection won't change that, leave retrying to the caller
+                    self.close()
+                    raise
+                except OSError as e:
+                    error = e
+
+                # Connection-level failure: drop it and try a fresh one
+                self.close()
+                if attempt == self.max_retries:
+                    raise error
+                logger.warning(f"SMTP connection lost ({error}), reconnecting (attempt {attempt + 2})")
+        finally:
+            if self._batch_depth == 0:
+                self.close()
+
+    def send_many(self, messages):
+        """
+        Send several messages over a single connection.
+
+        Returns:
+            List of booleans, one per message, True if it was sent
+        """
+        results = []
+        with self.batch():
+            for msg in messages:
+                try:
+                    self.send(msg)
+                    results.append(True)
+                except (smtplib.SMTPException, OSError) as e:
+                    logger.error(f"Failed to send email '{msg['Subject']}': {str(e)}")
+                    results.append(False)
+        return results
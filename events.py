@@ -0,0 +1,165 @@
+"""
+In-process event bus for committed data
+
+NepseDatabase emits RowsCommitted after every insert/upsert that writes
+rows, carrying the rows themselves, so subscribers work on the delta instead
+of re-reading tables. Writers that store several categories together (a
+scrape, a backfilled day) wrap them in `bus.batch(date)`, which emits one
+BatchCommitted at the end for work that should happen once per batch.
+
+Subscribers run synchronously in the emitting thread, or with
+background=True on their own worker thread, in emit order. A failing
+subscriber is logged and never affects the writer or other subscribers.
+
+    bus = db.events
+    bus.subscribe(lambda event: print(event.table, len(event.rows)))
+    with bus.batch('2024-01-15'):
+        db.upsert_data('top_gainers', df, '2024-01-15')
+"""
+
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Rows written to `table` for `date` (rows: the DataFrame as stored)
+RowsCommitted = namedtuple('RowsCommitted', 'table date rows')
+
+# End of a batch; `tables` maps each table written in it to its row count
+BatchCommitted = namedtuple('BatchCommitted', 'date tables')
+
+
+class _Subscription:
+    def __init__(self, handler, events, tables, background, name):
+        self.handler = handler
+        self.events = events
+        self.tables = tables
+        self.name = name
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"event-{name}") if background else None
+
+    def wants(self, event):
+        if not isinstance(event, self.events):
+            return False
+        if self.tables is None:
+            return True
+        if isinstance(event, RowsCommitted):
+            return event.table in self.tables
+        return any(table in self.tables for table in event.tables)
+
+    def deliver(self, event):
+        try:
+            self.handler(event)
+        except Exception as e:
+            logger.error(f"Event subscriber {self.name} failed on {type(event).__name__}: {str(e)}", exc_info=True)
+
+
+class EventBus:
+    """Publish/subscribe for RowsCommitted and BatchCommitted events"""
+
+    def __init__(self):
+        self._subscriptions = []
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._batches = threading.local()
+        self.defaults_attached = False
+
+    def subscribe(self, handler, events=(RowsCommitted,), tables=None, background=False, name=None):
+        """
+        Call `handler(event)` for matching events.
+
+        Args:
+            handler: Callable taking one event
+            events: Event types to receive
+            tables: Only events for these tables (default: all)
+            background: Run on a dedicated worker thread instead of the emitter's
+            name: Name used in logs and thread names
+
+        Returns:
+            The handler, so this can be used as a decorator
+        """
+        subscription = _Subscription(handler, tuple(events), frozenset(tables) if tables else None,
+                                     background, name or getattr(handler, '__qualname__', 'subscriber'))
+        with self._lock:
+            self._subscriptions = self._subscriptions + [subscription]
+        return handler
+
+    def unsubscribe(self, handler):
+        with self._lock:
+            removed = [s for s in self._subscriptions if s.handler is handler]
+            self._subscriptions = [s for s in self._subscriptions if s.handler is not handler]
+        for subscription in removed:
+            if subscription.executor is not None:
+                subscription.executor.shutdown(wait=True)
+
+    def emit(self, event):
+        """Deliver an event to every matching subscriber"""
+        if isinstance(event, RowsCommitted):
+            batch = getattr(self._batches, 'current', None)
+            if batch is not None:
+                batch[event.table] = batch.get(event.table, 0) + len(event.rows)
+
+        for subscription in self._subscriptions:
+            if not subscription.wants(event):
+                continue
+            if subscription.executor is None:
+                subscription.deliver(event)
+            else:
+                future = subscription.executor.submit(subscription.deliver, event)
+                with self._lock:
+                    self._pending.add(future)
+                future.add_done_callback(self._done)
+
+    def _done(self, future):
+        with self._lock:
+            self._pending.discard(future)
+
+    @contextmanager
+    def batch(self, date):
+        """
+        Group the commits made by this thread; emits BatchCommitted(date,
+        tables) on exit if anything was written.
+        """
+        outer = getattr(self._batches, 'current', None)
+        tables = {}
+        self._batches.current = tables
+        try:
+            yield tables
+        finally:
+            self._batches.current = outer
+            if outer is not None:
+                for table, count in tables.items():
+                    outer[table] = outer.get(table, 0) + count
+            elif tables:
+                self.emit(BatchCommitted(date, tables))
+
+    def drain(self, timeout=None):
+        """Wait for background subscribers to finish the events emitted so far"""
+        with self._lock:
+            pending = list(self._pending)
+        if pending:
+            wait(pending, timeout=timeout)
+
+
+def attach_default_subscribers(db, email_alerts=None):
+    """
+    Wire the standard downstream work to a database's events (once per bus):
+    dashboards are told about new data once per batch, and alert rules are
+    evaluated on each commit, with firings queued as emails if `email_alerts`
+    is given.
+    """
+    bus = db.events
+    if bus.defaults_attached:
+        return
+    bus.defaults_attached = True
+
+    # Imported here: alert_rules imports database, which imports this module
+    from alert_rules import RuleEngine
+
+    def invalidate_caches(event):
+        db.bump_data_generation()
+
+    bus.subscribe(invalidate_caches, events=(BatchCommitted,), name='cache-invalidation')
+    RuleEngine(db).subscribe(bus, email_alerts.send_rule_alerts if email_alerts is not None else None)
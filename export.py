@@ -0,0 +1,262 @@
+"""
+Streaming bulk data export (CSV, NDJSON, Parquet, XLSX)
+
+Rows are read from the database cursor in chunks and encoded chunk by chunk,
+so exporting the full retention window runs in constant memory. CSV, NDJSON
+and Parquet start sending bytes with the first chunk; XLSX is assembled in a
+temporary file by openpyxl's write-only mode and streamed once complete.
+"""
+
+import csv
+import io
+import json
+import logging
+import os
+import tempfile
+from datetime import datetime
+from flask import Blueprint, Response, abort, request, stream_with_context
+from config import Config
+from database import NepseDatabase, get_database
+
+logger = logging.getLogger(__name__)
+
+EXPORT_TABLES = NepseDatabase.SYMBOL_TABLES + ['top_brokers', 'ipo_info']
+
+MIMETYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# Declared types of the symbol history columns (not a real table)
+SYMBOL_HISTORY_TYPES = {'date': 'DATE', 'ltp': 'REAL', 'change_percent': 'REAL', 'turnover': 'REAL'}
+
+_FILE_CHUNK_BYTES = 64 * 1024
+
+_db = None
+
+
+def _get_db():
+    global _db
+    if _db is None:
+        _db = get_database()
+    return _db
+
+
+def stream_csv(chunks, column_types=None):
+    """Encode (columns, rows) chunks as CSV"""
+    header_written = False
+    for columns, rows in chunks:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if not header_written:
+            writer.writerow(columns)
+            header_written = True
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+
+
+def stream_ndjson(chunks, column_types=None):
+    """Encode (columns, rows) chunks as newline-delimited JSON"""
+    for columns, rows in chunks:
+        if not rows:
+            continue
+        lines = [json.dumps(dict(zip(columns, row)), default=str) for row in rows]
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+class _DrainBuffer(io.RawIOBase):
+    """Write-only sink whose contents are handed out and discarded on drain()"""
+
+    def __init__(self):
+        super().__init__()
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def _arrow_type(declared_type):
+    import pyarrow as pa
+
+    # SQLite stores a REAL as-is in an INTEGER column (e.g. a fractional
+    # quantity), and pyarrow would silently truncate it to an int64, so every
+    # numeric affinity is exported as float64
+    if 'INT' in declared_type or declared_type in ('REAL', 'FLOAT', 'DOUBLE') or 'NUMERIC' in declared_type:
+        return pa.float64()
+    return pa.string()
+
+
+def stream_parquet(chunks, column_types=None):
+    """Encode (columns, rows) chunks as Parquet, one row group per chunk"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    column_types = column_types or {}
+    sink = _DrainBuffer()
+    writer = None
+
+    for columns, rows in chunks:
+        if writer is None:
+            schema = pa.schema([(col, _arrow_type(column_types.get(col, 'TEXT'))) for col in columns])
+            writer = pq.ParquetWriter(sink, schema)
+
+        arrays = [
+            pa.array([row[i] for row in rows], type=schema.field(i).type)
+            for i in range(len(columns))
+        ]
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        yield sink.drain()
+
+    if writer is not None:
+        writer.close()
+        yield sink.drain()
+
+
+def stream_xlsx(chunks, column_types=None):
+    """Encode (columns, rows) chunks as an XLSX workbook"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('data')
+
+    header_written = False
+    for columns, rows in chunks:
+        if not header_written:
+            sheet.append(columns)
+            header_written = True
+        for row in rows:
+            sheet.append(row)
+
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        workbook.save(path)
+        with open(path, 'rb') as f:
+            while True:
+                data = f.read(_FILE_CHUNK_BYTES)
+                if not data:
+                    break
+                yield data
+    finally:
+        os.remove(path)
+
+
+WRITERS = {
+    'csv': stream_csv,
+    'ndjson': stream_ndjson,
+    'parquet': stream_parquet,
+    'xlsx': stream_xlsx,
+}
+
+
+def _check_format(fmt):
+    """Fail before streaming starts if a format can't be produced"""
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown format: {fmt}")
+    if fmt == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+
+
+def export_table(db, table_name, fmt, start_date=None, end_date=None, symbol=None):
+    """
+    Stream a category table in the given format.
+
+    Returns:
+        Generator of encoded byte chunks
+    """
+    if table_name not in EXPORT_TABLES:
+        raise ValueError(f"Unknown table: {table_name}")
+    _check_format(fmt)
+
+    chunks = db.iter_table(table_name, start_date, end_date, symbol, chunk_size=Config.EXPORT_CHUNK_SIZE)
+    return WRITERS[fmt](chunks, db.get_column_types(table_name))
+
+
+def export_symbol_history(db, symbol, fmt, start_date=None, end_date=None):
+    """
+    Stream the per-date history of a symbol in the given format.
+
+    Returns:
+        Generator of encoded byte chunks
+    """
+    _check_format(fmt)
+
+    chunks = db.iter_symbol_history(symbol, start_date, end_date, chunk_size=Config.EXPORT_CHUNK_SIZE)
+    return WRITERS[fmt](chunks, SYMBOL_HISTORY_TYPES)
+
+
+def parse_date(value):
+    """Validate an optional YYYY-MM-DD date string"""
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d')
+
+
+# Flask routes (registered on the Dash server in dashboard.py)
+export_blueprint = Blueprint('export', __name__)
+
+
+def _date_args():
+    try:
+        return parse_date(request.args.get('start')), parse_date(request.args.get('end'))
+    except ValueError:
+        abort(400, description="Dates must be YYYY-MM-DD")
+
+
+def _stream_response(generator, filename, fmt):
+    return Response(
+        stream_with_context(generator),
+        mimetype=MIMETYPES[fmt],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+
+@export_blueprint.route('/export/<table_name>.<fmt>')
+def export_table_route(table_name, fmt):
+    """GET /export/top_gainers.csv?start=2024-01-01&end=2024-12-31&symbol=NABIL"""
+    if table_name not in EXPORT_TABLES or fmt not in WRITERS:
+        abort(404)
+
+    start_date, end_date = _date_args()
+    symbol = (request.args.get('symbol') or '').upper().strip() or None
+
+    try:
+        generator = export_table(_get_db(), table_name, fmt, start_date, end_date, symbol)
+    except RuntimeError as e:
+        abort(501, description=str(e))
+    return _stream_response(generator, f"{table_name}.{fmt}", fmt)
+
+
+@export_blueprint.route('/export/symbol/<symbol>.<fmt>')
+def export_symbol_route(symbol, fmt):
+    """GET /export/symbol/NABIL.parquet?start=2024-01-01"""
+    if fmt not in WRITERS:
+        abort(404)
+
+    start_date, end_date = _date_args()
+    symbol = symbol.upper().strip()
+
+    try:
+        generator = export_symbol_history(_get_db(), symbol, fmt, start_date, end_date)
+    except RuntimeError as e:
+        abort(501, description=str(e))
+    return _stream_response(generator, f"{symbol}_history.{fmt}", fmt)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Export category tables or symbol history from the command line
+
+Examples:
+    python export_data.py top_gainers --format csv --start 2024-01-01 -o gainers.csv
+    python export_data.py top_brokers --format xlsx -o brokers.xlsx
+    python export_data.py --symbol NABIL --format parquet -o nabil.parquet
+    python export_data.py top_losers --format ndjson | jq .symbol
+"""
+
+import argparse
+import sys
+import logging
+from database import get_database
+from logging_setup import setup_logging
+from export import EXPORT_TABLES, WRITERS, export_table, export_symbol_history, parse_date
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    # Log to stderr so stdout can carry the export itself
+    setup_logging(fmt='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('table', nargs='?', choices=EXPORT_TABLES,
+                        help='Category table to export')
+    parser.add_argument('--symbol', help='Export this symbol (whole history if no table is given)')
+    parser.add_argument('--format', dest='fmt', choices=sorted(WRITERS), default='csv')
+    parser.add_argument('--start', type=parse_date, help='Start date YYYY-MM-DD (inclusive)')
+    parser.add_argument('--end', type=parse_date, help='End date YYYY-MM-DD (inclusive)')
+    parser.add_argument('-o', '--output', help='Output file (default: stdout)')
+    args = parser.parse_args()
+
+    if not args.table and not args.symbol:
+        parser.error('give a table, --symbol, or both')
+
+    db = get_database()
+    symbol = args.symbol.upper().strip() if args.symbol else None
+
+    try:
+        if args.table:
+            chunks = export_table(db, args.table, args.fmt, args.start, args.end, symbol)
+        else:
+            chunks = export_symbol_history(db, symbol, args.fmt, args.start, args.end)
+    except RuntimeError as e:
+        logger.error(str(e))
+        sys.exit(1)
+
+    out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    total_bytes = 0
+    try:
+        for data in chunks:
+            out.write(data)
+            total_bytes += len(data)
+    finally:
+        if args.output:
+            out.close()
+
+    logger.info(f"Exported {total_bytes:,} bytes" + (f" to {args.output}" if args.output else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Local SMTP stand-in for developing and benchmarking the email alerts
+
+Accepts any AUTH credentials and keeps every message in memory, so
+EmailAlerts can be exercised end to end without a real mail account. It can
+also reject the first N messages or add per-message latency to exercise the
+outbox's retry path and mimic a remote server.
+
+Usage:
+    python local_smtp.py --port 1025
+    # then in another shell (or .env):
+    SMTP_HOST=127.0.0.1 SMTP_PORT=1025 SMTP_USE_SSL=false python run_scraper.py --send-email
+"""
+
+import argparse
+import base64
+import logging
+import socketserver
+import threading
+import time
+from collections import namedtuple
+from email import message_from_bytes
+from logging_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+ReceivedMessage = namedtuple('ReceivedMessage', 'mail_from rcpt_tos data username received_at')
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """One SMTP session (enough of RFC 5321 for smtplib)"""
+
+    def _reply(self, code, text, more=False):
+        self.wfile.write(f"{code}{'-' if more else ' '}{text}\r\n".encode('utf-8'))
+
+    def _readline(self):
+        """Next command line, or None once the client has gone away"""
+        line = self.rfile.readline(65537)
+        return line.decode('utf-8', 'replace').rstrip('\r\n') if line else None
+
+    def _auth(self, arg):
+        mechanism, _, initial = arg.partition(' ')
+        mechanism = mechanism.upper()
+
+        if mechanism == 'PLAIN':
+            if not initial:
+                self._reply(334, '')
+                initial = self._readline() or ''
+            username = base64.b64decode(initial).split(b'\0')[1].decode('utf-8', 'replace')
+        elif mechanism == 'LOGIN':
+            if not initial:
+                self._reply(334, 'VXNlcm5hbWU6')
+                initial = self._readline() or ''
+            username = base64.b64decode(initial).decode('utf-8', 'replace')
+            self._reply(334, 'UGFzc3dvcmQ6')
+            self._readline()
+        else:
+            self._reply(504, 'Unrecognized authentication type')
+            return None
+
+        self._reply(235, 'Authentication successful')
+        return username
+
+    def _read_data(self):
+        lines = []
+        while True:
+            line = self.rfile.readline(1 << 20)
+            if not line or line in (b'.\r\n', b'.\n'):
+                break
+            # Undo dot-stuffing
+            lines.append(line[1:] if line.startswith(b'..') else line)
+        return b''.join(lines)
+
+    def handle(self):
+        server = self.server.owner
+        server._connection_opened()
+        mail_from, rcpt_tos, username = None, [], None
+
+        self._reply(220, 'localhost SMTP stand-in ready')
+        while True:
+            line = self._readline()
+            if line is None:
+                break
+            command, _, arg = line.partition(' ')
+            command = command.upper()
+
+            if command == 'EHLO':
+                self._reply(250, 'localhost', more=True)
+                self._reply(250, 'AUTH PLAIN LOGIN', more=True)
+                self._reply(250, '8BITMIME', more=True)
+                self._reply(250, 'SIZE 52428800')
+            elif command == 'HELO':
+                self._reply(250, 'localhost')
+            elif command == 'AUTH':
+                username = self._auth(arg)
+            elif command == 'MAIL':
+                mail_from, rcpt_tos = arg.partition(':')[2].split(' ')[0].strip('<>'), []
+                self._reply(250, 'OK')
+            elif command == 'RCPT':
+                rcpt_tos.append(arg.partition(':')[2].strip().strip('<>'))
+                self._reply(250, 'OK')
+            elif command == 'DATA':
+                self._reply(354, 'End data with <CR><LF>.<CR><LF>')
+                data = self._read_data()
+                if server._accept(ReceivedMessage(mail_from, rcpt_tos, data, username, time.time())):
+                    self._reply(250, 'OK: queued')
+                else:
+                    self._reply(451, 'Temporary failure, try again later')
+                mail_from, rcpt_tos = None, []
+            elif command == 'RSET':
+                mail_from, rcpt_tos = None, []
+                self._reply(250, 'OK')
+            elif command == 'NOOP':
+                self._reply(250, 'OK')
+            elif command == 'QUIT':
+                self._reply(221, 'Bye')
+                break
+            else:
+                self._reply(502, 'Command not implemented')
+
+
+class _ThreadingServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class LocalSMTPServer:
+    """
+    In-process SMTP server on a background thread.
+
+    Args:
+        host: Address to bind
+        port: Port to bind (0 picks a free port; see .port)
+        fail_first: Reject this many messages with a 451 before accepting any
+        latency: Seconds to wait before answering each DATA command
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, fail_first=0, latency=0.0):
+        self.host = host
+        self.requested_port = port
+        self.fail_first = fail_first
+        self.latency = latency
+        self.messages = []
+        self.rejected = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1] if self._server else self.requested_port
+
+    def _connection_opened(self):
+        with self._lock:
+            self.connections += 1
+
+    def _accept(self, message):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            if self.rejected < self.fail_first:
+                self.rejected += 1
+                return False
+            self.messages.append(message)
+        logger.debug(f"Received message for {', '.join(message.rcpt_tos)} ({len(message.data)} bytes)")
+        return True
+
+    @property
+    def bytes_received(self):
+        with self._lock:
+            return sum(len(message.data) for message in self.messages)
+
+    def reset(self):
+        """Forget received messages and counters"""
+        with self._lock:
+            self.messages = []
+            self.rejected = 0
+            self.connections = 0
+
+    def start(self):
+        self._server = _ThreadingServer((self.host, self.requested_port), _SMTPHandler)
+        self._server.owner = self
+        self._thread = threading.Thread(target=self._server.serve_forever, name='local-smtp', daemon=True)
+        self._thread.start()
+        logger.info(f"Local SMTP stand-in listening on {self.host}:{self.port}")
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+def main():
+    setup_logging(fmt='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1025)
+    parser.add_argument('--fail-first', type=int, default=0, help='Reject the first N messages (451)')
+    parser.add_argument('--latency-ms', type=float, default=0, help='Delay before answering each message')
+    args = parser.parse_args()
+
+    server = LocalSMTPServer(args.host, args.port, args.fail_first, args.latency_ms / 1000).start()
+    seen = 0
+    try:
+        while True:
+            time.sleep(0.5)
+            for message in server.messages[seen:]:
+                subject = message_from_bytes(message.data).get('Subject', '')
+                logger.info(f"{message.mail_from} -> {', '.join(message.rcpt_tos)}: "
+                            f"{subject} ({len(message.data):,} bytes)")
+            seen = len(server.messages)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
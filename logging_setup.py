@@ -0,0 +1,179 @@
+"""
+Process-wide logging setup
+
+Entry points call setup_logging() once; library modules only create their
+logger. Every record goes through a QueueHandler, so the calling thread (a
+scrape stage, a dashboard callback) only puts it on a queue, and a
+QueueListener thread does the formatting and the console and file I/O.
+
+The queue is a pipe shared with forked children (gunicorn workers,
+background callback processes): their records are written by the process
+that called setup_logging(), so only one process ever rotates a log file.
+
+    LOG_FORMAT=json       one JSON object per line instead of text
+    LOG_MAX_BYTES         size at which a log file is rotated
+    LOG_BACKUP_COUNT      rotated files kept (app.log.1 ... app.log.N)
+    LOG_RATE_LIMIT        INFO/DEBUG records let through per call site per
+                          minute; the rest are counted and dropped (0 = all)
+"""
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import threading
+import time
+from datetime import datetime
+from config import Config
+
+DEFAULT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else was passed with extra=
+_RECORD_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+_queue_handler = None
+_listener = None
+# The process that owns the listener and the handlers
+_writer_pid = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with any extra= fields alongside the standard ones"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'process': record.process,
+            'thread': record.threadName,
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Let at most `limit` INFO/DEBUG records per call site through per
+    `window` seconds. The next record let through from a throttled site
+    says how many were dropped. Warnings and errors always pass.
+    """
+
+    def __init__(self, limit, window=60.0):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self._sites = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.limit:
+            return True
+
+        site = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            started, count, dropped = self._sites.get(site, (now, 0, 0))
+            if now - started >= self.window:
+                started, count = now, 0
+            if count >= self.limit:
+                self._sites[site] = (started, count, dropped + 1)
+                return False
+            self._sites[site] = (started, count + 1, 0)
+
+        if dropped:
+            record.msg = f"{record.getMessage()} ({dropped} similar messages suppressed)"
+            record.args = None
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # Merge the arguments and render the traceback now, while they are
+        # still valid, but leave the formatting itself to the listener
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        # multiprocessing.SimpleQueue has only put() and get()
+        self.queue.put(record)
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    def dequeue(self, block):
+        return self.queue.get()
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+def _stop_listener():
+    # Forked children inherit this exit hook, but the listener is the parent's
+    if _listener is not None and os.getpid() == _writer_pid:
+        _listener.stop()
+
+
+def setup_logging(log_file=None, fmt=DEFAULT_FORMAT, level=None, console=True):
+    """
+    Send this process's logging through a queue to the console and, if
+    given, a size-rotated log file. Only the first call in a process (or
+    in the parent, for forked children) takes effect; forked children keep
+    sending their records to the parent, which writes them.
+
+    Args:
+        log_file: Path of the log file (e.g. 'logs/app.log'); None for console only
+        fmt: Text format (ignored when LOG_FORMAT=json)
+        level: Root level name or number (Config.LOG_LEVEL)
+        console: Also log to stderr
+    """
+    global _queue_handler, _listener, _writer_pid
+    if _queue_handler is not None:
+        return
+
+    formatter = JsonFormatter() if Config.LOG_FORMAT == 'json' else logging.Formatter(fmt)
+    handlers = []
+    if console:
+        handlers.append(logging.StreamHandler())
+    if log_file:
+        log_dir = os.path.dirname(log_file)
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+        handlers.append(logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=Config.LOG_MAX_BYTES, backupCount=Config.LOG_BACKUP_COUNT, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    # A pipe rather than an in-process queue, so that forked children write
+    # to the same listener instead of rotating the file on their own
+    log_queue = multiprocessing.SimpleQueue()
+    _queue_handler = _QueueHandler(log_queue)
+    if Config.LOG_RATE_LIMIT:
+        _queue_handler.addFilter(SamplingFilter(Config.LOG_RATE_LIMIT))
+    _listener = _QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    _writer_pid = os.getpid()
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(level or Config.LOG_LEVEL)
+
+    # Registered after logging's own exit hook, so it runs first and the
+    # queue is drained before the handlers are closed
+    atexit.register(_stop_listener)
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Off-peak database maintenance
+
+Runs nightly from the scheduler (MAINTENANCE_HOUR:MAINTENANCE_MINUTE), away
+from the scrape and dashboard peaks:
+
+    cleanup      delete rows older than DATA_RETENTION_DAYS
+    vacuum       return the freed pages to the filesystem (incremental vacuum;
+                 the first run converts an older database file with a full VACUUM)
+    analyze      refresh query planner statistics, then PRAGMA optimize
+    integrity    PRAGMA integrity_check
+    checkpoint   copy the WAL into the database and truncate it
+    sizes        record the size of every table and index in db_object_sizes
+
+Each step is timed and recorded in maintenance_log; a failing step is logged
+and the remaining steps still run.
+
+Examples:
+    python maintenance.py               # run every step now
+    python maintenance.py --skip vacuum --skip integrity
+    python maintenance.py --report      # show the last runs and current sizes
+"""
+
+import argparse
+import logging
+import time
+from datetime import datetime
+from database import get_database
+from logging_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+
+def _cleanup(db, run_id):
+    deleted = db.cleanup_old_data()
+    return f"{deleted} old records deleted"
+
+
+def _vacuum(db, run_id):
+    before = db.get_storage_info()
+    if before['auto_vacuum'] != 2:
+        # Databases created before incremental vacuum was enabled need one
+        # full rewrite to switch over
+        db.enable_incremental_vacuum()
+        converted = ' (converted to incremental auto-vacuum)'
+    else:
+        db.incremental_vacuum()
+        converted = ''
+    after = db.get_storage_info()
+    freed = (before['page_count'] - after['page_count']) * after['page_size']
+    return f"{freed / 1024:.0f} KiB freed, {after['file_bytes'] / 1024 / 1024:.1f} MiB on disk{converted}"
+
+
+def _analyze(db, run_id):
+    db.analyze()
+    return None
+
+
+def _integrity(db, run_id):
+    problems = db.integrity_check()
+    if problems:
+        raise RuntimeError(f"{len(problems)} problem(s): {'; '.join(problems[:5])}")
+    return 'ok'
+
+
+def _checkpoint(db, run_id):
+    busy, frames, checkpointed = db.checkpoint_wal()
+    if busy:
+        raise RuntimeError(f"checkpoint blocked by readers ({checkpointed}/{frames} frames copied)")
+    return f"{checkpointed} frames checkpointed"
+
+
+def _sizes(db, run_id):
+    sizes = db.get_object_sizes()
+    db.record_object_sizes(run_id, sizes)
+    total = sizes['size_bytes'].sum()
+    return f"{len(sizes)} objects, {total / 1024 / 1024:.1f} MiB"
+
+
+# Run in this order; each step takes (db, run_id) and returns a short summary
+STEPS = {
+    'cleanup': _cleanup,
+    'vacuum': _vacuum,
+    'analyze': _analyze,
+    'integrity': _integrity,
+    'checkpoint': _checkpoint,
+    'sizes': _sizes,
+}
+
+
+def run_maintenance(db=None, skip=()):
+    """
+    Run the maintenance steps in order, recording each in maintenance_log.
+
+    Args:
+        db: NepseDatabase
+        skip: Names of steps (keys of STEPS) to leave out
+
+    Returns:
+        Dict of step name -> (status, details)
+    """
+    db = db or get_database()
+    run_id = datetime.now().isoformat(sep=' ', timespec='milliseconds')
+    outcome = {}
+
+    logger.info("Starting database maintenance")
+    for name, step in STEPS.items():
+        if name in skip:
+            continue
+
+        started = time.perf_counter()
+        try:
+            details = step(db, run_id)
+            status = 'success'
+        except Exception as e:
+            logger.error(f"Maintenance step {name} failed: {str(e)}", exc_info=True)
+            details, status = str(e), 'failed'
+        duration_ms = (time.perf_counter() - started) * 1000
+
+        logger.info(f"Maintenance {name}: {status} in {duration_ms:.0f} ms" + (f" - {details}" if details else ''))
+        outcome[name] = (status, details)
+        try:
+            db.log_maintenance(run_id, name, status, duration_ms, details)
+        except Exception as e:
+            logger.error(f"Could not record maintenance step {name}: {str(e)}")
+
+    failed = [name for name, (status, _) in outcome.items() if status != 'success']
+    logger.info("Database maintenance finished" + (f", failed steps: {', '.join(failed)}" if failed else ''))
+    return outcome
+
+
+def main():
+    setup_logging(fmt='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--skip', action='append', default=[], choices=list(STEPS),
+                        help='Leave out a step; repeatable')
+    parser.add_argument('--report', action='store_true', help='Show recent runs and current sizes instead')
+    args = parser.parse_args()
+
+    db = get_database()
+    if args.report:
+        print(db.get_maintenance_log().to_string(index=False))
+        print()
+        sizes = db.get_object_sizes().sort_values('size_bytes', ascending=False)
+        print(sizes.to_string(index=False))
+        return
+
+    outcome = run_maintenance(db, skip=args.skip)
+    if any(status != 'success' for status, _ in outcome.values()):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Prometheus metrics for the scraper, database, dashboard and email outbox
+
+Every process (WSGI workers, background callback processes, the scheduler)
+records into files under METRICS_DIR, and /metrics on the dashboard adds
+them all up, so a scrape running in the scheduler process shows up on the
+web server. Files of processes that have exited (scrape workers, background
+callbacks) are folded into one aggregate file per metric type, and the
+entry points clear them on startup.
+"""
+
+import contextlib
+import functools
+import inspect
+import logging
+import os
+import time
+import psutil
+from config import Config
+
+try:
+    import fcntl
+except ImportError:  # Windows: dead processes' files are left in place
+    fcntl = None
+
+# Must be set before prometheus_client is imported anywhere in the process
+METRICS_DIR = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', Config.METRICS_DIR)
+os.makedirs(METRICS_DIR, exist_ok=True)
+
+from prometheus_client import CollectorRegistry, Counter, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client import multiprocess
+from prometheus_client.mmap_dict import MmapedDict
+
+logger = logging.getLogger(__name__)
+
+# Page loads take seconds; queries, callbacks and SMTP sends milliseconds
+_SLOW_BUCKETS = (0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+_FAST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+SCRAPE_SECONDS = Histogram('nepse_scrape_seconds', 'Time per scrape stage and category',
+                           ['category', 'stage'], buckets=_SLOW_BUCKETS)
+SCRAPE_ERRORS = Counter('nepse_scrape_errors_total', 'Categories that failed a scrape stage',
+                        ['category', 'stage'])
+FETCH_RETRIES = Counter('nepse_fetch_retries_total', 'Page loads retried after a failure', ['page'])
+ROWS_WRITTEN = Counter('nepse_rows_written_total', 'Rows inserted or upserted', ['table'])
+DB_QUERY_SECONDS = Histogram('nepse_db_query_seconds', 'NepseDatabase method latency',
+                             ['method'], buckets=_FAST_BUCKETS)
+CALLBACK_SECONDS = Histogram('nepse_callback_seconds', 'Dash callback latency',
+                             ['callback'], buckets=_FAST_BUCKETS)
+CALLBACK_ERRORS = Counter('nepse_callback_errors_total', 'Dash callbacks that raised', ['callback'])
+CACHE_REQUESTS = Counter('nepse_cache_requests_total', 'Shared query cache lookups',
+                         ['function', 'result'])
+EMAIL_SEND_SECONDS = Histogram('nepse_email_send_seconds', 'SMTP send latency per message',
+                               ['result'], buckets=_FAST_BUCKETS)
+
+
+# Metric types whose values add up across processes (no gauges are used)
+_ADDITIVE_TYPES = ('counter', 'histogram', 'summary')
+
+
+@contextlib.contextmanager
+def _locked_dir():
+    """Serialize compaction and reads of METRICS_DIR across processes"""
+    if fcntl is None:
+        yield False
+        return
+    with open(os.path.join(METRICS_DIR, '.lock'), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield True
+
+
+def _file_pid(name):
+    """The pid in a per-process metric file name (counter_1234.db), or None"""
+    stem, ext = os.path.splitext(name)
+    kind, _, pid = stem.rpartition('_')
+    if ext != '.db' or kind not in _ADDITIVE_TYPES or not pid.isdigit():
+        return None
+    return int(pid)
+
+
+def _compact_dead_processes():
+    """Fold the files of exited processes into <type>_aggregate.db. Lock must be held."""
+    dead = {}
+    for name in os.listdir(METRICS_DIR):
+        pid = _file_pid(name)
+        if pid is not None and not psutil.pid_exists(pid):
+            dead.setdefault(name.split('_')[0], []).append(os.path.join(METRICS_DIR, name))
+
+    for kind, paths in dead.items():
+        totals = {}
+        for path in paths:
+            for key, value, _, _ in MmapedDict.read_all_values_from_file(path):
+                totals[key] = totals.get(key, 0.0) + value
+
+        aggregate = MmapedDict(os.path.join(METRICS_DIR, f'{kind}_aggregate.db'))
+        try:
+            for key, value in totals.items():
+                aggregate.write_value(key, aggregate.read_value(key)[0] + value, 0.0)
+        finally:
+            aggregate.close()
+        for path in paths:
+            os.remove(path)
+        logger.debug(f"Merged {len(paths)} {kind} file(s) of exited processes")
+
+
+def reset_metrics_dir():
+    """
+    Start the counts from zero: drop the files of processes that are no
+    longer running and the aggregates. Files of live processes (a scheduler
+    started separately) are kept. Call once at startup, before any worker
+    starts.
+    """
+    with _locked_dir():
+        for name in os.listdir(METRICS_DIR):
+            if not name.endswith('.db'):
+                continue
+            pid = _file_pid(name)
+            if pid is None or not psutil.pid_exists(pid):
+                os.remove(os.path.join(METRICS_DIR, name))
+
+
+def render():
+    """
+    Current metrics of every process in the Prometheus text format.
+
+    Returns:
+        (body bytes, content type)
+    """
+    with _locked_dir() as locked:
+        if locked:
+            _compact_dead_processes()
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def timed_methods(cls):
+    """
+    Class decorator: record the latency of every public method in
+    DB_QUERY_SECONDS, labelled with the method name. Generator methods
+    (the iter_* streams) are left alone, their cost is the consumer's.
+    """
+    for name, member in list(vars(cls).items()):
+        if name.startswith('_') or not inspect.isfunction(member) or inspect.isgeneratorfunction(member):
+            continue
+        setattr(cls, name, _timed(member, name))
+    return cls
+
+
+def _timed(func, name):
+    # Labels are resolved per call: creating them at import time would open
+    # this process's metric files before reset_metrics_dir() runs
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with DB_QUERY_SECONDS.labels(method=name).time():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def timed_callback(func):
+    """Record a Dash callback's latency (and failures) under its function name"""
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            # PreventUpdate is control flow, not a failure
+            if type(e).__name__ != 'PreventUpdate':
+                CALLBACK_ERRORS.labels(callback=name).inc()
+            raise
+        finally:
+            CALLBACK_SECONDS.labels(callback=name).observe(time.perf_counter() - started)
+
+    return wrapper
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Standalone scheduler process for production deployments.
+
+Only one instance can run at a time: a second copy finds the lock file held
+and exits, so scraping never runs twice.
+"""
+
+import os
+import sys
+import time
+import signal
+import logging
+
+os.makedirs('data', exist_ok=True)
+
+from logging_setup import setup_logging
+from scheduler import NepseScheduler, acquire_scheduler_lock
+
+logger = logging.getLogger(__name__)
+
+
+def _handle_sigterm(signum, frame):
+    raise SystemExit(0)
+
+
+def main():
+    """Run the scheduler until interrupted"""
+    setup_logging('logs/scheduler.log')
+
+    lock = acquire_scheduler_lock()
+    if lock is None:
+        logger.warning("Scheduler already running elsewhere (lock held), exiting")
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, _handle_sigterm)
+
+    scheduler = NepseScheduler()
+    scheduler.start()
+    logger.info(f"Scheduler process running (pid {os.getpid()})")
+
+    try:
+        while True:
+            time.sleep(60)
+    except (KeyboardInterrupt, SystemExit):
+        logger.info("Stopping scheduler...")
+        scheduler.stop()
+    finally:
+        lock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -6,19 +6,19 @@ Standalone scraper script for manual execution or testing
 import sys
 from datetime import datetime
 from scraper import NepseScraper
-from database import NepseDatabase
+from database import get_database
 from email_alerts import EmailAlerts
+from events import attach_default_subscribers
+from logging_setup import setup_logging
 import logging
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
 
 def main():
     """Run scraper manually"""
+    setup_logging(fmt='%(asctime)s - %(levelname)s - %(message)s')
+
     logger.info("=" * 60)
     logger.info("NEPSE Data Scraper - Manual Run")
     logger.info(f"Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
@@ -26,8 +26,9 @@ def main():
 
     # Initialize components
     scraper = NepseScraper()
-    db = NepseDatabase()
+    db = get_database()
     email_alerts = EmailAlerts()
+    attach_default_subscribers(db, email_alerts)
 
     # Scrape all data
     logger.info("Starting data scraping...")
@@ -36,22 +37,24 @@ def main():
     # Get today's date
     today = datetime.now().strftime('%Y-%m-%d')
 
-    # Store data in database
+    # Store data in database; alert rules and cache invalidation run from
+    # the commit events
     total_records = 0
     categories_scraped = []
 
-    for category, df in results.items():
-        if df is not None and not df.empty:
-            logger.info(f"\n{category.upper()}:")
-            logger.info(f"Scraped {len(df)} records")
-            print(df.head())
+    with db.events.batch(today):
+        for category, df in results.items():
+            if df is not None and not df.empty:
+                logger.info(f"\n{category.upper()}:")
+                logger.info(f"Scraped {len(df)} records")
+                print(df.head())
 
-            records = db.insert_data(category, df, today)
-            total_records += records
-            categories_scraped.append(category)
-            logger.info(f"Stored {records} records in database")
-        else:
-            logger.warning(f"{category}: No data scraped")
+                records = db.insert_data(category, df, today)
+                total_records += records
+                categories_scraped.append(category)
+                logger.info(f"Stored {records} records in database")
+            else:
+                logger.warning(f"{category}: No data scraped")
 
     # Log scrape
     db.log_scrape('success', categories_scraped, total_records)
@@ -60,11 +63,18 @@ def main():
     logger.info(f"Scraping completed: {total_records} total records added")
     logger.info("=" * 60)
 
+    # Wait for the alert rules to queue their emails
+    db.events.drain()
+    emails_queued = bool(db.get_due_emails(1))
+
     # Ask if user wants to send email
     if '--send-email' in sys.argv:
         logger.info("Sending daily summary email...")
         email_alerts.send_daily_summary(results)
-        logger.info("Email sent!")
+
+    if emails_queued or '--send-email' in sys.argv:
+        sent = email_alerts.outbox.deliver_pending()
+        logger.info(f"Sent {sent} email(s)")
 
     # Clean up old data
     if '--cleanup' in sys.argv:
@@ -1,130 +1,291 @@
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 from datetime import datetime
+import asyncio
+import functools
 import logging
+import threading
+import os
 import pytz
 from config import Config
 from scraper import NepseScraper
-from database import NepseDatabase
+from database import get_database
 from email_alerts import EmailAlerts
+from events import attach_default_subscribers
+from scrape_worker import run_isolated, run_isolated_async, scrape_day
+from backfill import backfill
+from maintenance import run_maintenance
+from logging_setup import setup_logging
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/scheduler.log'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
+
+def acquire_scheduler_lock(lock_path=None):
+    """
+    Take an exclusive, non-blocking lock so only one scheduler ever runs.
+
+    The lock is held for as long as the returned file handle stays open and is
+    released automatically by the OS if the process dies.
+
+    Returns:
+        Open file handle holding the lock, or None if another process has it
+    """
+    lock_path = lock_path or Config.SCHEDULER_LOCK_FILE
+    lock_dir = os.path.dirname(lock_path)
+    if lock_dir:
+        os.makedirs(lock_dir, exist_ok=True)
+
+    handle = open(lock_path, 'a+')
+    try:
+        if os.name == 'nt':
+            import msvcrt
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return None
+
+    handle.seek(0)
+    handle.truncate()
+    handle.write(str(os.getpid()))
+    handle.flush()
+    return handle
+
+
+def _in_thread(func, *args, **kwargs):
+    """Run blocking work (queries, rendering) off the event loop"""
+    return asyncio.get_running_loop().run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+
 class NepseScheduler:
-    def __init__(self):
-        self.scheduler = BackgroundScheduler(timezone=Config.TIMEZONE)
+    """
+    Schedules the daily scrape, weekly emails, nightly maintenance and the
+    startup catch-up.
+
+    In 'thread' mode (the default) jobs run on APScheduler's thread pool. In
+    'asyncio' mode they are coroutines on one event loop in a background
+    thread: independent steps run concurrently, jobs have deadlines
+    (JOB_DEADLINE_SECONDS) and stop() cancels running jobs, killing their
+    scrape workers.
+
+    Args:
+        db: NepseDatabase (default: the shared instance)
+        email_alerts: EmailAlerts
+        mode: 'thread' or 'asyncio' (Config.SCHEDULER_MODE)
+    """
+
+    def __init__(self, db=None, email_alerts=None, mode=None):
+        self.mode = mode or Config.SCHEDULER_MODE
+        if self.mode == 'asyncio':
+            self.loop = asyncio.new_event_loop()
+            self.scheduler = AsyncIOScheduler(event_loop=self.loop, timezone=Config.TIMEZONE)
+        elif self.mode == 'thread':
+            self.loop = None
+            self.scheduler = BackgroundScheduler(timezone=Config.TIMEZONE)
+        else:
+            raise ValueError(f"Unknown scheduler mode: {self.mode}")
         self.scraper = NepseScraper()
-        self.db = NepseDatabase()
-        self.email_alerts = EmailAlerts()
+        self.db = db or get_database()
+        self.email_alerts = email_alerts or EmailAlerts(db=self.db)
+
+        # Alert rules and cache invalidation run from the database's commit events
+        attach_default_subscribers(self.db, self.email_alerts)
+        self.calendar = self.db.calendar
 
     def is_market_holiday(self):
         """Check if today is a market holiday"""
-        today = datetime.now().strftime('%Y-%m-%d')
-        today_day = datetime.now().strftime('%A')
-
-        # Saturday is market holiday in Nepal
-        if today_day == 'Saturday':
-            logger.info("Today is Saturday (market closed)")
+        reason = self.calendar.closure_reason()
+        if reason:
+            logger.info(f"Market closed today: {reason}")
             return True
-
-        # Check configured holidays
-        if today in Config.MARKET_HOLIDAYS:
-            logger.info(f"Today is a market holiday: {today}")
-            return True
-
         return False
 
+    def next_scrape_day(self):
+        """Trading day of the next daily scrape"""
+        now = datetime.now()
+        if (now.hour, now.minute) < (Config.SCRAPE_HOUR, Config.SCRAPE_MINUTE) and self.calendar.is_trading_day(now):
+            return now.date()
+        return self.calendar.next_trading_day(now)
+
     def daily_scrape_job(self):
         """Main job that runs daily at 4 PM"""
         logger.info("=" * 50)
         logger.info("Starting daily scrape job")
 
-        # Check if market is closed (Saturday or configured holiday)
+        # Check if market is closed (off day, holiday or known closure)
         if self.is_market_holiday():
             logger.info("Market is closed today (holiday/weekend), skipping scrape")
             self.db.log_scrape('skipped', [], 0, 'Market closed - holiday/weekend')
             return
 
+        today = datetime.now().strftime('%Y-%m-%d')
         try:
-            # Scrape all data
-            results = self.scraper.scrape_all()
+            if Config.SCRAPE_IN_SUBPROCESS:
+                # Browser and scrape buffers live and die in a worker process
+                summary = run_isolated('scrape_day', today)
+            else:
+                summary = scrape_day(today, self.db, self.email_alerts, self.scraper)
 
-            # Check if market is actually closed by comparing data
-            is_market_closed = self.db.check_all_tables_for_market_closure(results)
+            if summary['market_closed']:
+                self.calendar.reload()
 
-            if is_market_closed:
-                logger.warning("=" * 50)
-                logger.warning("⚠️  MARKET APPEARS CLOSED - Data identical to previous day")
-                logger.warning("Skipping data insertion to avoid duplicates")
-                logger.warning("=" * 50)
-                self.db.log_scrape('skipped', [], 0, 'Market closed - data unchanged')
+            # Deliver what the scrape queued (summary, closure and rule alerts)
+            self.email_alerts.outbox.notify()
 
-                # Still send email notification about market closure
-                logger.info("Sending market closure notification email...")
-                self.email_alerts.send_market_closure_alert()
+        except Exception as e:
+            logger.error(f"Error during daily scrape: {str(e)}", exc_info=True)
+            self.db.log_scrape('failed', [], 0, str(e))
 
-                return
+        logger.info("Daily scrape job completed")
+        logger.info("=" * 50)
 
-            # Get today's date
-            today = datetime.now().strftime('%Y-%m-%d')
+    def catch_up_job(self):
+        """Recover trading days missed while the scheduler wasn't running"""
+        try:
+            if Config.SCRAPE_IN_SUBPROCESS:
+                run_isolated('catch_up')
+                self.email_alerts.outbox.notify()
+            else:
+                backfill(self.db)
+        except Exception as e:
+            logger.error(f"Error during missed-day catch-up: {str(e)}", exc_info=True)
 
-            # Store data in database
-            total_records = 0
-            categories_scraped = []
+    def maintenance_job(self):
+        """Nightly database maintenance (retention cleanup, vacuum, statistics)"""
+        try:
+            run_maintenance(self.db)
+        except Exception as e:
+            logger.error(f"Error during database maintenance: {str(e)}", exc_info=True)
 
-            for category, df in results.items():
-                if df is not None and not df.empty:
-                    records = self.db.insert_data(category, df, today)
-                    total_records += records
-                    categories_scraped.append(category)
-                    logger.info(f"Stored {records} records for {category}")
+    def weekly_analysis_job(self):
+        """Weekly job to send analysis emails (runs every Sunday at 8 PM)"""
+        logger.info("Starting weekly analysis job")
 
-            # Log successful scrape
-            self.db.log_scrape('success', categories_scraped, total_records)
+        try:
+            # All three alerts go out over a single SMTP connection
+            with self.email_alerts.batch():
+                # Send hot stocks alert
+                self.email_alerts.send_hot_stocks_alert(days=7, min_occurrences=3)
 
-            logger.info(f"Daily scrape completed: {total_records} records added")
+                # Send danger stocks alert
+                self.email_alerts.send_danger_stocks_alert(days=7, min_occurrences=3)
 
-            # Send daily summary email
-            logger.info("Sending daily summary email...")
-            self.email_alerts.send_daily_summary(results)
+                # Send IPO alert
+                self.email_alerts.send_ipo_alert()
 
-            # Clean up old data (beyond retention period)
-            deleted = self.db.cleanup_old_data()
-            logger.info(f"Cleaned up {deleted} old records")
+            logger.info("Weekly analysis emails sent")
 
         except Exception as e:
-            logger.error(f"Error during daily scrape: {str(e)}", exc_info=True)
-            self.db.log_scrape('failed', [], 0, str(e))
+            logger.error(f"Error during weekly analysis: {str(e)}", exc_info=True)
 
-        logger.info("Daily scrape job completed")
+    async def daily_scrape_job_async(self):
+        """
+        daily_scrape_job for the event loop; cancelling it kills the scrape
+        worker. An in-process scrape (SCRAPE_IN_SUBPROCESS=false) can't be
+        killed: past JOB_DEADLINE_SECONDS, or when cancelled, it stops at the
+        next page and queues no emails.
+        """
         logger.info("=" * 50)
+        logger.info("Starting daily scrape job")
 
-    def weekly_analysis_job(self):
-        """Weekly job to send analysis emails (runs every Sunday at 8 PM)"""
-        logger.info("Starting weekly analysis job")
+        if await _in_thread(self.is_market_holiday):
+            logger.info("Market is closed today (holiday/weekend), skipping scrape")
+            await _in_thread(self.db.log_scrape, 'skipped', [], 0, 'Market closed - holiday/weekend')
+            return
 
+        today = datetime.now().strftime('%Y-%m-%d')
+        cancel = threading.Event()
         try:
-            # Send hot stocks alert
-            self.email_alerts.send_hot_stocks_alert(days=7, min_occurrences=3)
+            if Config.SCRAPE_IN_SUBPROCESS:
+                summary = await run_isolated_async('scrape_day', today)
+            else:
+                summary = await asyncio.wait_for(
+                    _in_thread(scrape_day, today, self.db, self.email_alerts, self.scraper, cancel=cancel),
+                    Config.JOB_DEADLINE_SECONDS)
+
+            if summary['market_closed']:
+                await _in_thread(self.calendar.reload)
+            self.email_alerts.outbox.notify()
+
+        except asyncio.CancelledError:
+            cancel.set()
+            logger.warning("Daily scrape cancelled")
+            await _in_thread(self.db.log_scrape, 'failed', [], 0, 'Cancelled')
+            raise
+        except asyncio.TimeoutError:
+            cancel.set()
+            logger.error(f"Daily scrape passed its {Config.JOB_DEADLINE_SECONDS}s deadline")
+            await _in_thread(self.db.log_scrape, 'failed', [], 0,
+                             f"Passed the {Config.JOB_DEADLINE_SECONDS}s deadline")
+        except Exception as e:
+            logger.error(f"Error during daily scrape: {str(e)}", exc_info=True)
+            await _in_thread(self.db.log_scrape, 'failed', [], 0, str(e))
 
-            # Send danger stocks alert
-            self.email_alerts.send_danger_stocks_alert(days=7, min_occurrences=3)
+        logger.info("Daily scrape job completed")
+        logger.info("=" * 50)
 
-            # Send IPO alert
-            self.email_alerts.send_ipo_alert()
+    async def catch_up_job_async(self):
+        """catch_up_job for the event loop"""
+        try:
+            if Config.SCRAPE_IN_SUBPROCESS:
+                await run_isolated_async('catch_up')
+                self.email_alerts.outbox.notify()
+            else:
+                # backfill has no cancel point: past the deadline the job stops
+                # waiting, but the thread finishes the days it has started
+                await asyncio.wait_for(_in_thread(backfill, self.db), Config.JOB_DEADLINE_SECONDS)
+        except asyncio.TimeoutError:
+            logger.error(f"Missed-day catch-up passed its {Config.JOB_DEADLINE_SECONDS}s deadline")
+        except Exception as e:
+            logger.error(f"Error during missed-day catch-up: {str(e)}", exc_info=True)
+
+    async def maintenance_job_async(self):
+        """maintenance_job, run off the event loop"""
+        # SQLite can't interrupt a VACUUM part-way, so this one has no deadline
+        await _in_thread(self.maintenance_job)
+
+    def _send_unless_cancelled(self, cancel, send, *args, **kwargs):
+        with self.email_alerts.cancellable(cancel):
+            return send(*args, **kwargs)
+
+    async def weekly_analysis_job_async(self):
+        """
+        weekly_analysis_job with the three alerts queried and rendered
+        concurrently. Alerts still being built at the deadline (or when the
+        job is cancelled) are dropped instead of queued late.
+        """
+        logger.info("Starting weekly analysis job")
 
+        cancel = threading.Event()
+        send = functools.partial(_in_thread, self._send_unless_cancelled, cancel)
+        try:
+            # Still delivered together over one SMTP connection once all are queued
+            with self.email_alerts.batch():
+                alerts = {
+                    'hot stocks': send(self.email_alerts.send_hot_stocks_alert, days=7, min_occurrences=3),
+                    'danger stocks': send(self.email_alerts.send_danger_stocks_alert, days=7, min_occurrences=3),
+                    'IPO': send(self.email_alerts.send_ipo_alert),
+                }
+                try:
+                    results = await asyncio.wait_for(asyncio.gather(*alerts.values(), return_exceptions=True),
+                                                     Config.JOB_DEADLINE_SECONDS)
+                finally:
+                    cancel.set()
+            for name, result in zip(alerts, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Error sending {name} alert: {str(result)}")
             logger.info("Weekly analysis emails sent")
 
-        except Exception as e:
-            logger.error(f"Error during weekly analysis: {str(e)}", exc_info=True)
+        except asyncio.TimeoutError:
+            logger.error(f"Weekly analysis passed its {Config.JOB_DEADLINE_SECONDS}s deadline")
+
+    def _job(self, name):
+        """The thread or coroutine version of a job, for the current mode"""
+        return getattr(self, f"{name}_async" if self.loop is not None else name)
 
     def start(self):
         """Start the scheduler"""
@@ -133,10 +294,12 @@ class NepseScheduler:
         if not os.path.exists('logs'):
             os.makedirs('logs')
 
-        # Daily scrape at 4 PM (16:00)
+        # Daily scrape at 4 PM (16:00), on weekly trading days only; holidays
+        # are skipped by daily_scrape_job before the browser is launched
         self.scheduler.add_job(
-            self.daily_scrape_job,
+            self._job('daily_scrape_job'),
             CronTrigger(
+                day_of_week=self.calendar.cron_day_of_week(),
                 hour=Config.SCRAPE_HOUR,
                 minute=Config.SCRAPE_MINUTE,
                 timezone=Config.TIMEZONE
@@ -145,11 +308,12 @@ class NepseScheduler:
             name='Daily NEPSE Data Scrape',
             replace_existing=True
         )
-        logger.info(f"Scheduled daily scrape at {Config.SCRAPE_HOUR}:{Config.SCRAPE_MINUTE:02d} {Config.TIMEZONE}")
+        logger.info(f"Scheduled daily scrape at {Config.SCRAPE_HOUR}:{Config.SCRAPE_MINUTE:02d} {Config.TIMEZONE} "
+                    f"({self.calendar.cron_day_of_week()}); next scrape on {self.next_scrape_day()}")
 
         # Weekly analysis on Sunday at 8 PM (20:00)
         self.scheduler.add_job(
-            self.weekly_analysis_job,
+            self._job('weekly_analysis_job'),
             CronTrigger(
                 day_of_week='sun',
                 hour=20,
@@ -162,21 +326,60 @@ class NepseScheduler:
         )
         logger.info("Scheduled weekly analysis on Sundays at 20:00")
 
+        # Database maintenance every night, well clear of the scrape
+        self.scheduler.add_job(
+            self._job('maintenance_job'),
+            CronTrigger(
+                hour=Config.MAINTENANCE_HOUR,
+                minute=Config.MAINTENANCE_MINUTE,
+                timezone=Config.TIMEZONE
+            ),
+            id='maintenance',
+            name='Nightly Database Maintenance',
+            replace_existing=True
+        )
+        logger.info(f"Scheduled database maintenance at {Config.MAINTENANCE_HOUR}:{Config.MAINTENANCE_MINUTE:02d}")
+
+        # Catch up on days missed while we were down (runs once, right away)
+        self.scheduler.add_job(
+            self._job('catch_up_job'),
+            id='catch_up',
+            name='Missed-Day Catch-Up',
+            replace_existing=True
+        )
+
         # Start the scheduler
+        if self.loop is not None:
+            threading.Thread(target=self.loop.run_forever, name='scheduler-loop', daemon=True).start()
         self.scheduler.start()
-        logger.info("Scheduler started successfully")
+        logger.info(f"Scheduler started successfully ({self.mode} mode)")
+
+        # Deliver queued emails in the background (also retries old failures)
+        self.email_alerts.outbox.start()
 
     def stop(self):
         """Stop the scheduler"""
         self.scheduler.shutdown()
+        if self.loop is not None:
+            # Cancel jobs still running (their workers are killed), then stop the loop
+            asyncio.run_coroutine_threadsafe(self._cancel_jobs(), self.loop).result(timeout=60)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        self.email_alerts.outbox.stop()
         logger.info("Scheduler stopped")
 
+    async def _cancel_jobs(self):
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
     def run_now(self):
         """Manually trigger the scrape job (for testing)"""
         logger.info("Manually triggering scrape job...")
         self.daily_scrape_job()
 
 if __name__ == "__main__":
+    setup_logging('logs/scheduler.log')
     scheduler = NepseScheduler()
 
     # For testing: run immediately
@@ -0,0 +1,379 @@
+"""
+Database schema and its migrations
+
+The schema is built by numbered migrations. Each database records the ones
+it has had in schema_version, so a process starting against an up-to-date
+file runs a single query instead of the whole DDL, and a change to the
+schema is applied exactly once, by whichever process gets there first.
+
+To change the schema, append a migration; never edit one that has shipped:
+
+    def _add_sector_column(cursor):
+        cursor.execute('ALTER TABLE ipo_info ADD COLUMN sector TEXT')
+
+    MIGRATIONS.append((3, 'ipo_info.sector', _add_sector_column))
+"""
+
+import logging
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+
+def _baseline(cursor):
+    """Tables and indexes of databases created before migrations were versioned"""
+
+    # Top Gainers table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS top_gainers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date DATE NOT NULL,
+            symbol TEXT NOT NULL,
+            ltp REAL,
+            change_percent REAL,
+            high REAL,
+            low REAL,
+            open REAL,
+            qty INTEGER,
+            turnover REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(date, symbol)
+        )
+    ''')
+
+    # Top Losers table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS top_losers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date DATE NOT NULL,
+            symbol TEXT NOT NULL,
+            ltp REAL,
+            change_percent REAL,
+            high REAL,
+            low REAL,
+            open REAL,
+            qty INTEGER,
+            turnover REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(date, symbol)
+        )
+    ''')
+
+    # Top Traded table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS top_traded (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date DATE NOT NULL,
+            symbol TEXT NOT NULL,
+            qty INTEGER,
+            ltp REAL,
+            change_percent REAL,
+            turnover REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(date, symbol)
+        )
+    ''')
+
+    # Top Turnovers table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS top_turnovers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date DATE NOT NULL,
+            symbol TEXT NOT NULL,
+            turnover REAL,
+            ltp REAL,
+            change_percent REAL,
+            qty INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(date, symbol)
+        )
+    ''')
+
+    # Top Transactions table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS top_transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date DATE NOT NULL,
+            symbol TEXT NOT NULL,
+            transactions INTEGER,
+            ltp REAL,
+            change_percent REAL,
+            qty INTEGER,
+            turnover REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(date, symbol)
+        )
+    ''')
+
+    # Top Brokers table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS top_brokers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date DATE NOT NULL,
+            broker_no TEXT NOT NULL,
+            broker_name TEXT,
+            buy_contracts INTEGER,
+            buy_amount REAL,
+            sell_contracts INTEGER,
+            sell_amount REAL,
+            total_amount REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(date, broker_no)
+        )
+    ''')
+
+    # IPO Information table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ipo_info (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date_scraped DATE NOT NULL,
+            company_name TEXT NOT NULL,
+            scrip TEXT,
+            opening_date DATE,
+            closing_date DATE,
+            issue_manager TEXT,
+            shares_offered INTEGER,
+            price_per_share REAL,
+            min_units INTEGER,
+            max_units INTEGER,
+            status TEXT,
+            remarks TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(date_scraped, company_name, opening_date)
+        )
+    ''')
+
+    # Scraper log table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scraper_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            scrape_date DATE NOT NULL,
+            scrape_time TIME NOT NULL,
+            status TEXT NOT NULL,
+            categories_scraped TEXT,
+            records_added INTEGER,
+            error_message TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Small key/value table for process-shared state (e.g. data generation)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS app_state (
+            key TEXT PRIMARY KEY,
+            value TEXT,
+            updated_at TIMESTAMP
+        )
+    ''')
+
+    # Outgoing email queue, delivered by the outbox worker with retries
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS email_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            dedup_key TEXT NOT NULL UNIQUE,
+            recipient TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            html_body TEXT NOT NULL,
+            text_body TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TIMESTAMP NOT NULL,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_email_outbox_due
+        ON email_outbox (status, next_attempt_at)
+    ''')
+
+    # One row per delivery attempt
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS email_delivery_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            outbox_id INTEGER NOT NULL,
+            attempt INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            error_message TEXT,
+            duration_ms REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Alert recipients with their own watchlist, threshold and alert types
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS subscribers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT NOT NULL UNIQUE,
+            name TEXT,
+            watchlist TEXT,
+            min_change REAL,
+            alert_types TEXT,
+            active INTEGER DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # User-defined alert rules (see alert_rules.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS alert_rules (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            category TEXT NOT NULL,
+            conditions TEXT,
+            min_occurrences INTEGER,
+            window_days INTEGER,
+            symbols TEXT,
+            active INTEGER DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Rolling per-symbol presence bitmask per category: bit i is set if the
+    # symbol appeared i trading dates before last_seq
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS presence_state (
+            category TEXT NOT NULL,
+            symbol TEXT NOT NULL,
+            bits INTEGER NOT NULL,
+            last_seq INTEGER NOT NULL,
+            PRIMARY KEY (category, symbol)
+        )
+    ''')
+
+    # Trading-date counter per category for presence_state
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS presence_dates (
+            category TEXT PRIMARY KEY,
+            seq INTEGER NOT NULL,
+            last_date DATE NOT NULL
+        )
+    ''')
+
+    # One row per rule hit, so a rule fires once per symbol and date
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS alert_firings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            rule_id INTEGER NOT NULL,
+            symbol TEXT NOT NULL,
+            date DATE NOT NULL,
+            details TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(rule_id, symbol, date)
+        )
+    ''')
+
+    # Per-symbol history lookups (Stock Lookup, price charts)
+    for table in ('top_gainers', 'top_losers', 'top_traded', 'top_turnovers', 'top_transactions'):
+        cursor.execute(f'''
+            CREATE INDEX IF NOT EXISTS idx_{table}_symbol_date
+            ON {table} (symbol, date)
+        ''')
+
+    # Broker rankings aggregate per broker over a date window
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_top_brokers_broker_date
+        ON top_brokers (broker_no, date)
+    ''')
+
+
+def _maintenance_tables(cursor):
+    """History kept by the nightly maintenance job (maintenance.py)"""
+
+    # One row per step of each nightly maintenance run
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS maintenance_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id TEXT NOT NULL,
+            step TEXT NOT NULL,
+            status TEXT NOT NULL,
+            duration_ms REAL,
+            details TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Size of every table and index, sampled by each maintenance run
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS db_object_sizes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            type TEXT NOT NULL,
+            table_name TEXT,
+            row_count INTEGER,
+            size_bytes INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+# (version, description, function(cursor)), in order
+MIGRATIONS = [
+    (1, 'baseline schema', _baseline),
+    (2, 'maintenance_log and db_object_sizes', _maintenance_tables),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn):
+    """Highest migration applied to a database (0 if none)"""
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+
+def migrate(db_path):
+    """
+    Bring a database up to LATEST_VERSION.
+
+    Pending migrations run in one transaction under a write lock, so
+    processes starting together (web workers, the scheduler) apply them
+    once between them.
+
+    Returns:
+        The schema version now in place
+    """
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        # Let the nightly maintenance return free pages a few at a time; only
+        # takes effect on a new file (maintenance converts existing ones)
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+
+        # WAL lets dashboard workers keep reading while the scheduler writes
+        conn.execute('PRAGMA journal_mode=WAL')
+
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        version = schema_version(conn)
+        if version >= LATEST_VERSION:
+            if version > LATEST_VERSION:
+                logger.warning(f"{db_path} has schema version {version}, newer than this code ({LATEST_VERSION})")
+            return version
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Another process may have migrated while we waited for the lock
+            version = schema_version(conn)
+            cursor = conn.cursor()
+            for number, description, apply in MIGRATIONS:
+                if number <= version:
+                    continue
+                apply(cursor)
+                cursor.execute('INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                               (number, description))
+                logger.info(f"Applied schema migration {number}: {description}")
+                version = number
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return version
+    finally:
+        conn.close()
@@ -0,0 +1,329 @@
+"""
+Staged scrape pipeline for the daily job
+
+    fetch (Playwright, calling thread) -> parse + validate -> closure gate + upsert
+
+Each category page flows to the next stage as soon as it has loaded, so
+parsing and storing overlap with the remaining page loads. Stages are linked
+by bounded queues: when a later stage falls behind, fetching blocks instead
+of piling up raw HTML. Raw pages are dropped as soon as they are parsed.
+Every stage handles errors per category, so one failed page or insert never
+aborts the others.
+
+Stored rows reach downstream work (alert rules, cache invalidation) through
+the database's events, one batch per run.
+
+Market closure is decided incrementally: each of the closure-check tables is
+compared with the last stored day as it arrives, and the verdict is settled
+as soon as the remaining tables can no longer change it. Rows that arrive
+before the verdict are held back; if the market turns out to be closed
+nothing is stored.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from config import Config
+from metrics import SCRAPE_SECONDS, SCRAPE_ERRORS
+from scraper import CATEGORIES
+
+logger = logging.getLogger(__name__)
+
+CLOSURE_CHECK_TABLES = ['top_gainers', 'top_losers', 'top_traded', 'top_turnovers']
+CLOSURE_RATIO = 0.75
+
+# Column that identifies a row besides the date
+KEY_COLUMNS = {
+    'top_brokers': 'broker_no',
+    'ipo_info': 'company_name',
+}
+
+_DONE = object()
+
+
+def archive_path(date, category, root=None):
+    """Where the raw page of a category is archived: <ARCHIVE_DIR>/<date>/<category>.html"""
+    return os.path.join(root or Config.ARCHIVE_DIR, date, f"{category}.html")
+
+
+def archive_page(date, category, html_content, root=None):
+    """Keep a copy of a fetched page so the day can be re-imported later (see backfill.py)"""
+    path = archive_path(date, category, root)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(html_content)
+
+
+def validate(category, df, column_types):
+    """
+    Keep only what can be stored: known columns, rows with a key, one row per key.
+
+    Raises:
+        ValueError: If the key column is missing
+    """
+    key = KEY_COLUMNS.get(category, 'symbol')
+    if key not in df.columns:
+        raise ValueError(f"missing key column '{key}' (got {', '.join(map(str, df.columns))})")
+
+    unknown = [col for col in df.columns if col not in column_types]
+    if unknown:
+        logger.debug(f"{category}: ignoring columns {unknown}")
+        df = df.drop(columns=unknown)
+
+    df = df[df[key].notna() & (df[key].astype(str).str.strip() != '')]
+    return df.drop_duplicates(subset=[key]).reset_index(drop=True)
+
+
+class ClosureGate:
+    """
+    Incremental version of NepseDatabase.check_all_tables_for_market_closure:
+    the market is closed if at least CLOSURE_RATIO of the checked tables are
+    identical to the last stored day before `date`.
+    """
+
+    def __init__(self, db, date=None, tables=None):
+        self.db = db
+        self.date = date
+        self.pending = set(tables or CLOSURE_CHECK_TABLES)
+        self.identical = 0
+        self.different = 0
+        self.closed = None
+
+    def observe(self, category, df):
+        """
+        Account for one arrived category (df is None if it failed).
+
+        Returns:
+            The verdict (True = closed, False = open) once settled, else None
+        """
+        if self.closed is not None or category not in self.pending:
+            return self.closed
+
+        self.pending.discard(category)
+        if df is not None and not df.empty:
+            if self.db.is_market_closed_by_data_comparison(category, df, self.date):
+                self.identical += 1
+            else:
+                self.different += 1
+
+        # Best and worst case over the tables still to come (a failed table
+        # doesn't count, so it can only push the ratio towards its current value)
+        remaining = len(self.pending)
+        best = self.identical + remaining
+        best_total = self.identical + self.different + remaining
+
+        if best_total == 0 or best < CLOSURE_RATIO * best_total:
+            self.closed = False
+        elif self.identical >= CLOSURE_RATIO * best_total:
+            self.closed = True
+        elif remaining == 0:
+            self.closed = self.identical >= CLOSURE_RATIO * (self.identical + self.different)
+
+        if self.closed is not None:
+            self._log_verdict()
+        return self.closed
+
+    def finish(self):
+        """Final verdict, treating tables that never arrived as failed"""
+        if self.closed is None:
+            checked = self.identical + self.different
+            self.closed = bool(checked) and self.identical >= CLOSURE_RATIO * checked
+            self._log_verdict()
+        return self.closed
+
+    def _log_verdict(self):
+        logger.info(f"Market {'CLOSED' if self.closed else 'OPEN'} - {self.identical}/"
+                    f"{self.identical + self.different} checked tables identical to the previous day")
+
+
+class PipelineResult:
+    """Outcome of one pipeline run"""
+
+    def __init__(self):
+        self.results = {category: None for category in CATEGORIES}
+        self.records = {}
+        self.errors = {}
+        self.market_closed = False
+        self.timings = {}
+
+    @property
+    def total_records(self):
+        return sum(self.records.values())
+
+    @property
+    def categories_scraped(self):
+        return [category for category, count in self.records.items() if count]
+
+
+class ScrapePipeline:
+    """
+    Run the fetch, parse/validate and store stages of a scrape concurrently.
+
+    Args:
+        scraper: NepseScraper (its Playwright browser stays on the calling thread)
+        db: NepseDatabase
+        queue_size: Pages allowed to wait between stages (Config.SCRAPE_QUEUE_SIZE)
+    """
+
+    def __init__(self, scraper, db, queue_size=None):
+        self.scraper = scraper
+        self.db = db
+        self.queue_size = queue_size or Config.SCRAPE_QUEUE_SIZE
+
+    def _parse_stage(self, inbox, outbox, date, result):
+        busy = 0.0
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                break
+
+            category, html_content = item
+            started = time.perf_counter()
+            df = None
+            try:
+                if html_content is None:
+                    result.errors[category] = 'fetch failed'
+                else:
+                    if Config.ARCHIVE_PAGES:
+                        try:
+                            archive_page(date, category, html_content)
+                        except OSError as e:
+                            logger.warning(f"Could not archive {category} page: {str(e)}")
+                    df = self.scraper.parse_category(category, html_content)
+                    if df is None or df.empty:
+                        result.errors[category] = 'no table data'
+                        df = None
+                    else:
+                        df = validate(category, df, self.db.get_column_types(category))
+            except Exception as e:
+                logger.error(f"Error parsing {category}: {str(e)}")
+                result.errors[category] = f"parse failed: {str(e)}"
+                SCRAPE_ERRORS.labels(category=category, stage='parse').inc()
+                df = None
+            finally:
+                # Let the page go before waiting on the next stage
+                del html_content, item
+            elapsed = time.perf_counter() - started
+            SCRAPE_SECONDS.labels(category=category, stage='parse').observe(elapsed)
+            busy += elapsed
+
+            outbox.put((category, df))
+
+        outbox.put(_DONE)
+        result.timings['parse_s'] = busy
+
+    def _store(self, category, df, date, result):
+        try:
+            with SCRAPE_SECONDS.labels(category=category, stage='store').time():
+                result.records[category] = self.db.upsert_data(category, df, date)
+            result.results[category] = df
+        except Exception as e:
+            logger.error(f"Error storing {category}: {str(e)}")
+            result.errors[category] = f"store failed: {str(e)}"
+            SCRAPE_ERRORS.labels(category=category, stage='store').inc()
+
+    def _store_stage(self, inbox, date, result):
+        # One event batch: subscribers get each category's rows as they are
+        # stored, then a single BatchCommitted once the scrape is in
+        with self.db.events.batch(date):
+            self._store_all(inbox, date, result)
+
+    def _store_all(self, inbox, date, result):
+        gate = ClosureGate(self.db, date)
+        held = []
+        busy = 0.0
+
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                break
+
+            category, df = item
+            started = time.perf_counter()
+            try:
+                closed = gate.observe(category, df)
+                if df is not None and closed is None:
+                    # Verdict not settled yet: hold the rows back
+                    held.append((category, df))
+                elif closed is False:
+                    for held_category, held_df in held + ([(category, df)] if df is not None else []):
+                        self._store(held_category, held_df, date, result)
+                    held = []
+                elif df is not None:
+                    # Market closed: keep the scraped frame for reporting only
+                    result.results[category] = df
+            except Exception as e:
+                logger.error(f"Error in store stage for {category}: {str(e)}", exc_info=True)
+                result.errors[category] = f"store stage failed: {str(e)}"
+            busy += time.perf_counter() - started
+
+        result.market_closed = gate.finish()
+        if not result.market_closed:
+            for category, df in held:
+                self._store(category, df, date, result)
+        result.timings['store_s'] = busy
+
+    def run(self, date, cancel=None):
+        """
+        Scrape every category and store it under `date`.
+
+        Args:
+            cancel: threading.Event; once set, no further pages are fetched
+                (pages already fetched are still parsed and stored)
+
+        Returns:
+            PipelineResult
+        """
+        result = PipelineResult()
+        parse_queue = queue.Queue(maxsize=self.queue_size)
+        store_queue = queue.Queue(maxsize=self.queue_size)
+
+        parser = threading.Thread(target=self._parse_stage, args=(parse_queue, store_queue, date, result),
+                                  name='scrape-parse', daemon=True)
+        storer = threading.Thread(target=self._store_stage, args=(store_queue, date, result),
+                                  name='scrape-store', daemon=True)
+        parser.start()
+        storer.start()
+
+        started = time.perf_counter()
+        fetch_busy = 0.0
+        try:
+            with self.scraper:
+                pages = self.scraper.iter_pages()
+                while True:
+                    if cancel is not None and cancel.is_set():
+                        logger.warning("Scrape cancelled, no more pages will be fetched")
+                        result.errors.setdefault('fetch', 'cancelled')
+                        break
+                    fetch_started = time.perf_counter()
+                    item = next(pages, None)
+                    fetch_busy += time.perf_counter() - fetch_started
+                    if item is None:
+                        break
+                    # Blocks while the later stages are behind (backpressure)
+                    parse_queue.put(item)
+                    item = None
+        except Exception as e:
+            logger.error(f"Error fetching pages: {str(e)}", exc_info=True)
+            result.errors.setdefault('fetch', str(e))
+        finally:
+            parse_queue.put(_DONE)
+            parser.join()
+            storer.join()
+
+        for category in CATEGORIES:
+            if result.results.get(category) is None and category not in result.errors:
+                result.errors[category] = 'not fetched'
+
+        result.timings['fetch_s'] = fetch_busy
+        result.timings['wall_s'] = time.perf_counter() - started
+        stage_total = fetch_busy + result.timings.get('parse_s', 0) + result.timings.get('store_s', 0)
+        logger.info(f"Scrape pipeline finished in {result.timings['wall_s']:.1f}s "
+                    f"(fetch {fetch_busy:.1f}s, parse {result.timings.get('parse_s', 0):.1f}s, "
+                    f"store {result.timings.get('store_s', 0):.1f}s; "
+                    f"{max(stage_total - result.timings['wall_s'], 0):.1f}s overlapped)")
+        if result.errors:
+            logger.warning(f"Categories with errors: {result.errors}")
+        return result
@@ -0,0 +1,299 @@
+"""
+Scrape jobs in a separate worker process
+
+Playwright, Chromium and the scrape's DataFrames live in a short-lived
+child process (`python scrape_worker.py <job> [args]`, sharing nothing with
+the web server or scheduler), and the parent only reads back a small JSON
+summary from the worker's stdout. Everything else the job produces reaches
+the parent through the database: rows, the scraper log, alert-rule firings
+and queued emails (delivered by the parent's outbox worker).
+
+The parent kills the worker, browser processes included, if it runs longer
+than SCRAPE_TIMEOUT seconds or their combined resident memory goes over
+SCRAPE_MEMORY_LIMIT_MB.
+
+    summary = run_isolated('scrape_day', '2024-01-15')
+"""
+
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+import psutil
+from config import Config
+from metrics import SCRAPE_ERRORS
+from logging_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# How often the parent checks the worker's runtime and memory
+_POLL_SECONDS = 1.0
+
+
+def scrape_day(date, db=None, email_alerts=None, scraper=None, cancel=None):
+    """
+    Scrape and store one day, log it in scraper_log and queue the daily
+    summary (or market closure) email.
+
+    Args:
+        cancel: threading.Event set by an in-process caller that gave up on
+            the scrape: fetching stops at the next page and nothing is logged
+            or emailed (the caller logs it)
+
+    Returns:
+        Dict with status ('success', 'partial', 'failed' or 'skipped'),
+        market_closed, records (category -> rows stored) and errors
+    """
+    # Imported here so the parent process never loads the scrape stack
+    from database import get_database
+    from email_alerts import EmailAlerts
+    from events import attach_default_subscribers
+    from scrape_pipeline import ScrapePipeline
+    from scraper import NepseScraper
+
+    db = db or get_database()
+    email_alerts = email_alerts or EmailAlerts(db=db)
+    attach_default_subscribers(db, email_alerts)
+    summary = {'status': 'failed', 'market_closed': False, 'records': {}, 'errors': {}}
+
+    try:
+        # Fetch, parse and store each category as its page arrives
+        result = ScrapePipeline(scraper or NepseScraper(), db).run(date, cancel)
+        summary.update(market_closed=result.market_closed, records=result.records, errors=result.errors)
+
+        if cancel is not None and cancel.is_set():
+            return summary
+
+        if result.market_closed:
+            logger.warning("=" * 50)
+            logger.warning("⚠️  MARKET APPEARS CLOSED - Data identical to previous day")
+            logger.warning("Skipped data insertion to avoid duplicates")
+            logger.warning("=" * 50)
+            db.log_scrape('skipped', [], 0, 'Market closed - data unchanged', scrape_date=date)
+            summary['status'] = 'skipped'
+
+            # Still send email notification about market closure
+            logger.info("Sending market closure notification email...")
+            with email_alerts.cancellable(cancel):
+                email_alerts.send_market_closure_alert()
+            return summary
+
+        total_records = result.total_records
+        for category, records in result.records.items():
+            logger.info(f"Stored {records} records for {category}")
+
+        # Log the scrape; a failed category doesn't fail the whole job
+        if result.errors:
+            errors = '; '.join(f"{category}: {error}" for category, error in result.errors.items())
+            summary['status'] = 'partial' if total_records else 'failed'
+            db.log_scrape(summary['status'], result.categories_scraped, total_records, errors)
+        else:
+            summary['status'] = 'success'
+            db.log_scrape('success', result.categories_scraped, total_records)
+
+        logger.info(f"Daily scrape completed: {total_records} records added")
+
+        # Queue daily summary email (delivered by the outbox worker)
+        logger.info("Queueing daily summary email...")
+        with email_alerts.cancellable(cancel):
+            email_alerts.send_daily_summary(result.results)
+
+    except Exception as e:
+        logger.error(f"Error during daily scrape: {str(e)}", exc_info=True)
+        db.log_scrape('failed', [], 0, str(e))
+        summary['errors'] = {'scrape': str(e)}
+
+    finally:
+        # Let the alert rules finish with today's rows
+        db.events.drain()
+
+    return summary
+
+
+def catch_up():
+    """
+    Recover missed trading days (see backfill.py).
+
+    Returns:
+        (list of recovered days, list of days still missing)
+    """
+    from backfill import backfill
+    from database import get_database
+    from email_alerts import EmailAlerts
+    from events import attach_default_subscribers
+
+    db = get_database()
+    attach_default_subscribers(db, EmailAlerts(db=db))
+    recovered, unrecovered = backfill(db)
+    return sorted(recovered), unrecovered
+
+
+# Jobs the worker can run; each takes string arguments and returns
+# something JSON-serializable
+JOBS = {
+    'scrape_day': scrape_day,
+    'catch_up': catch_up,
+}
+
+
+def _tree_rss(process):
+    """Resident memory of a process and all of its children (the browser), in bytes"""
+    total = 0
+    for proc in [process] + process.children(recursive=True):
+        try:
+            total += proc.memory_info().rss
+        except psutil.Error:
+            pass
+    return total
+
+
+def _kill_tree(process):
+    procs = [process]
+    try:
+        procs += process.children(recursive=True)
+    except psutil.Error:
+        pass
+    for proc in procs:
+        try:
+            proc.kill()
+        except psutil.Error:
+            pass
+    psutil.wait_procs(procs, timeout=10)
+
+
+def _check_limits(job, process, started, timeout, memory_limit_mb, peak):
+    """Raise if the worker is over its time or memory limit; returns the new peak memory"""
+    elapsed = time.monotonic() - started
+    if elapsed > timeout:
+        SCRAPE_ERRORS.labels(category=job, stage='timeout').inc()
+        raise TimeoutError(f"{job} worker killed after {elapsed:.0f}s (limit {timeout}s)")
+
+    try:
+        rss = _tree_rss(process)
+    except psutil.Error:
+        # Exited since the last check; the result is picked up next
+        return peak
+    if memory_limit_mb and rss > memory_limit_mb * 1024 * 1024:
+        SCRAPE_ERRORS.labels(category=job, stage='memory').inc()
+        raise MemoryError(f"{job} worker killed at {rss / 1024 / 1024:.0f} MB (limit {memory_limit_mb} MB)")
+    return max(peak, rss)
+
+
+def _read_result(job, output, returncode, started, peak):
+    logger.info(f"{job} worker finished in {time.monotonic() - started:.0f}s "
+                f"(exit code {returncode}, peak {peak / 1024 / 1024:.0f} MB)")
+    try:
+        message = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+    except (ValueError, IndexError):
+        SCRAPE_ERRORS.labels(category=job, stage='worker').inc()
+        raise RuntimeError(f"{job} worker exited without a result (exit code {returncode})")
+
+    if 'error' in message:
+        SCRAPE_ERRORS.labels(category=job, stage='worker').inc()
+        raise RuntimeError(f"{job} worker failed: {message['error']}")
+    return message['result']
+
+
+def _worker_command(job, args):
+    if job not in JOBS:
+        raise ValueError(f"Unknown worker job: {job}")
+    return [sys.executable, os.path.abspath(__file__), job, *map(str, args)]
+
+
+def run_isolated(job, *args, timeout=None, memory_limit_mb=None):
+    """
+    Run a job from JOBS in a fresh worker process and return its result.
+
+    Args:
+        job: Name of the job
+        args: String arguments for it
+        timeout: Seconds before the worker is killed (Config.SCRAPE_TIMEOUT)
+        memory_limit_mb: Resident memory of the worker and its children
+            before it is killed (Config.SCRAPE_MEMORY_LIMIT_MB; 0 = no limit)
+
+    Raises:
+        TimeoutError: The worker ran past its timeout
+        MemoryError: The worker went over its memory limit
+        RuntimeError: The worker failed or died without a result
+    """
+    timeout = timeout or Config.SCRAPE_TIMEOUT
+    memory_limit_mb = Config.SCRAPE_MEMORY_LIMIT_MB if memory_limit_mb is None else memory_limit_mb
+
+    worker = subprocess.Popen(_worker_command(job, args), stdout=subprocess.PIPE)
+    process = psutil.Process(worker.pid)
+    logger.info(f"Started {job} worker (pid {worker.pid})")
+
+    started = time.monotonic()
+    peak = 0
+    try:
+        while True:
+            try:
+                output, _ = worker.communicate(timeout=_POLL_SECONDS)
+                break
+            except subprocess.TimeoutExpired:
+                peak = _check_limits(job, process, started, timeout, memory_limit_mb, peak)
+    except BaseException:
+        _kill_tree(process)
+        worker.communicate()
+        raise
+
+    return _read_result(job, output, worker.returncode, started, peak)
+
+
+async def run_isolated_async(job, *args, timeout=None, memory_limit_mb=None):
+    """
+    run_isolated() for an asyncio event loop. Cancelling the awaiting task
+    kills the worker.
+    """
+    timeout = timeout or Config.SCRAPE_TIMEOUT
+    memory_limit_mb = Config.SCRAPE_MEMORY_LIMIT_MB if memory_limit_mb is None else memory_limit_mb
+
+    worker = await asyncio.create_subprocess_exec(*_worker_command(job, args), stdout=subprocess.PIPE)
+    process = psutil.Process(worker.pid)
+    logger.info(f"Started {job} worker (pid {worker.pid})")
+
+    started = time.monotonic()
+    peak = 0
+    reader = asyncio.ensure_future(worker.communicate())
+    try:
+        while True:
+            done, _ = await asyncio.wait({reader}, timeout=_POLL_SECONDS)
+            if done:
+                output, _ = reader.result()
+                break
+            peak = _check_limits(job, process, started, timeout, memory_limit_mb, peak)
+    except BaseException:
+        _kill_tree(process)
+        await asyncio.gather(reader, return_exceptions=True)
+        raise
+
+    return _read_result(job, output, worker.returncode, started, peak)
+
+
+def main():
+    """Worker entry point: run one job and write {"result": ...} or {"error": ...} to stdout"""
+    # Keep stdout for the result: anything else printed goes to stderr
+    result_stream = os.fdopen(os.dup(sys.stdout.fileno()), 'w')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    # A log of its own: size-based rotation isn't safe with two processes
+    # writing the same file
+    setup_logging('logs/scrape_worker.log')
+
+    job, args = sys.argv[1], sys.argv[2:]
+    try:
+        message = {'result': JOBS[job](*args)}
+    except BaseException as e:
+        logger.error(f"Worker job {job} failed: {str(e)}", exc_info=True)
+        message = {'error': f"{type(e).__name__}: {str(e)}"}
+
+    result_stream.write(json.dumps(message, default=str) + '\n')
+    result_stream.flush()
+    sys.exit(1 if 'error' in message else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,119 @@
-from playwright.sync_api import sync_playwright
-from bs4 import BeautifulSoup
 import pandas as pd
 from datetime import datetime
 import logging
 import time
 from config import Config
+from metrics import SCRAPE_SECONDS, SCRAPE_ERRORS, FETCH_RETRIES
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+_MOVER_COLUMNS = {
+    's_no': None,  # Drop serial number
+    'symbol': 'symbol',
+    'ltp': 'ltp',
+    'change_rs': 'change_rs',
+    'changepercent': 'change_percent',
+    'change': 'change_percent',
+    'high': 'high',
+    'low': 'low',
+    'open': 'open',
+    'qty': 'qty',
+    'turnover': 'turnover',
+    'volume': 'qty'
+}
+
+# Scrape order, source page (None = IPO_URL), column mapping and numeric
+# columns of each category. The four market-closure check tables come first.
+CATEGORIES = {
+    'top_gainers': {
+        'page': 'Gainers',
+        'columns': _MOVER_COLUMNS,
+        'numeric': ['ltp', 'change_percent', 'high', 'low', 'open', 'qty', 'turnover'],
+    },
+    'top_losers': {
+        'page': 'Losers',
+        'columns': _MOVER_COLUMNS,
+        'numeric': ['ltp', 'change_percent', 'high', 'low', 'open', 'qty', 'turnover'],
+    },
+    'top_traded': {
+        'page': 'Traded',
+        'columns': {
+            's_no': None,
+            'symbol': 'symbol',
+            'qty': 'qty',
+            'volume': 'qty',
+            'shares_traded': 'qty',
+            'ltp': 'ltp',
+            'changepercent': 'change_percent',
+            'change': 'change_percent',
+            'turnover': 'turnover'
+        },
+        'numeric': ['qty', 'ltp', 'change_percent', 'turnover'],
+    },
+    'top_turnovers': {
+        'page': 'Turnovers',
+        'columns': {
+            's_no': None,
+            'symbol': 'symbol',
+            'turnover': 'turnover',
+            'ltp': 'ltp',
+            'changepercent': 'change_percent',
+            'change': 'change_percent',
+            'qty': 'qty',
+            'volume': 'qty'
+        },
+        'numeric': ['turnover', 'ltp', 'change_percent', 'qty'],
+    },
+    'top_transactions': {
+        'page': 'Transactions',
+        'columns': {
+            's_no': None,
+            'symbol': 'symbol',
+            'transactions': 'transactions',
+            'total_transaction': 'transactions',
+            'ltp': 'ltp',
+            'changepercent': 'change_percent',
+            'change': 'change_percent',
+            'qty': 'qty',
+            'volume': 'qty',
+            'turnover': 'turnover'
+        },
+        'numeric': ['transactions', 'ltp', 'change_percent', 'qty', 'turnover'],
+    },
+    'top_brokers': {
+        'page': 'Brokers',
+        'columns': {
+            's_no': None,
+            'broker_no': 'broker_no',
+            'broker_name': 'broker_name',
+            'buy_contracts': 'buy_contracts',
+            'buy_amount': 'buy_amount',
+            'sell_contracts': 'sell_contracts',
+            'sell_amount': 'sell_amount',
+            'total_amount': 'total_amount'
+        },
+        'numeric': ['buy_contracts', 'buy_amount', 'sell_contracts', 'sell_amount', 'total_amount'],
+    },
+    'ipo_info': {
+        'page': None,
+        'columns': {
+            's_no': None,
+            'company_name': 'company_name',
+            'scrip': 'scrip',
+            'opening_date': 'opening_date',
+            'closing_date': 'closing_date',
+            'issue_manager': 'issue_manager',
+            'shares_offered': 'shares_offered',
+            'price_per_share': 'price_per_share',
+            'min_units': 'min_units',
+            'max_units': 'max_units',
+            'status': 'status',
+            'remarks': 'remarks'
+        },
+        'numeric': [],
+    },
+}
+
 class NepseScraper:
     def __init__(self):
         self.pages = Config.PAGES
@@ -18,6 +123,9 @@ class NepseScraper:
 
     def __enter__(self):
         """Context manager entry"""
+        # Imported here so read-only users of this module don't pay for Playwright
+        from playwright.sync_api import sync_playwright
+
         self.playwright = sync_playwright().start()
         self.browser = self.playwright.chromium.launch(headless=True)
         return self
@@ -46,6 +154,7 @@ class NepseScraper:
             except Exception as e:
                 logger.warning(f"Attempt {attempt + 1} failed for {url}: {str(e)}")
                 if attempt < max_retries - 1:
+                    FETCH_RETRIES.labels(page=url.rsplit('/', 1)[-1]).inc()
                     time.sleep(2 ** attempt)
                 else:
                     logger.error(f"Failed to fetch {url} after {max_retries} attempts")
@@ -53,6 +162,8 @@ class NepseScraper:
 
     def _parse_table(self, html_content, table_index=0):
         """Parse HTML table using BeautifulSoup"""
+        from bs4 import BeautifulSoup
+
         try:
             soup = BeautifulSoup(html_content, 'lxml')
             tables = soup.find_all('table')
@@ -104,16 +215,21 @@ class NepseScraper:
             logger.error(f"Error parsing table: {str(e)}")
             return None
 
-    def scrape_top_gainers(self):
-        """Scrape top gainers from ShareSansar"""
-        try:
-            logger.info("Scraping top gainers...")
-            url = self.pages["Gainers"]
+    def _url(self, category):
+        spec = CATEGORIES[category]
+        return self.ipo_url if spec['page'] is None else self.pages[spec['page']]
 
-            html_content = self._fetch_page(url)
-            if not html_content:
-                return None
+    def parse_category(self, category, html_content):
+        """
+        Parse and normalize one category page.
 
+        Returns:
+            DataFrame with the standard column names, or None
+        """
+        spec = CATEGORIES[category]
+        label = category.replace('_', ' ')
+
+        try:
             df = self._parse_table(html_content)
             if df is None or df.empty:
                 return None
@@ -122,23 +238,7 @@ class NepseScraper:
             df.columns = df.columns.str.lower().str.replace(' ', '_').str.replace('.', '').str.replace('%', 'percent')
 
             # Map to standard columns
-            column_mapping = {
-                's_no': None,  # Drop serial number
-                'symbol': 'symbol',
-                'ltp': 'ltp',
-                'change_rs': 'change_rs',
-                'changepercent': 'change_percent',
-                'change': 'change_percent',
-                'high': 'high',
-                'low': 'low',
-                'open': 'open',
-                'qty': 'qty',
-                'turnover': 'turnover',
-                'volume': 'qty'
-            }
-
-            # Rename columns
-            for old_col, new_col in column_mapping.items():
+            for old_col, new_col in spec['columns'].items():
                 if old_col in df.columns:
                     if new_col is None:
                         df = df.drop(columns=[old_col])
@@ -146,314 +246,86 @@ class NepseScraper:
                         df = df.rename(columns={old_col: new_col})
 
             # Convert numeric columns
-            numeric_cols = ['ltp', 'change_percent', 'high', 'low', 'open', 'qty', 'turnover']
-            for col in numeric_cols:
+            for col in spec['numeric']:
                 if col in df.columns:
                     df[col] = pd.to_numeric(df[col].astype(str).str.replace(',', ''), errors='coerce')
 
-            logger.info(f"Scraped {len(df)} top gainers")
+            logger.info(f"Scraped {len(df)} {label}")
             return df
 
         except Exception as e:
-            logger.error(f"Error scraping top gainers: {str(e)}")
+            logger.error(f"Error parsing {label}: {str(e)}")
             return None
 
-    def scrape_top_losers(self):
-        """Scrape top losers from ShareSansar"""
+    def scrape_category(self, category):
+        """Fetch and parse one category (inside the context manager)"""
         try:
-            logger.info("Scraping top losers...")
-            url = self.pages["Losers"]
-
-            html_content = self._fetch_page(url)
+            logger.info(f"Scraping {category.replace('_', ' ')}...")
+            with SCRAPE_SECONDS.labels(category=category, stage='fetch').time():
+                html_content = self._fetch_page(self._url(category))
             if not html_content:
+                SCRAPE_ERRORS.labels(category=category, stage='fetch').inc()
                 return None
-
-            df = self._parse_table(html_content)
-            if df is None or df.empty:
-                return None
-
-            # Normalize column names
-            df.columns = df.columns.str.lower().str.replace(' ', '_').str.replace('.', '').str.replace('%', 'percent')
-
-            # Map to standard columns
-            column_mapping = {
-                's_no': None,
-                'symbol': 'symbol',
-                'ltp': 'ltp',
-                'change_rs': 'change_rs',
-                'changepercent': 'change_percent',
-                'change': 'change_percent',
-                'high': 'high',
-                'low': 'low',
-                'open': 'open',
-                'qty': 'qty',
-                'turnover': 'turnover',
-                'volume': 'qty'
-            }
-
-            for old_col, new_col in column_mapping.items():
-                if old_col in df.columns:
-                    if new_col is None:
-                        df = df.drop(columns=[old_col])
-                    else:
-                        df = df.rename(columns={old_col: new_col})
-
-            numeric_cols = ['ltp', 'change_percent', 'high', 'low', 'open', 'qty', 'turnover']
-            for col in numeric_cols:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col].astype(str).str.replace(',', ''), errors='coerce')
-
-            logger.info(f"Scraped {len(df)} top losers")
-            return df
+            return self.parse_category(category, html_content)
 
         except Exception as e:
-            logger.error(f"Error scraping top losers: {str(e)}")
+            logger.error(f"Error scraping {category.replace('_', ' ')}: {str(e)}")
             return None
 
-    def scrape_top_traded(self):
-        """Scrape top traded shares"""
-        try:
-            logger.info("Scraping top traded...")
-            url = self.pages["Traded"]
+    def iter_pages(self, categories=None):
+        """
+        Fetch category pages one at a time (inside the context manager).
 
-            html_content = self._fetch_page(url)
+        Yields:
+            (category, html_content) pairs; html_content is None if the fetch failed
+        """
+        for category in categories or CATEGORIES:
+            logger.info(f"Fetching {category.replace('_', ' ')}...")
+            try:
+                with SCRAPE_SECONDS.labels(category=category, stage='fetch').time():
+                    html_content = self._fetch_page(self._url(category))
+            except Exception as e:
+                logger.error(f"Error fetching {category.replace('_', ' ')}: {str(e)}")
+                html_content = None
             if not html_content:
-                return None
+                SCRAPE_ERRORS.labels(category=category, stage='fetch').inc()
+            yield category, html_content
 
-            df = self._parse_table(html_content)
-            if df is None or df.empty:
-                return None
-
-            df.columns = df.columns.str.lower().str.replace(' ', '_').str.replace('.', '').str.replace('%', 'percent')
-
-            column_mapping = {
-                's_no': None,
-                'symbol': 'symbol',
-                'qty': 'qty',
-                'volume': 'qty',
-                'shares_traded': 'qty',
-                'ltp': 'ltp',
-                'changepercent': 'change_percent',
-                'change': 'change_percent',
-                'turnover': 'turnover'
-            }
-
-            for old_col, new_col in column_mapping.items():
-                if old_col in df.columns:
-                    if new_col is None:
-                        df = df.drop(columns=[old_col])
-                    else:
-                        df = df.rename(columns={old_col: new_col})
-
-            numeric_cols = ['qty', 'ltp', 'change_percent', 'turnover']
-            for col in numeric_cols:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col].astype(str).str.replace(',', ''), errors='coerce')
+    def scrape_top_gainers(self):
+        """Scrape top gainers from ShareSansar"""
+        return self.scrape_category('top_gainers')
 
-            logger.info(f"Scraped {len(df)} top traded")
-            return df
+    def scrape_top_losers(self):
+        """Scrape top losers from ShareSansar"""
+        return self.scrape_category('top_losers')
 
-        except Exception as e:
-            logger.error(f"Error scraping top traded: {str(e)}")
-            return None
+    def scrape_top_traded(self):
+        """Scrape top traded shares"""
+        return self.scrape_category('top_traded')
 
     def scrape_top_turnovers(self):
         """Scrape top turnovers"""
-        try:
-            logger.info("Scraping top turnovers...")
-            url = self.pages["Turnovers"]
-
-            html_content = self._fetch_page(url)
-            if not html_content:
-                return None
-
-            df = self._parse_table(html_content)
-            if df is None or df.empty:
-                return None
-
-            df.columns = df.columns.str.lower().str.replace(' ', '_').str.replace('.', '').str.replace('%', 'percent')
-
-            column_mapping = {
-                's_no': None,
-                'symbol': 'symbol',
-                'turnover': 'turnover',
-                'ltp': 'ltp',
-                'changepercent': 'change_percent',
-                'change': 'change_percent',
-                'qty': 'qty',
-                'volume': 'qty'
-            }
-
-            for old_col, new_col in column_mapping.items():
-                if old_col in df.columns:
-                    if new_col is None:
-                        df = df.drop(columns=[old_col])
-                    else:
-                        df = df.rename(columns={old_col: new_col})
-
-            numeric_cols = ['turnover', 'ltp', 'change_percent', 'qty']
-            for col in numeric_cols:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col].astype(str).str.replace(',', ''), errors='coerce')
-
-            logger.info(f"Scraped {len(df)} top turnovers")
-            return df
-
-        except Exception as e:
-            logger.error(f"Error scraping top turnovers: {str(e)}")
-            return None
+        return self.scrape_category('top_turnovers')
 
     def scrape_top_transactions(self):
         """Scrape top transactions"""
-        try:
-            logger.info("Scraping top transactions...")
-            url = self.pages["Transactions"]
-
-            html_content = self._fetch_page(url)
-            if not html_content:
-                return None
-
-            df = self._parse_table(html_content)
-            if df is None or df.empty:
-                return None
-
-            df.columns = df.columns.str.lower().str.replace(' ', '_').str.replace('.', '').str.replace('%', 'percent')
-
-            column_mapping = {
-                's_no': None,
-                'symbol': 'symbol',
-                'transactions': 'transactions',
-                'total_transaction': 'transactions',
-                'ltp': 'ltp',
-                'changepercent': 'change_percent',
-                'change': 'change_percent',
-                'qty': 'qty',
-                'volume': 'qty',
-                'turnover': 'turnover'
-            }
-
-            for old_col, new_col in column_mapping.items():
-                if old_col in df.columns:
-                    if new_col is None:
-                        df = df.drop(columns=[old_col])
-                    else:
-                        df = df.rename(columns={old_col: new_col})
-
-            numeric_cols = ['transactions', 'ltp', 'change_percent', 'qty', 'turnover']
-            for col in numeric_cols:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col].astype(str).str.replace(',', ''), errors='coerce')
-
-            logger.info(f"Scraped {len(df)} top transactions")
-            return df
-
-        except Exception as e:
-            logger.error(f"Error scraping top transactions: {str(e)}")
-            return None
+        return self.scrape_category('top_transactions')
 
     def scrape_top_brokers(self):
         """Scrape top brokers"""
-        try:
-            logger.info("Scraping top brokers...")
-            url = self.pages["Brokers"]
-
-            html_content = self._fetch_page(url)
-            if not html_content:
-                return None
-
-            df = self._parse_table(html_content)
-            if df is None or df.empty:
-                return None
-
-            df.columns = df.columns.str.lower().str.replace(' ', '_').str.replace('.', '').str.replace('%', 'percent')
-
-            column_mapping = {
-                's_no': None,
-                'broker_no': 'broker_no',
-                'broker_name': 'broker_name',
-                'buy_contracts': 'buy_contracts',
-                'buy_amount': 'buy_amount',
-                'sell_contracts': 'sell_contracts',
-                'sell_amount': 'sell_amount',
-                'total_amount': 'total_amount'
-            }
-
-            for old_col, new_col in column_mapping.items():
-                if old_col in df.columns:
-                    if new_col is None:
-                        df = df.drop(columns=[old_col])
-                    else:
-                        df = df.rename(columns={old_col: new_col})
-
-            numeric_cols = ['buy_contracts', 'buy_amount', 'sell_contracts', 'sell_amount', 'total_amount']
-            for col in numeric_cols:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col].astype(str).str.replace(',', ''), errors='coerce')
-
-            logger.info(f"Scraped {len(df)} top brokers")
-            return df
-
-        except Exception as e:
-            logger.error(f"Error scraping top brokers: {str(e)}")
-            return None
+        return self.scrape_category('top_brokers')
 
     def scrape_ipo_info(self):
         """Scrape IPO information"""
-        try:
-            logger.info("Scraping IPO info...")
-            url = self.ipo_url
-
-            html_content = self._fetch_page(url)
-            if not html_content:
-                return None
-
-            df = self._parse_table(html_content)
-            if df is None or df.empty:
-                return None
-
-            df.columns = df.columns.str.lower().str.replace(' ', '_').str.replace('.', '').str.replace('%', 'percent')
-
-            column_mapping = {
-                's_no': None,
-                'company_name': 'company_name',
-                'scrip': 'scrip',
-                'opening_date': 'opening_date',
-                'closing_date': 'closing_date',
-                'issue_manager': 'issue_manager',
-                'shares_offered': 'shares_offered',
-                'price_per_share': 'price_per_share',
-                'min_units': 'min_units',
-                'max_units': 'max_units',
-                'status': 'status',
-                'remarks': 'remarks'
-            }
-
-            for old_col, new_col in column_mapping.items():
-                if old_col in df.columns:
-                    if new_col is None:
-                        df = df.drop(columns=[old_col])
-                    else:
-                        df = df.rename(columns={old_col: new_col})
-
-            logger.info(f"Scraped {len(df)} IPO entries")
-            return df
-
-        except Exception as e:
-            logger.error(f"Error scraping IPO info: {str(e)}")
-            return None
+        return self.scrape_category('ipo_info')
 
     def scrape_all(self):
         """Scrape all categories"""
         results = {}
 
         with self:  # Use context manager
-            results['top_gainers'] = self.scrape_top_gainers()
-            results['top_losers'] = self.scrape_top_losers()
-            results['top_traded'] = self.scrape_top_traded()
-            results['top_turnovers'] = self.scrape_top_turnovers()
-            results['top_transactions'] = self.scrape_top_transactions()
-            results['top_brokers'] = self.scrape_top_brokers()
-            results['ipo_info'] = self.scrape_ipo_info()
+            for category in CATEGORIES:
+                results[category] = self.scrape_category(category)
 
         return results
 
@@ -465,8 +337,8 @@ if __name__ == "__main__":
 
     for category, df in results.items():
         if df is not None and not df.empty:
-            print(f"\n{category.UPPER()}:")
+            print(f"\n{category.upper()}:")
             print(df.head())
             print(f"Columns: {df.columns.tolist()}")
         else:
-            print(f"\n{category.UPPER()}: No data")
+            print(f"\n{category.upper()}: No data")
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Production entry point.
+
+Serves the dashboard from a multi-worker WSGI server (gunicorn, or waitress
+on Windows) and runs the scheduler as one separate process, so scraping
+never competes with request handling. Debug mode is always off here.
+
+Usage:
+    python serve.py                 # dashboard + scheduler
+    python serve.py --no-scheduler  # dashboard only (scheduler runs elsewhere)
+"""
+
+import os
+import sys
+import subprocess
+import multiprocessing
+import logging
+from config import Config
+from logging_setup import setup_logging
+
+os.makedirs('logs', exist_ok=True)
+os.makedirs('data', exist_ok=True)
+
+# gunicorn workers are forked from this process and keep logging here
+setup_logging('logs/app.log')
+logger = logging.getLogger(__name__)
+
+
+def worker_count():
+    """Number of WSGI worker processes to run"""
+    if Config.WEB_WORKERS > 0:
+        return Config.WEB_WORKERS
+    return multiprocessing.cpu_count() * 2 + 1
+
+
+def start_scheduler_process():
+    """Launch run_scheduler.py as a child process"""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'run_scheduler.py')
+    process = subprocess.Popen([sys.executable, script])
+    logger.info(f"Scheduler process started (pid {process.pid})")
+    return process
+
+
+def serve_gunicorn():
+    """Serve with gunicorn; each worker imports the app itself (no preload)"""
+    from gunicorn.app.base import BaseApplication
+
+    class DashboardApplication(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from wsgi import server
+            return server
+
+    options = {
+        'bind': f"{Config.DASHBOARD_HOST}:{Config.DASHBOARD_PORT}",
+        'workers': worker_count(),
+        'threads': Config.WEB_THREADS,
+        'worker_class': 'gthread',
+        'timeout': 120,
+        'accesslog': '-',
+    }
+    logger.info(f"Starting gunicorn with {options['workers']} workers x {options['threads']} threads")
+    DashboardApplication(options).run()
+
+
+def serve_waitress():
+    """Serve with waitress (single process, thread pool) where gunicorn is unavailable"""
+    from waitress import serve
+    from wsgi import server
+
+    logger.info(f"Starting waitress with {Config.WEB_THREADS} threads")
+    serve(server, host=Config.DASHBOARD_HOST, port=Config.DASHBOARD_PORT, threads=Config.WEB_THREADS)
+
+
+def main():
+    """Run the production server"""
+    Config.DEBUG_MODE = False
+
+    # Metric files are per process; drop those of processes no longer running
+    from metrics import reset_metrics_dir
+    reset_metrics_dir()
+
+    master_pid = os.getpid()
+    scheduler_process = None
+    if '--no-scheduler' not in sys.argv:
+        scheduler_process = start_scheduler_process()
+
+    logger.info(f"Dashboard will be accessible at: http://localhost:{Config.DASHBOARD_PORT}")
+    try:
+        if os.name == 'nt':
+            serve_waitress()
+        else:
+            serve_gunicorn()
+    except KeyboardInterrupt:
+        logger.info("\nShutting down gracefully...")
+    finally:
+        # gunicorn workers are forked from this process and unwind through
+        # here too; only the master owns the scheduler child
+        if scheduler_process is not None and os.getpid() == master_pid:
+            scheduler_process.terminate()
+            try:
+                scheduler_process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                scheduler_process.kill()
+            logger.info("Scheduler process stopped")
+
+
+if __name__ == "__main__":
+    main()
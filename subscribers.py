@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Alert subscribers: per-user watchlists, thresholds and alert types
+
+Examples:
+    python subscribers.py add me@example.com --watchlist NABIL,NICA --min-change 3
+    python subscribers.py add team@example.com --alerts daily,closure
+    python subscribers.py remove me@example.com
+    python subscribers.py list
+"""
+
+import argparse
+import logging
+import numpy as np
+from config import Config
+from logging_setup import setup_logging
+
+logger = logging.getLogger(__name__)
+
+ALERT_TYPES = ('daily', 'hot', 'danger', 'ipo', 'closure', 'rules')
+
+
+def _parse_list(value, upper=False):
+    """Split a comma-separated string (or iterable) into a frozenset"""
+    if not value:
+        return frozenset()
+    items = value.split(',') if isinstance(value, str) else value
+    items = (item.strip() for item in items)
+    return frozenset(item.upper() if upper else item.lower() for item in items if item)
+
+
+class Subscriber:
+    """One alert recipient and the filters applied to their alerts"""
+
+    def __init__(self, email, name=None, watchlist=None, min_change=None, alert_types=None):
+        self.email = email
+        self.name = name
+        self.watchlist = _parse_list(watchlist, upper=True) or None
+        self.min_change = float(min_change) if min_change else None
+        self.alert_types = _parse_list(alert_types) or frozenset(ALERT_TYPES)
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(row['email'], row.get('name'), row.get('watchlist'),
+                   row.get('min_change'), row.get('alert_types'))
+
+    @property
+    def filter_key(self):
+        """Subscribers with equal keys receive identical alert content"""
+        return (self.watchlist, self.min_change)
+
+    def wants(self, alert_type):
+        return alert_type in self.alert_types
+
+    def filter(self, df, change_column=None):
+        """
+        Keep the rows of a shared alert result that this subscriber cares about.
+
+        Args:
+            df: Alert rows with a 'symbol' column
+            change_column: Column compared against min_change (absolute value)
+
+        Returns:
+            Filtered DataFrame (the input itself if there is nothing to filter)
+        """
+        if df is None or df.empty or self.filter_key == (None, None):
+            return df
+
+        mask = np.ones(len(df), dtype=bool)
+        if self.watchlist and 'symbol' in df.columns:
+            mask &= df['symbol'].isin(self.watchlist).to_numpy()
+        if self.min_change and change_column in df.columns:
+            mask &= (df[change_column].abs() >= self.min_change).to_numpy()
+        return df[mask]
+
+
+def load_subscribers(db):
+    """
+    Active subscribers, falling back to Config.EMAIL_TO (all alerts, no
+    filters) when the subscribers table is empty.
+    """
+    subscribers = [Subscriber.from_row(row) for row in db.get_subscribers()]
+    if not subscribers and Config.EMAIL_TO:
+        subscribers = [Subscriber(Config.EMAIL_TO)]
+    return subscribers
+
+
+def main():
+    from database import get_database
+
+    setup_logging(fmt='%(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    add = commands.add_parser('add', help='Add or update a subscriber')
+    add.add_argument('email')
+    add.add_argument('--name')
+    add.add_argument('--watchlist', help='Comma-separated symbols (default: all)')
+    add.add_argument('--min-change', type=float, help='Minimum absolute change %% to include a stock')
+    add.add_argument('--alerts', help=f"Comma-separated alert types from {','.join(ALERT_TYPES)} (default: all)")
+
+    remove = commands.add_parser('remove', help='Deactivate a subscriber')
+    remove.add_argument('email')
+
+    commands.add_parser('list', help='List active subscribers')
+    args = parser.parse_args()
+
+    db = get_database()
+
+    if args.command == 'add':
+        unknown = _parse_list(args.alerts) - set(ALERT_TYPES)
+        if unknown:
+            parser.error(f"unknown alert types: {', '.join(sorted(unknown))}")
+        watchlist = ','.join(sorted(_parse_list(args.watchlist, upper=True))) or None
+        alert_types = ','.join(sorted(_parse_list(args.alerts))) or None
+        db.add_subscriber(args.email, args.name, watchlist, args.min_change, alert_types)
+
+    elif args.command == 'remove':
+        if not db.deactivate_subscriber(args.email):
+            parser.error(f"no subscriber {args.email}")
+        logger.info(f"Subscriber deactivated: {args.email}")
+
+    else:
+        for row in db.get_subscribers():
+            print(f"{row['email']:<35} watchlist={row['watchlist'] or 'all'} "
+                  f"min_change={row['min_change'] or '-'} alerts={row['alert_types'] or 'all'}")
+
+
+if __name__ == "__main__":
+    main()
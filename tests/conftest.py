@@ -0,0 +1,41 @@
+"""
+Shared fixtures: a throwaway database and EmailAlerts pointed at an
+in-process SMTP stand-in (local_smtp.py)
+"""
+
+import os
+import tempfile
+
+# Metric files go to a scratch directory, not the project's data/metrics;
+# this must happen before metrics.py is first imported
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', tempfile.mkdtemp(prefix='nepse-metrics-'))
+
+import pytest
+from database import NepseDatabase
+from email_alerts import EmailAlerts
+from local_smtp import LocalSMTPServer
+
+
+@pytest.fixture
+def db(tmp_path):
+    return NepseDatabase(str(tmp_path / 'nepse_test.db'))
+
+
+@pytest.fixture
+def smtp_server():
+    with LocalSMTPServer() as server:
+        yield server
+
+
+@pytest.fixture
+def make_alerts(db):
+    """EmailAlerts for the test database, delivering to the given LocalSMTPServer"""
+    def make(server):
+        return EmailAlerts(db=db, smtp_host=server.host, smtp_port=server.port, use_ssl=False,
+                           starttls=False, email_from='alerts@localhost', email_password='test')
+    return make
+
+
+@pytest.fixture
+def alerts(make_alerts, smtp_server):
+    return make_alerts(smtp_server)
@@ -0,0 +1,90 @@
+"""Outbox delivery end to end against the local SMTP stand-in"""
+
+import sqlite3
+from datetime import datetime, timedelta
+from email import message_from_bytes, policy
+import pandas as pd
+from config import Config
+from local_smtp import LocalSMTPServer
+
+
+def _messages(n):
+    return [(f"user{i}@localhost", f"Alert {i}", f"<p>Alert {i}</p>", f"Alert {i}") for i in range(n)]
+
+
+def _subjects(server):
+    return sorted(message_from_bytes(message.data, policy=policy.default)['Subject'] for message in server.messages)
+
+
+def test_delivers_queued_messages(alerts, smtp_server, db):
+    assert alerts.outbox.enqueue_many(_messages(3)) == 3
+
+    alerts.outbox.deliver_pending()
+
+    assert _subjects(smtp_server) == ['Alert 0', 'Alert 1', 'Alert 2']
+    assert sorted(message.rcpt_tos[0] for message in smtp_server.messages) == [
+        'user0@localhost', 'user1@localhost', 'user2@localhost']
+    assert smtp_server.messages[0].username == 'alerts@localhost'
+    assert db.get_outbox_status() == {'sent': 3}
+
+
+def test_rejected_message_is_retried(make_alerts, db, monkeypatch):
+    # Retry as soon as the next pass runs
+    monkeypatch.setattr(Config, 'EMAIL_RETRY_BASE_SECONDS', 0)
+
+    with LocalSMTPServer(fail_first=1) as server:
+        alerts = make_alerts(server)
+        alerts.outbox.enqueue('user@localhost', 'Retry me', '<p>Retry me</p>')
+
+        alerts.outbox.deliver_pending()
+        assert server.rejected == 1
+        assert server.messages == []
+        assert db.get_outbox_status() == {'pending': 1}
+
+        alerts.outbox.deliver_pending()
+        assert _subjects(server) == ['Retry me']
+
+    assert db.get_outbox_status() == {'sent': 1}
+    conn = sqlite3.connect(db.db_path)
+    attempts = conn.execute("SELECT attempt, status FROM email_delivery_log ORDER BY attempt").fetchall()
+    conn.close()
+    assert [attempt for attempt, _ in attempts] == [1, 2]
+
+
+def test_one_connection_per_delivery_pass(alerts, smtp_server, db):
+    # More than one page (deliver_pending's limit) of due messages
+    alerts.outbox.enqueue_many(_messages(120))
+
+    alerts.outbox.deliver_pending(limit=50)
+
+    assert len(smtp_server.messages) == 120
+    assert smtp_server.connections == 1
+    assert db.get_outbox_status() == {'sent': 120}
+
+
+def test_ipo_alert_reads_date_scraped(alerts, smtp_server, db):
+    ipos = pd.DataFrame({
+        'company_name': ['Alpha Hydropower Limited', 'Beta Microfinance Limited'],
+        'opening_date': ['2024-01-10', '2024-01-12'],
+        'closing_date': ['2024-01-14', '2024-01-16'],
+        'status': ['Open', 'Upcoming'],
+    })
+    today = datetime.now().strftime('%Y-%m-%d')
+    db.insert_data('ipo_info', ipos, today)
+
+    stored = db.get_data('ipo_info', days=30)
+    assert len(stored) == 2
+    assert set(stored['date_scraped']) == {today}
+
+    db.add_subscriber('investor@localhost')
+    assert alerts.send_ipo_alert()
+    alerts.outbox.deliver_pending()
+    assert _subjects(smtp_server) == ['🎯 IPO Alert - 2 Current Issues']
+
+
+def test_cleanup_removes_old_ipo_rows(db):
+    old = (datetime.now() - timedelta(days=Config.DATA_RETENTION_DAYS + 1)).strftime('%Y-%m-%d')
+    db.insert_data('ipo_info', pd.DataFrame({'company_name': ['Old Issue Limited']}), old)
+
+    assert db.cleanup_old_data() >= 1
+    assert db.get_data('ipo_info').empty
@@ -0,0 +1,168 @@
+"""
+Trading calendar: which days the market is open
+
+A day is a trading day unless it is a weekly off day (MARKET_OFF_DAYS), is
+listed in the holiday file (HOLIDAYS_FILE) or Config.MARKET_HOLIDAYS, or is
+a learned closure: a day the scraper found the market closed because the
+data was identical to the previous session.
+
+Holiday file format, one date per line with an optional description:
+
+    # 2024
+    2024-10-10  Dashain (Fulpati)
+    2024-10-11  Dashain (Maha Ashtami)
+"""
+
+import logging
+import os
+import time
+from datetime import date, datetime, timedelta
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+WEEKDAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+
+# Give up looking for a trading day after a year of closures
+_MAX_SEARCH_DAYS = 366
+
+
+def _as_date(day):
+    """Accept a date, datetime, 'YYYY-MM-DD' string or None (today)"""
+    if day is None:
+        return date.today()
+    if isinstance(day, datetime):
+        return day.date()
+    if isinstance(day, date):
+        return day
+    return datetime.strptime(str(day)[:10], '%Y-%m-%d').date()
+
+
+def parse_off_days(value):
+    """'fri,sat' -> {4, 5} (date.weekday() numbers)"""
+    days = set()
+    for name in value.split(','):
+        name = name.strip().lower()[:3]
+        if not name:
+            continue
+        if name not in WEEKDAYS:
+            raise ValueError(f"Unknown weekday in MARKET_OFF_DAYS: {name}")
+        days.add(WEEKDAYS.index(name))
+    return frozenset(days)
+
+
+def read_holiday_file(path):
+    """
+    Read a holiday file.
+
+    Returns:
+        Dict of YYYY-MM-DD -> description
+    """
+    holidays = {}
+    if not path or not os.path.exists(path):
+        return holidays
+
+    with open(path, encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            day, _, description = line.partition(' ')
+            try:
+                holidays[_as_date(day).strftime('%Y-%m-%d')] = description.strip() or 'holiday'
+            except ValueError:
+                logger.warning(f"{path}:{number}: not a YYYY-MM-DD date: {day}")
+    return holidays
+
+
+class TradingCalendar:
+    """
+    Trading days from weekly off days, the holiday file and learned closures.
+
+    The holiday file and learned closures are re-read when older than
+    `max_age` seconds, so long-running processes pick up edits and new
+    closures without a restart.
+
+    Args:
+        db: NepseDatabase to learn closures from (optional)
+        holidays_file: Path of the holiday file (Config.HOLIDAYS_FILE)
+        off_days: Comma-separated weekly off days (Config.MARKET_OFF_DAYS)
+        max_age: Seconds before holidays are re-read
+    """
+
+    def __init__(self, db=None, holidays_file=None, off_days=None, max_age=3600):
+        self.db = db
+        self.holidays_file = holidays_file or Config.HOLIDAYS_FILE
+        self.off_days = parse_off_days(off_days or Config.MARKET_OFF_DAYS)
+        self.max_age = max_age
+        self.holidays = {}
+        self._loaded_at = None
+
+    def reload(self):
+        """Re-read configured holidays, the holiday file and learned closures"""
+        holidays = {day: 'holiday' for day in Config.MARKET_HOLIDAYS}
+        holidays.update(read_holiday_file(self.holidays_file))
+        if self.db is not None:
+            for day in self.db.get_learned_closures():
+                holidays.setdefault(day, 'market closed (detected)')
+        self.holidays = holidays
+        self._loaded_at = time.monotonic()
+
+    def _fresh(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.max_age:
+            self.reload()
+        return self.holidays
+
+    def closure_reason(self, day=None):
+        """Why the market is closed on `day`, or None if it is a trading day"""
+        day = _as_date(day)
+        if day.weekday() in self.off_days:
+            return day.strftime('%A')
+        return self._fresh().get(day.strftime('%Y-%m-%d'))
+
+    def is_trading_day(self, day=None):
+        return self.closure_reason(day) is None
+
+    def next_trading_day(self, day=None):
+        """First trading day after `day` (default: today)"""
+        return self._step(_as_date(day), 1)
+
+    def previous_trading_day(self, day=None):
+        """Last trading day before `day` (default: today)"""
+        return self._step(_as_date(day), -1)
+
+    def _step(self, day, direction):
+        for _ in range(_MAX_SEARCH_DAYS):
+            day += timedelta(days=direction)
+            if self.is_trading_day(day):
+                return day
+        raise ValueError(f"No trading day within {_MAX_SEARCH_DAYS} days of {day}")
+
+    def trading_days(self, start, end=None):
+        """Trading days from start to end (default: today), inclusive, as YYYY-MM-DD strings"""
+        day, end = _as_date(start), _as_date(end)
+        days = []
+        while day <= end:
+            if self.is_trading_day(day):
+                days.append(day.strftime('%Y-%m-%d'))
+            day += timedelta(days=1)
+        return days
+
+    def window_start(self, trading_days, end=None):
+        """
+        First day of the window holding the last `trading_days` trading days
+        up to `end` (default: today), inclusive.
+
+        Returns:
+            YYYY-MM-DD string
+        """
+        day = _as_date(end)
+        if not self.is_trading_day(day):
+            day = self.previous_trading_day(day)
+        for _ in range(max(trading_days, 1) - 1):
+            day = self.previous_trading_day(day)
+        return day.strftime('%Y-%m-%d')
+
+    def cron_day_of_week(self):
+        """The weekly trading days as an APScheduler/cron day_of_week field"""
+        return ','.join(name for number, name in enumerate(WEEKDAYS) if number not in self.off_days)
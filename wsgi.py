@@ -0,0 +1,19 @@
+"""
+WSGI entry point for production servers
+
+    gunicorn --workers 4 --bind 0.0.0.0:8050 --capture-output --error-logfile logs/app.log wsgi:server
+
+Run this way, every worker imports this module itself and logs to stderr,
+which gunicorn collects. `python serve.py` instead writes logs/app.log from
+its master process, with rotation.
+"""
+
+from logging_setup import setup_logging
+
+# No-op under serve.py, whose gunicorn workers inherit its logging. Under a
+# bare WSGI server each worker would otherwise rotate logs/app.log on its own
+setup_logging()
+
+from dashboard import app
+
+server = app.server